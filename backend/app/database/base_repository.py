@@ -0,0 +1,251 @@
+# backend/app/database/base_repository.py
+"""
+Interfaz común de los repositorios de modelos.
+
+La ruta de predicción, la cola de entrenamiento y el almacén compartido solo
+usan las operaciones de BaseModelRepository. Las implementaciones guardan
+modelos, caché de predicciones y estadísticas de uso en:
+
+- PostgreSQL (model_repository.ModelRepository, asyncpg), y
+- SQLite embebido (sqlite_repository.SQLiteModelRepository) para nodos únicos.
+
+Aquí quedan lo que no depende del almacenamiento: registros, celdas, distancia
+y ranking de candidatos. create_model_repository elige la implementación por
+el esquema de DATABASE_URL.
+"""
+import logging
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, fields
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.database import geocell
+from app.services.metrics import DB_QUERY_SECONDS, DB_SLOW_QUERIES
+
+logger = logging.getLogger(__name__)
+
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "100"))
+# Nivel de celda con el que se comparte el caché de predicciones entre puntos
+# cercanos (14 ≈ 1.2 km x 2.4 km en el ecuador; 24 = prácticamente el mismo punto)
+PREDICTION_CACHE_CELL_LEVEL = int(os.getenv("PREDICTION_CACHE_CELL_LEVEL", "14"))
+# Vigencia del caché de predicciones (también es el max-age de /predict)
+PREDICTION_CACHE_TTL_S = int(os.getenv("PREDICTION_CACHE_TTL_S", "21600"))
+# Asignación materializada de modelos por celda: se calcula desde el centro de
+# la celda con el mismo radio y número de modelos que usa la predicción
+MODEL_ASSIGNMENT_CELL_LEVEL = int(os.getenv("MODEL_ASSIGNMENT_CELL_LEVEL", "14"))
+ASSIGNMENT_MAX_DISTANCE_KM = 100
+ASSIGNMENT_MAX_MODELS = 3
+
+@dataclass(slots=True)
+class ModelRecord:
+    """Candidato de la búsqueda de modelos (sin blob: se carga por id con load_model)"""
+    id: int
+    variable_name: str
+    latitude: float
+    longitude: float
+    accuracy_score: float
+
+@dataclass
+class ModelAssignment:
+    model_id: int
+    # Ubicación del modelo: la distancia se mide desde el punto de cada consulta
+    latitude: float
+    longitude: float
+    accuracy_score: float
+
+MODEL_RECORD_FIELDS = [f.name for f in fields(ModelRecord)]
+
+class _QueryTimer:
+    """Mide una consulta: histograma por consulta y log + contador si es lenta"""
+    __slots__ = ("query", "slow_query_ms", "start")
+
+    def __init__(self, query: str, slow_query_ms: float):
+        self.query = query
+        self.slow_query_ms = slow_query_ms
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        DB_QUERY_SECONDS.observe(elapsed, query=self.query)
+        if elapsed * 1000 >= self.slow_query_ms:
+            DB_SLOW_QUERIES.inc(query=self.query)
+            logger.warning(f"Consulta lenta '{self.query}': {elapsed * 1000:.1f} ms")
+        return False
+
+    # También usable dentro de un `async with` junto a la conexión
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+class BaseModelRepository(ABC):
+    """Operaciones de almacenamiento de modelos, caché de predicciones y uso"""
+
+    def __init__(self, database_url: str,
+                 slow_query_ms: float = DB_SLOW_QUERY_MS,
+                 cache_cell_level: int = PREDICTION_CACHE_CELL_LEVEL,
+                 assignment_cell_level: int = MODEL_ASSIGNMENT_CELL_LEVEL):
+        self.database_url = database_url
+        self.slow_query_ms = slow_query_ms
+        self.cache_cell_level = cache_cell_level
+        self.assignment_cell_level = assignment_cell_level
+
+    def _timed(self, query: str) -> _QueryTimer:
+        return _QueryTimer(query, self.slow_query_ms)
+    
+    def calculate_geo_hash(self, lat: float, lon: float) -> str:
+        """Calcular hash geográfico para agrupar modelos por región"""
+        return f"{round(lat, 1)},{round(lon, 1)}"
+    
+    def calculate_geo_cell(self, lat: float, lon: float) -> int:
+        """Celda geográfica entera (nivel máximo) para búsquedas por rango"""
+        return geocell.encode(lat, lon)
+    
+    def cache_cell(self, lat: float, lon: float) -> int:
+        """Celda con la que se comparten entradas del caché de predicciones"""
+        return geocell.truncate(geocell.encode(lat, lon), self.cache_cell_level)
+    
+    def assignment_cell(self, lat: float, lon: float) -> int:
+        """Celda de la tabla model_assignments que contiene el punto"""
+        return geocell.truncate(geocell.encode(lat, lon), self.assignment_cell_level)
+    
+    def calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+        """Calcular distancia usando fórmula de Haversine"""
+        lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+        dlat = lat2 - lat1
+        dlon = lon2 - lon1
+        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+        c = 2 * math.asin(math.sqrt(a))
+        return 6371 * c  # Radio de la Tierra en km
+    
+    def build_assignments(self, cell: int,
+                          best_models: Dict[str, List[ModelRecord]]) -> Dict[str, List[ModelAssignment]]:
+        """Convertir el ranking calculado desde el centro de la celda en asignaciones"""
+        return {
+            variable: [
+                ModelAssignment(record.id, record.latitude, record.longitude, record.accuracy_score)
+                for record in records
+            ]
+            for variable, records in best_models.items()
+        }
+
+    def assignment_center(self, cell: int):
+        level = self.assignment_cell_level
+        return geocell.decode(geocell.parent(cell, level), level)
+
+    def rank_candidates(self,
+                        latitude: float,
+                        longitude: float,
+                        rows,
+                        max_distance_km: float,
+                        max_models: int) -> List[ModelRecord]:
+        """Filtrar candidatos por distancia y ordenar por precisión + proximidad"""
+        model_candidates = []
+        for row in rows:
+            distance = self.calculate_distance(
+                latitude, longitude, 
+                float(row['latitude']), float(row['longitude'])
+            )
+            
+            if distance <= max_distance_km:
+                # Score combinado: precisión (70%) + proximidad (30%)
+                distance_score = max(0, 1 - (distance / max_distance_km))
+                combined_score = (0.7 * float(row['accuracy_score'])) + (0.3 * distance_score)
+                
+                model_candidates.append({
+                    'record': self._record_from_row(row),
+                    'distance': distance,
+                    'combined_score': combined_score
+                })
+        
+        # Ordenar por score combinado y tomar los mejores
+        model_candidates.sort(key=lambda x: x['combined_score'], reverse=True)
+        return [
+            candidate['record'] 
+            for candidate in model_candidates[:max_models]
+        ]
+    
+    def _record_from_row(self, row) -> ModelRecord:
+        """Construir ModelRecord ignorando columnas que no forman parte del registro"""
+        return ModelRecord(*(row[name] for name in MODEL_RECORD_FIELDS))
+    
+    def deserialize_model(self, model_data: bytes):
+        """Deserializar un modelo guardado con save_model (EWFM o joblib)"""
+        from app.ml.model_format import deserialize_model
+        return deserialize_model(model_data)
+    
+    # --- operaciones de cada implementación ---
+
+    @abstractmethod
+    async def connect(self): ...
+
+    @abstractmethod
+    async def disconnect(self): ...
+
+    @abstractmethod
+    async def check_pool(self, timeout: float = 1.0) -> bool:
+        """Disponibilidad del almacenamiento sin ejecutar consultas costosas"""
+
+    @abstractmethod
+    async def save_model(self, latitude: float, longitude: float, variable_name: str,
+                         model, metadata: dict) -> int: ...
+
+    @abstractmethod
+    async def find_best_models(self, latitude: float, longitude: float, variable_names: List[str],
+                               max_distance_km: float = 100,
+                               max_models: int = 3) -> Dict[str, List[ModelRecord]]: ...
+
+    @abstractmethod
+    async def get_model_assignments(self, latitude: float, longitude: float,
+                                    variable_names: List[str]) -> Dict[str, List[ModelAssignment]]: ...
+
+    @abstractmethod
+    async def deactivate_model(self, model_id: int) -> bool: ...
+
+    @abstractmethod
+    async def load_model(self, model_id: int): ...
+
+    @abstractmethod
+    async def get_active_models_fingerprint(self) -> str: ...
+
+    @abstractmethod
+    def iter_active_model_blobs(self, batch_size: int = 20) -> AsyncIterator[Tuple[int, bytes]]: ...
+
+    @abstractmethod
+    async def get_most_used_model_ids(self, limit: int) -> List[int]: ...
+
+    @abstractmethod
+    async def cache_prediction(self, latitude: float, longitude: float, prediction_date: str,
+                               predictions: dict, model_versions: dict): ...
+
+    @abstractmethod
+    async def get_cached_prediction(self, latitude: float, longitude: float,
+                                    prediction_date: str) -> Optional[dict]:
+        """{'predictions', 'model_versions'} de la entrada vigente, o None"""
+
+    @abstractmethod
+    async def update_model_usage(self, model_id: int, response_time_ms: float, success: bool): ...
+
+    @abstractmethod
+    async def get_model_stats(self, days: int = 30) -> Dict[str, Any]: ...
+
+
+def create_model_repository(database_url: str, **kwargs) -> BaseModelRepository:
+    """
+    Repositorio según el esquema de DATABASE_URL
+
+        postgresql://... / postgres://...   ModelRepository (asyncpg)
+        sqlite:///ruta/modelos.db           SQLiteModelRepository (archivo local)
+    """
+    if database_url.startswith("sqlite:"):
+        from app.database.sqlite_repository import SQLiteModelRepository
+        return SQLiteModelRepository(database_url, **kwargs)
+
+    from app.database.model_repository import ModelRepository
+    return ModelRepository(database_url, **kwargs)
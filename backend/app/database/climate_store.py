@@ -0,0 +1,292 @@
+# backend/app/database/climate_store.py
+"""
+Almacén local de observaciones mensuales de NASA POWER.
+
+Las series se guardan por (celda, parámetro, periodo YYYYMM; el mes 13 es el
+promedio anual) en `climate_observations`, y `climate_sync` registra qué
+(celda, parámetro, año) ya se descargó. Una consulta lee primero de la base y
+solo pide a POWER los años que faltan (una llamada por hueco), cargándolos con
+COPY; si POWER no responde se sirve lo que haya en local, con una url
+partial:// para que no se cachee como serie completa.
+
+Todos los puntos de una celda de nivel CLIMATE_CELL_LEVEL (~0.35° x 0.7°, del
+orden de la resolución de MERRA-2 en POWER) comparten la serie del centro.
+
+Sincronización por lotes de una región:
+    python -m app.database.climate_store --lat-min 16 --lat-max 19.5 \\
+        --lon-min -99.5 --lon-max -96 --step 0.5 --start 2001 --end 2024
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.database import geocell
+from app.services.upstream import BULK, INTERACTIVE, PARTIAL_URL_PREFIX
+
+logger = logging.getLogger(__name__)
+
+CLIMATE_CELL_LEVEL = int(os.getenv("CLIMATE_CELL_LEVEL", "9"))
+# Años recientes (el actual y el anterior) se vuelven a pedir tras este intervalo,
+# porque POWER publica los meses con retraso
+CLIMATE_RECENT_REFRESH_S = float(os.getenv("CLIMATE_RECENT_REFRESH_S", "86400"))
+# Años completos por llamada a POWER al sincronizar
+CLIMATE_SYNC_MAX_YEARS = int(os.getenv("CLIMATE_SYNC_MAX_YEARS", "30"))
+
+MISSING_VALUE = -999.0
+LOCAL_URL = "local://climate_observations"
+PARTIAL_URL = f"{PARTIAL_URL_PREFIX}climate_observations"
+
+OBSERVATION_COLUMNS = ('geo_cell', 'parameter', 'period', 'value')
+
+
+class ClimateObservationStore:
+    """Observaciones POWER en PostgreSQL con relleno incremental desde la API"""
+
+    def __init__(self, model_repo, cell_level: int = CLIMATE_CELL_LEVEL,
+                 recent_refresh_s: float = CLIMATE_RECENT_REFRESH_S):
+        # Comparte pool y métricas de consultas con el repositorio de modelos
+        self.repo = model_repo
+        self.cell_level = cell_level
+        self.recent_refresh_s = recent_refresh_s
+        self._fills: Dict[tuple, asyncio.Task] = {}
+
+    def cell(self, lat: float, lon: float) -> int:
+        """Id (de MAX_LEVEL) de la celda de observaciones que contiene el punto"""
+        return geocell.truncate(geocell.encode(lat, lon), self.cell_level)
+
+    def cell_center(self, cell: int) -> Tuple[float, float]:
+        return geocell.decode(geocell.parent(cell, self.cell_level), self.cell_level)
+
+    async def fetch(self, params: dict, priority: int = INTERACTIVE):
+        """
+        Misma interfaz que nasapower._request_power: (status, json POWER, url)
+
+        Solo va a POWER por los años que faltan; si falla y hay datos locales
+        se responden los locales con PARTIAL_URL (la serie puede tener huecos).
+        """
+        cell = self.cell(float(params["latitude"]), float(params["longitude"]))
+        parameters = params["parameters"].split(",")
+        start, end = int(params["start"]), int(params["end"])
+
+        upstream_status, upstream_url = None, None
+        gaps = await self.missing_years(cell, parameters, start, end)
+        if gaps:
+            upstream_status, upstream_url = await self._fill(cell, parameters, gaps, params, priority)
+
+        series, sources = await self.read(cell, parameters, start, end)
+        upstream_failed = upstream_status not in (None, 200)
+        if not any(series.values()) and upstream_failed:
+            return upstream_status, None, upstream_url
+        return 200, {
+            "header": {"sources": sources},
+            "properties": {"parameter": series}
+        }, PARTIAL_URL if upstream_failed else LOCAL_URL
+
+    async def missing_years(self, cell: int, parameters: List[str],
+                            start: int, end: int) -> List[Tuple[int, int]]:
+        """Rangos de años (inclusivos) sin descargar o con datos recientes vencidos"""
+        current_year = datetime.now().year
+        end = min(end, current_year)  # POWER no tiene datos futuros
+        if start > end:
+            return []
+
+        async with self.repo._acquire() as conn, self.repo._timed('climate_sync_state'):
+            # El vencimiento se evalúa con el reloj de la base, el mismo que escribió fetched_at
+            rows = await conn.fetch(
+                """
+                SELECT parameter, year
+                FROM climate_sync
+                WHERE geo_cell = $1 AND parameter = ANY($2::text[]) AND year BETWEEN $3 AND $4
+                  AND (year < $5 OR fetched_at >= CURRENT_TIMESTAMP - make_interval(secs => $6))
+                """,
+                cell, parameters, start, end, current_year - 1, self.recent_refresh_s
+            )
+
+        synced = {(row['parameter'], row['year']) for row in rows}
+        years = [
+            year for year in range(start, end + 1)
+            if any((parameter, year) not in synced for parameter in parameters)
+        ]
+
+        ranges = []
+        for year in years:
+            if ranges and year == ranges[-1][1] + 1 and year - ranges[-1][0] < CLIMATE_SYNC_MAX_YEARS:
+                ranges[-1] = (ranges[-1][0], year)
+            else:
+                ranges.append((year, year))
+        return ranges
+
+    async def _fill(self, cell: int, parameters: List[str], gaps: List[Tuple[int, int]],
+                    params: dict, priority: int = INTERACTIVE) -> Tuple[int, Optional[str]]:
+        """
+        Descargar los huecos; peticiones concurrentes del mismo hueco comparten
+        la descarga. Una petición interactiva no espera una descarga BULK (timeout
+        y reintentos largos): solo comparte las interactivas; una BULK usa cualquiera.
+        """
+        base = (cell, tuple(parameters), tuple(gaps))
+        key = base + (priority,)
+        task = self._fills.get(base + (INTERACTIVE,))
+        if task is None and priority == BULK:
+            task = self._fills.get(key)
+        if task is None:
+            task = asyncio.create_task(self._download(cell, parameters, gaps, params, priority))
+            self._fills[key] = task
+            task.add_done_callback(lambda _: self._fills.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _download(self, cell: int, parameters: List[str], gaps: List[Tuple[int, int]],
+                        params: dict, priority: int) -> Tuple[int, Optional[str]]:
+        from app.services.nasapower import _request_power
+
+        center_lat, center_lon = self.cell_center(cell)
+        status, url = 200, None
+        for start, end in gaps:
+            status, data, url = await _request_power({
+                **params,
+                "latitude": round(center_lat, 4),
+                "longitude": round(center_lon, 4),
+                "start": start,
+                "end": end,
+                "parameters": ",".join(parameters)
+            }, priority)
+            if status != 200:
+                logger.warning(f"POWER devolvió {status} para la celda {cell} ({start}-{end}); se sirve lo local")
+                return status, url
+            await self.store(cell, parameters, start, end, data)
+        return status, url
+
+    async def store(self, cell: int, parameters: List[str], start: int, end: int, data: dict):
+        """Cargar una respuesta POWER con COPY y marcar los años como sincronizados"""
+        series = data.get("properties", {}).get("parameter", {})
+        sources = data.get("header", {}).get("sources", [])
+        records = [
+            (cell, parameter, int(period), None if value == MISSING_VALUE else float(value))
+            for parameter in parameters
+            for period, value in series.get(parameter, {}).items()
+        ]
+
+        async with self.repo._acquire() as conn, self.repo._timed('climate_store'):
+            async with conn.transaction():
+                await conn.execute(
+                    """
+                    CREATE TEMP TABLE climate_observations_load
+                    (LIKE climate_observations INCLUDING DEFAULTS) ON COMMIT DROP
+                    """
+                )
+                await conn.copy_records_to_table(
+                    'climate_observations_load', records=records, columns=OBSERVATION_COLUMNS
+                )
+                await conn.execute(
+                    """
+                    INSERT INTO climate_observations (geo_cell, parameter, period, value)
+                    SELECT geo_cell, parameter, period, value FROM climate_observations_load
+                    ON CONFLICT (geo_cell, parameter, period) DO UPDATE SET value = EXCLUDED.value
+                    """
+                )
+                await conn.executemany(
+                    """
+                    INSERT INTO climate_sync (geo_cell, parameter, year, sources, fetched_at)
+                    VALUES ($1, $2, $3, $4, CURRENT_TIMESTAMP)
+                    ON CONFLICT (geo_cell, parameter, year)
+                    DO UPDATE SET sources = EXCLUDED.sources, fetched_at = EXCLUDED.fetched_at
+                    """,
+                    [(cell, parameter, year, sources)
+                     for parameter in parameters for year in range(start, end + 1)]
+                )
+
+    async def read(self, cell: int, parameters: List[str],
+                   start: int, end: int) -> Tuple[Dict[str, Dict[str, float]], List[str]]:
+        """Series {parámetro: {YYYYMM: valor}} con el formato de POWER (-999 = sin dato)"""
+        async with self.repo._acquire() as conn, self.repo._timed('climate_observations'):
+            rows = await conn.fetch(
+                """
+                SELECT parameter, period, value
+                FROM climate_observations
+                WHERE geo_cell = $1 AND parameter = ANY($2::text[])
+                  AND period BETWEEN $3 AND $4
+                ORDER BY parameter, period
+                """,
+                cell, parameters, start * 100 + 1, end * 100 + 13
+            )
+            source_rows = await conn.fetch(
+                """
+                SELECT DISTINCT unnest(sources) AS source
+                FROM climate_sync
+                WHERE geo_cell = $1 AND parameter = ANY($2::text[]) AND year BETWEEN $3 AND $4
+                """,
+                cell, parameters, start, end
+            )
+
+        series = {parameter: {} for parameter in parameters}
+        for row in rows:
+            value = row['value']
+            series[row['parameter']][str(row['period'])] = MISSING_VALUE if value is None else value
+        return series, sorted(row['source'] for row in source_rows)
+
+    async def sync_region(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+                          step: float, parameters: List[str], start: int, end: int,
+                          community: str = "RE", concurrency: int = 4) -> int:
+        """Sincronizar las celdas que cubren una región; devuelve cuántas tenían huecos"""
+        cells = set()
+        lat = lat_min
+        while lat <= lat_max + 1e-9:
+            lon = lon_min
+            while lon <= lon_max + 1e-9:
+                cells.add(self.cell(lat, lon))
+                lon += step
+            lat += step
+
+        semaphore = asyncio.Semaphore(concurrency)
+        params = {"community": community, "format": "JSON"}
+
+        async def sync_cell(cell: int) -> bool:
+            async with semaphore:
+                gaps = await self.missing_years(cell, parameters, start, end)
+                if gaps:
+                    await self._fill(cell, parameters, gaps, params, BULK)
+                return bool(gaps)
+
+        results = await asyncio.gather(*(sync_cell(cell) for cell in sorted(cells)))
+        return sum(results)
+
+
+# Parámetros de todos los endpoints /climate* (una sola descarga los cubre)
+SYNC_PARAMETERS = [
+    "PRECTOTCORR", "T2M", "T2M_MAX", "T2M_MIN", "RH2M", "WS2M", "WS10M", "WS50M",
+    "WD2M", "WD10M", "WD50M", "PS", "CLOUD_AMT", "ALLSKY_SFC_SW_DWN", "ALLSKY_SFC_LW_DWN"
+]
+
+
+async def _main(args):
+    from app.database.model_repository import ModelRepository
+
+    model_repo = ModelRepository(args.database_url)
+    await model_repo.connect()
+    try:
+        store = ClimateObservationStore(model_repo)
+        synced = await store.sync_region(
+            args.lat_min, args.lat_max, args.lon_min, args.lon_max, args.step,
+            args.parameters.split(","), args.start, args.end, concurrency=args.concurrency
+        )
+        logger.info(f"Celdas sincronizadas: {synced}")
+    finally:
+        await model_repo.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sincronizar observaciones NASA POWER a la base de datos")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--lat-min", type=float, required=True)
+    parser.add_argument("--lat-max", type=float, required=True)
+    parser.add_argument("--lon-min", type=float, required=True)
+    parser.add_argument("--lon-max", type=float, required=True)
+    parser.add_argument("--step", type=float, default=0.5)
+    parser.add_argument("--start", type=int, default=2001)
+    parser.add_argument("--end", type=int, default=datetime.now().year)
+    parser.add_argument("--parameters", default=",".join(SYNC_PARAMETERS))
+    parser.add_argument("--concurrency", type=int, default=4)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
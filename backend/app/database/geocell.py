@@ -0,0 +1,133 @@
+# backend/app/database/geocell.py
+"""
+Celdas geográficas jerárquicas codificadas como enteros.
+
+La Tierra se divide en una malla de 2^L x 2^L celdas por nivel L (longitud en
+[-180, 180), latitud en [-90, 90]). El id de una celda es el entrelazado de
+bits (orden Morton / quadkey) de su columna x y su fila y, así que:
+
+- el id de nivel L es un prefijo del de nivel L+1 (cell >> 2 sube un nivel);
+- todas las celdas de MAX_LEVEL dentro de una celda de nivel L forman un
+  rango contiguo de ids, consultable con un índice B-tree normal.
+
+En la base de datos se guarda siempre el id de MAX_LEVEL (48 bits, cabe en
+BIGINT; ~2 m por celda). Buscar "todo lo que está a menos de r km" se reduce
+a unos pocos rangos: la celda del punto y sus 8 vecinas en el nivel más fino
+cuyas celdas miden al menos r.
+"""
+import math
+from typing import List, Tuple
+
+MAX_LEVEL = 24
+KM_PER_DEGREE = 111.32
+
+
+def _spread(v: int) -> int:
+    """Intercalar un cero entre cada bit de v (hasta 32 bits)"""
+    v &= 0xFFFFFFFF
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    v = (v | (v << 1)) & 0x5555555555555555
+    return v
+
+
+def _compact(v: int) -> int:
+    """Inversa de _spread: quedarse con los bits pares"""
+    v &= 0x5555555555555555
+    v = (v | (v >> 1)) & 0x3333333333333333
+    v = (v | (v >> 2)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v >> 4)) & 0x00FF00FF00FF00FF
+    v = (v | (v >> 8)) & 0x0000FFFF0000FFFF
+    v = (v | (v >> 16)) & 0x00000000FFFFFFFF
+    return v
+
+
+def _interleave(x: int, y: int) -> int:
+    return _spread(x) | (_spread(y) << 1)
+
+
+def cell_xy(lat: float, lon: float, level: int = MAX_LEVEL) -> Tuple[int, int]:
+    """Columna y fila de la celda que contiene el punto"""
+    n = 1 << level
+    x = int(math.floor((lon + 180) / 360 * n))
+    y = int(math.floor((lat + 90) / 180 * n))
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def encode(lat: float, lon: float, level: int = MAX_LEVEL) -> int:
+    """Id de la celda de nivel `level` que contiene el punto"""
+    return _interleave(*cell_xy(lat, lon, level))
+
+
+def decode(cell: int, level: int = MAX_LEVEL) -> Tuple[float, float]:
+    """Centro (lat, lon) de una celda"""
+    n = 1 << level
+    x, y = _compact(cell), _compact(cell >> 1)
+    return (y + 0.5) / n * 180 - 90, (x + 0.5) / n * 360 - 180
+
+
+def parent(cell: int, level: int, from_level: int = MAX_LEVEL) -> int:
+    """Celda de nivel `level` que contiene a una celda de nivel `from_level`"""
+    return cell >> (2 * (from_level - level))
+
+
+def cell_range(cell: int, level: int) -> Tuple[int, int]:
+    """Rango inclusivo de ids de MAX_LEVEL contenidos en una celda de nivel `level`"""
+    shift = 2 * (MAX_LEVEL - level)
+    return cell << shift, ((cell + 1) << shift) - 1
+
+
+def truncate(cell: int, level: int) -> int:
+    """Id de MAX_LEVEL que representa a la celda de nivel `level` (su primer id)"""
+    return cell_range(parent(cell, level), level)[0]
+
+
+def neighbours(cell: int, level: int) -> List[int]:
+    """La celda y sus vecinas 3x3 (la longitud da la vuelta, la latitud no)"""
+    n = 1 << level
+    x, y = _compact(cell), _compact(cell >> 1)
+    cells = []
+    for dy in (-1, 0, 1):
+        ny = y + dy
+        if ny < 0 or ny >= n:
+            continue
+        for dx in (-1, 0, 1):
+            cells.append(_interleave((x + dx) % n, ny))
+    return sorted(set(cells))
+
+
+def level_for_radius(lat: float, radius_km: float) -> int:
+    """
+    Nivel más fino cuyas celdas miden al menos radius_km en ambos ejes cerca
+    de `lat`, de modo que la celda y sus vecinas cubren el círculo de búsqueda.
+    """
+    # El ancho en longitud se mide en la fila vecina más cercana al polo
+    edge_lat = min(90.0, abs(lat) + radius_km / KM_PER_DEGREE)
+    cos_lat = math.cos(math.radians(edge_lat))
+    for level in range(MAX_LEVEL, 0, -1):
+        n = 1 << level
+        height_km = 180 / n * KM_PER_DEGREE
+        width_km = 360 / n * KM_PER_DEGREE * cos_lat
+        if height_km >= radius_km and width_km >= radius_km:
+            return level
+    return 0
+
+
+def search_ranges(lat: float, lon: float, radius_km: float) -> Tuple[List[int], List[int]]:
+    """
+    Rangos (inicios, finales) de ids de MAX_LEVEL que cubren todo punto a menos
+    de radius_km. Los rangos contiguos se fusionan.
+    """
+    level = level_for_radius(lat, radius_km)
+    ranges = [cell_range(cell, level) for cell in neighbours(encode(lat, lon, level), level)]
+
+    starts, ends = [], []
+    for lo, hi in sorted(ranges):
+        if ends and lo <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], hi)
+        else:
+            starts.append(lo)
+            ends.append(hi)
+    return starts, ends
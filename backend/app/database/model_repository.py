@@ -1,55 +1,140 @@
 # backend/app/database/model_repository.py
-import asyncpg
-import joblib
 import json
-import io
-import math
-from datetime import datetime, timedelta
+import logging
+import os
+from datetime import date, datetime, timedelta
 from typing import List, Optional, Dict, Any
-from dataclasses import dataclass
-
-@dataclass
-class ModelRecord:
-    id: int
-    latitude: float
-    longitude: float
-    variable_name: str
-    model_data: bytes
-    model_metadata: dict
-    training_date: datetime
-    accuracy_score: float
-    mean_absolute_error: float
-    r2_score: float
-    data_points_count: int
-    geographic_hash: str
-    is_active: bool
-
-class ModelRepository:
-    def __init__(self, database_url: str):
-        self.database_url = database_url
+
+from app.database import geocell
+from app.database.base_repository import (
+    ASSIGNMENT_MAX_DISTANCE_KM,
+    ASSIGNMENT_MAX_MODELS,
+    DB_SLOW_QUERY_MS,
+    MODEL_ASSIGNMENT_CELL_LEVEL,
+    PREDICTION_CACHE_CELL_LEVEL,
+    PREDICTION_CACHE_TTL_S,
+    BaseModelRepository,
+    ModelAssignment,
+    ModelRecord
+)
+
+logger = logging.getLogger(__name__)
+
+# Configuración del pool (se puede sobrescribir en el constructor)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5"))
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+# Caché de sentencias de asyncpg (sentencias preparadas por conexión, por texto
+# de consulta). Con 0 se desactiva, como requiere pgbouncer en modo transacción.
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+DB_MAX_CACHED_STATEMENT_LIFETIME = float(os.getenv("DB_MAX_CACHED_STATEMENT_LIFETIME", "300"))
+# Lock consultivo que serializa el cálculo de asignaciones con altas/bajas de modelos
+ASSIGNMENT_LOCK_KEY = 7_340_035
+
+# Consultas de la ruta de predicción: se preparan (caché de sentencias) al abrir
+# cada conexión, así ninguna petición paga el Parse/plan la primera vez
+HOT_STATEMENTS = {
+    'cached_prediction': """
+        SELECT predictions, model_versions FROM prediction_cache
+        WHERE geo_cell = $1 AND prediction_date = $2
+          AND expires_at > CURRENT_TIMESTAMP
+    """,
+    # Un rango de ids de celda por cada bloque contiguo de la vecindad 3x3.
+    # Solo las columnas de ModelRecord (ya en float8): el blob está en model_blobs
+    'candidate_models': """
+        SELECT m.id, m.variable_name, m.latitude::float8 AS latitude,
+               m.longitude::float8 AS longitude, m.accuracy_score::float8 AS accuracy_score
+        FROM trained_models m
+        JOIN unnest($2::bigint[], $3::bigint[]) AS r(lo, hi)
+          ON m.geo_cell BETWEEN r.lo AND r.hi
+        WHERE m.variable_name = ANY($1::text[])
+          AND m.is_active = true
+          AND m.accuracy_score > 0.7
+    """,
+    'model_data': "SELECT model_data FROM model_blobs WHERE model_id = $1",
+    'model_assignments': """
+        SELECT variable_name, model_ids, latitudes, longitudes, accuracy_scores
+        FROM model_assignments
+        WHERE geo_cell = $1
+    """
+}
+
+# Argumentos que no devuelven filas, para preparar cada consulta al conectar
+HOT_STATEMENT_WARMUP_ARGS = {
+    'cached_prediction': (-1, date(1970, 1, 1)),
+    'candidate_models': ([], [], []),
+    'model_data': (-1,),
+    'model_assignments': (-1,)
+}
+
+class ModelRepository(BaseModelRepository):
+    def __init__(self, database_url: str,
+                 min_size: int = DB_POOL_MIN_SIZE,
+                 max_size: int = DB_POOL_MAX_SIZE,
+                 acquire_timeout: float = DB_POOL_ACQUIRE_TIMEOUT,
+                 max_inactive_lifetime: float = DB_POOL_MAX_INACTIVE_LIFETIME,
+                 statement_cache_size: int = DB_STATEMENT_CACHE_SIZE,
+                 max_cached_statement_lifetime: float = DB_MAX_CACHED_STATEMENT_LIFETIME,
+                 slow_query_ms: float = DB_SLOW_QUERY_MS,
+                 cache_cell_level: int = PREDICTION_CACHE_CELL_LEVEL,
+                 assignment_cell_level: int = MODEL_ASSIGNMENT_CELL_LEVEL):
+        super().__init__(database_url, slow_query_ms, cache_cell_level, assignment_cell_level)
         self.pool = None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_inactive_lifetime = max_inactive_lifetime
+        self.statement_cache_size = statement_cache_size
+        self.max_cached_statement_lifetime = max_cached_statement_lifetime
+        self.prepare_hot_statements = statement_cache_size > 0
     
     async def connect(self):
         """Inicializar pool de conexiones"""
-        self.pool = await asyncpg.create_pool(self.database_url)
+        import asyncpg
+        self.pool = await asyncpg.create_pool(
+            self.database_url,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            max_inactive_connection_lifetime=self.max_inactive_lifetime,
+            statement_cache_size=self.statement_cache_size,
+            max_cached_statement_lifetime=self.max_cached_statement_lifetime,
+            init=self._init_connection
+        )
     
     async def disconnect(self):
         """Cerrar pool de conexiones"""
         if self.pool:
             await self.pool.close()
     
-    def calculate_geo_hash(self, lat: float, lon: float) -> str:
-        """Calcular hash geográfico para agrupar modelos por región"""
-        return f"{round(lat, 1)},{round(lon, 1)}"
+    async def _init_connection(self, conn):
+        """Preparar las consultas calientes en cada conexión nueva del pool"""
+        if not self.prepare_hot_statements:
+            return
+        # Los PreparedStatement explícitos de asyncpg quedan inválidos al devolver
+        # la conexión al pool; la caché de sentencias sí conserva la sentencia
+        # preparada en el servidor, así que se llena ejecutando cada consulta
+        for name, query in HOT_STATEMENTS.items():
+            await conn.fetch(query, *HOT_STATEMENT_WARMUP_ARGS[name])
+    
+    async def _fetch_hot(self, conn, name: str, method: str, *args):
+        """Ejecutar una consulta caliente (reutiliza la sentencia preparada de la conexión)"""
+        with self._timed(name):
+            return await getattr(conn, method)(HOT_STATEMENTS[name], *args)
+    
+    def _acquire(self):
+        return self.pool.acquire(timeout=self.acquire_timeout)
     
-    def calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-        """Calcular distancia usando fórmula de Haversine"""
-        lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        return 6371 * c  # Radio de la Tierra en km
+    async def check_pool(self, timeout: float = 1.0) -> bool:
+        """Verificar que el pool puede entregar una conexión (sin ejecutar consultas)"""
+        if self.pool is None or self.pool.is_closing():
+            return False
+        try:
+            conn = await self.pool.acquire(timeout=timeout)
+        except Exception:
+            return False
+        await self.pool.release(conn)
+        return True
     
     async def save_model(self, 
                         latitude: float, 
@@ -59,29 +144,36 @@ class ModelRepository:
                         metadata: dict) -> int:
         """Guardar modelo entrenado en la base de datos"""
         
-        # Serializar modelo
-        model_buffer = io.BytesIO()
-        joblib.dump(model, model_buffer)
-        model_data = model_buffer.getvalue()
+        from app.ml.model_format import serialize_model
+        
+        # Serializar modelo (formato compacto EWFM si el estimador lo admite)
+        model_data = serialize_model(model)
         
         geo_hash = self.calculate_geo_hash(latitude, longitude)
+        geo_cell = self.calculate_geo_cell(latitude, longitude)
         
-        async with self.pool.acquire() as conn:
+        async with self._acquire() as conn, conn.transaction(), self._timed('save_model'):
+            await conn.execute("SELECT pg_advisory_xact_lock($1)", ASSIGNMENT_LOCK_KEY)
             model_id = await conn.fetchval(
                 """
                 INSERT INTO trained_models 
-                (latitude, longitude, variable_name, model_data, model_metadata, 
-                 accuracy_score, mean_absolute_error, r2_score, data_points_count, geographic_hash)
+                (latitude, longitude, variable_name, model_metadata, 
+                 accuracy_score, mean_absolute_error, r2_score, data_points_count, geographic_hash, geo_cell)
                 VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
                 RETURNING id
                 """,
-                latitude, longitude, variable_name, model_data, json.dumps(metadata),
+                latitude, longitude, variable_name, json.dumps(metadata),
                 metadata.get('accuracy_score', 0), 
                 metadata.get('mean_absolute_error', 0),
                 metadata.get('r2_score', 0),
                 metadata.get('data_points_count', 0),
-                geo_hash
+                geo_hash, geo_cell
+            )
+            await conn.execute(
+                "INSERT INTO model_blobs (model_id, model_data) VALUES ($1, $2)",
+                model_id, model_data
             )
+            await self._invalidate_assignments(conn, latitude, longitude, variable_name)
         
         return model_id
     
@@ -92,65 +184,191 @@ class ModelRepository:
                               max_distance_km: float = 100,
                               max_models: int = 3) -> Dict[str, List[ModelRecord]]:
         """Encontrar los mejores modelos para una ubicación específica"""
-        
-        results = {}
-        
-        async with self.pool.acquire() as conn:
-            for variable in variable_names:
-                # Buscar modelos cercanos con buena precisión
-                rows = await conn.fetch(
-                    """
-                    SELECT * FROM trained_models 
-                    WHERE variable_name = $1 
-                      AND is_active = true
-                      AND accuracy_score > 0.7
-                    ORDER BY accuracy_score DESC
-                    LIMIT 50
-                    """, 
-                    variable
-                )
-                
-                # Filtrar por distancia y ordenar por precisión + distancia
-                model_candidates = []
-                for row in rows:
-                    distance = self.calculate_distance(
-                        latitude, longitude, 
-                        float(row['latitude']), float(row['longitude'])
-                    )
-                    
-                    if distance <= max_distance_km:
-                        # Score combinado: precisión (70%) + proximidad (30%)
-                        distance_score = max(0, 1 - (distance / max_distance_km))
-                        combined_score = (0.7 * row['accuracy_score']) + (0.3 * distance_score)
-                        
-                        model_candidates.append({
-                            'record': ModelRecord(**dict(row)),
-                            'distance': distance,
-                            'combined_score': combined_score
-                        })
-                
-                # Ordenar por score combinado y tomar los mejores
-                model_candidates.sort(key=lambda x: x['combined_score'], reverse=True)
-                results[variable] = [
-                    candidate['record'] 
-                    for candidate in model_candidates[:max_models]
+        async with self._acquire() as conn:
+            return await self._find_best_models(
+                conn, latitude, longitude, variable_names, max_distance_km, max_models
+            )
+
+    async def _find_best_models(self, conn, latitude, longitude, variable_names,
+                                max_distance_km, max_models) -> Dict[str, List[ModelRecord]]:
+        # Buscar modelos con buena precisión solo en las celdas vecinas
+        starts, ends = geocell.search_ranges(latitude, longitude, max_distance_km)
+        rows = await self._fetch_hot(
+            conn, 'candidate_models', 'fetch', list(variable_names), starts, ends
+        )
+
+        rows_by_variable = {variable: [] for variable in variable_names}
+        for row in rows:
+            rows_by_variable[row['variable_name']].append(row)
+
+        return {
+            variable: self.rank_candidates(
+                latitude, longitude, variable_rows, max_distance_km, max_models
+            )
+            for variable, variable_rows in rows_by_variable.items()
+        }
+
+    async def get_model_assignments(self,
+                                    latitude: float,
+                                    longitude: float,
+                                    variable_names: List[str]) -> Dict[str, List[ModelAssignment]]:
+        """
+        Modelos a usar por variable para la celda del punto (tabla model_assignments).
+
+        Una consulta por clave primaria; las variables que aún no tienen fila
+        para la celda se calculan y guardan en ese momento.
+        """
+        cell = self.assignment_cell(latitude, longitude)
+        async with self._acquire() as conn:
+            rows = await self._fetch_hot(conn, 'model_assignments', 'fetch', cell)
+            assignments = {row['variable_name']: self._assignments_from_row(row) for row in rows}
+
+            missing = [variable for variable in variable_names if variable not in assignments]
+            if missing:
+                assignments.update(await self._fill_assignments(conn, cell, missing))
+
+        return {variable: assignments.get(variable, []) for variable in variable_names}
+
+    def _assignments_from_row(self, row) -> List[ModelAssignment]:
+        return [
+            ModelAssignment(*values)
+            for values
+            in zip(row['model_ids'], row['latitudes'], row['longitudes'], row['accuracy_scores'])
+        ]
+
+    async def _fill_assignments(self, conn, cell: int,
+                                variable_names: List[str]) -> Dict[str, List[ModelAssignment]]:
+        """Calcular y guardar las asignaciones de una celda (también las vacías)"""
+        center_lat, center_lon = self.assignment_center(cell)
+        # Lock compartido: un alta/baja de modelo no puede invalidar la celda
+        # entre la lectura de candidatos y la escritura de la asignación
+        async with conn.transaction(), self._timed('fill_model_assignments'):
+            await conn.execute("SELECT pg_advisory_xact_lock_shared($1)", ASSIGNMENT_LOCK_KEY)
+            best_models = await self._find_best_models(
+                conn, center_lat, center_lon, variable_names,
+                ASSIGNMENT_MAX_DISTANCE_KM, ASSIGNMENT_MAX_MODELS
+            )
+            assignments = self.build_assignments(cell, best_models)
+            await conn.executemany(
+                """
+                INSERT INTO model_assignments
+                (geo_cell, variable_name, model_ids, latitudes, longitudes, accuracy_scores)
+                VALUES ($1, $2, $3, $4, $5, $6)
+                ON CONFLICT (geo_cell, variable_name) DO UPDATE SET
+                    model_ids = EXCLUDED.model_ids,
+                    latitudes = EXCLUDED.latitudes,
+                    longitudes = EXCLUDED.longitudes,
+                    accuracy_scores = EXCLUDED.accuracy_scores,
+                    computed_at = CURRENT_TIMESTAMP
+                """,
+                [
+                    (cell, variable,
+                     [a.model_id for a in items],
+                     [a.latitude for a in items],
+                     [a.longitude for a in items],
+                     [a.accuracy_score for a in items])
+                    for variable, items in assignments.items()
                 ]
-        
-        return results
-    
-    async def load_model(self, model_id: int):
-        """Cargar modelo desde la base de datos"""
-        async with self.pool.acquire() as conn:
+            )
+        return assignments
+
+    async def _invalidate_assignments(self, conn, latitude: float, longitude: float, variable_name: str):
+        """
+        Borrar las asignaciones de las celdas a las que llega un modelo dado de
+        alta o de baja; se recalculan en la siguiente consulta de cada celda.
+        También las predicciones cacheadas de esas celdas, que pudieron salir
+        del modelo reemplazado.
+        """
+        starts, ends = geocell.search_ranges(latitude, longitude, ASSIGNMENT_MAX_DISTANCE_KM)
+        await conn.execute(
+            """
+            DELETE FROM model_assignments a
+            USING unnest($2::bigint[], $3::bigint[]) AS r(lo, hi)
+            WHERE a.variable_name = $1 AND a.geo_cell BETWEEN r.lo AND r.hi
+            """,
+            variable_name, starts, ends
+        )
+        await conn.execute(
+            """
+            DELETE FROM prediction_cache c
+            USING unnest($1::bigint[], $2::bigint[]) AS r(lo, hi)
+            WHERE c.geo_cell BETWEEN r.lo AND r.hi
+            """,
+            starts, ends
+        )
+
+    async def deactivate_model(self, model_id: int) -> bool:
+        """Desactivar un modelo y recalcular las celdas que lo usaban"""
+        async with self._acquire() as conn, conn.transaction(), self._timed('deactivate_model'):
+            await conn.execute("SELECT pg_advisory_xact_lock($1)", ASSIGNMENT_LOCK_KEY)
             row = await conn.fetchrow(
-                "SELECT model_data FROM trained_models WHERE id = $1",
+                """
+                UPDATE trained_models
+                SET is_active = false, updated_at = CURRENT_TIMESTAMP
+                WHERE id = $1 AND is_active = true
+                RETURNING latitude, longitude, variable_name
+                """,
                 model_id
             )
+            if row is None:
+                return False
+            await self._invalidate_assignments(
+                conn, float(row['latitude']), float(row['longitude']), row['variable_name']
+            )
+            return True
+    
+    async def load_model(self, model_id: int):
+        """Cargar modelo desde la base de datos (tabla model_blobs)"""
+        async with self._acquire() as conn:
+            row = await self._fetch_hot(conn, 'model_data', 'fetchrow', model_id)
             
             if row:
-                model_buffer = io.BytesIO(row['model_data'])
-                return joblib.load(model_buffer)
+                return self.deserialize_model(row['model_data'])
             return None
     
+    async def get_active_models_fingerprint(self) -> str:
+        """Huella barata del conjunto de modelos activos (cambia al insertar/desactivar)"""
+        async with self._acquire() as conn, self._timed('active_models_fingerprint'):
+            row = await conn.fetchrow(
+                """
+                SELECT COUNT(*) AS total, COALESCE(SUM(id), 0) AS id_sum, MAX(updated_at) AS last_update
+                FROM trained_models
+                WHERE is_active = true
+                """
+            )
+            last_update = row['last_update'].isoformat() if row['last_update'] else ''
+            return f"{row['total']}:{row['id_sum']}:{last_update}"
+    
+    async def iter_active_model_blobs(self, batch_size: int = 20):
+        """Recorrer (id, model_data) de los modelos activos sin cargarlos todos a la vez"""
+        # Sin _timed: el cursor queda abierto mientras quien consume deserializa
+        async with self._acquire() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor(
+                    """
+                    SELECT m.id, b.model_data FROM trained_models m
+                    JOIN model_blobs b ON b.model_id = m.id
+                    WHERE m.is_active = true ORDER BY m.id
+                    """,
+                    prefetch=batch_size
+                ):
+                    yield row['id'], row['model_data']
+    
+    async def get_most_used_model_ids(self, limit: int) -> List[int]:
+        """IDs de los modelos activos más usados (para precalentar cachés)"""
+        async with self._acquire() as conn, self._timed('most_used_models'):
+            rows = await conn.fetch(
+                """
+                SELECT m.id FROM trained_models m
+                LEFT JOIN model_usage_stats u ON u.model_id = m.id
+                WHERE m.is_active = true
+                ORDER BY COALESCE(u.usage_count, 0) DESC, m.accuracy_score DESC
+                LIMIT $1
+                """,
+                limit
+            )
+            return [row['id'] for row in rows]
+    
     async def cache_prediction(self, 
                               latitude: float, 
                               longitude: float,
@@ -158,14 +376,14 @@ class ModelRepository:
                               predictions: dict,
                               model_versions: dict):
         """Guardar predicción en caché"""
-        async with self.pool.acquire() as conn:
+        async with self._acquire() as conn, self._timed('cache_prediction'):
             date_obj = datetime.strptime(prediction_date, '%Y-%m-%d').date()
             await conn.execute(
                 """
                 INSERT INTO prediction_cache 
-                (latitude, longitude, prediction_date, predictions, model_versions, expires_at)
-                VALUES ($1, $2, $3, $4, $5, $6)
-                ON CONFLICT (latitude, longitude, prediction_date) 
+                (latitude, longitude, prediction_date, predictions, model_versions, expires_at, geo_cell)
+                VALUES ($1, $2, $3, $4, $5, $6, $7)
+                ON CONFLICT (geo_cell, prediction_date)
                 DO UPDATE SET 
                     predictions = EXCLUDED.predictions,
                     model_versions = EXCLUDED.model_versions,
@@ -174,7 +392,8 @@ class ModelRepository:
                 """,
                 latitude, longitude, date_obj,
                 json.dumps(predictions), json.dumps(model_versions),
-                datetime.now() + timedelta(hours=6)  # Cache por 6 horas
+                datetime.now() + timedelta(seconds=PREDICTION_CACHE_TTL_S),
+                self.cache_cell(latitude, longitude)
             )
     
     async def get_cached_prediction(self, 
@@ -182,24 +401,22 @@ class ModelRepository:
                                    longitude: float,
                                    prediction_date: str) -> Optional[dict]:
         """Obtener predicción del caché si existe y no ha expirado"""
-        async with self.pool.acquire() as conn:
+        async with self._acquire() as conn:
             date_obj = datetime.strptime(prediction_date, '%Y-%m-%d').date()
-            row = await conn.fetchrow(
-                """
-                SELECT predictions FROM prediction_cache 
-                WHERE latitude = $1 AND longitude = $2 AND prediction_date = $3
-                  AND expires_at > CURRENT_TIMESTAMP
-                """,
-                latitude, longitude, date_obj
+            row = await self._fetch_hot(
+                conn, 'cached_prediction', 'fetchrow', self.cache_cell(latitude, longitude), date_obj
             )
             
             if row:
-                return json.loads(row['predictions'])
+                return {
+                    'predictions': json.loads(row['predictions']),
+                    'model_versions': json.loads(row['model_versions'] or 'null')
+                }
             return None
     
     async def update_model_usage(self, model_id: int, response_time_ms: float, success: bool):
         """Actualizar estadísticas de uso del modelo"""
-        async with self.pool.acquire() as conn:
+        async with self._acquire() as conn, self._timed('update_model_usage'):
             await conn.execute(
                 """
                 INSERT INTO model_usage_stats (model_id, usage_count, average_response_time, success_rate)
@@ -215,7 +432,7 @@ class ModelRepository:
     
     async def get_model_stats(self, days: int = 30) -> Dict[str, Any]:
         """Obtener estadísticas de uso de modelos"""
-        async with self.pool.acquire() as conn:
+        async with self._acquire() as conn, self._timed('model_stats'):
             stats = await conn.fetchrow(
                 """
                 SELECT 
@@ -228,14 +445,15 @@ class ModelRepository:
             )
             
             usage_stats = await conn.fetchrow(
-                f"""
+                """
                 SELECT 
                     SUM(usage_count) as total_predictions,
                     AVG(average_response_time) as avg_response_time,
                     AVG(success_rate) as avg_success_rate
                 FROM model_usage_stats 
-                WHERE last_used > CURRENT_TIMESTAMP - INTERVAL '{days} days'
-                """
+                WHERE last_used > CURRENT_TIMESTAMP - make_interval(days => $1)
+                """,
+                days
             )
             
             return {
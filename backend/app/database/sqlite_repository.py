@@ -0,0 +1,530 @@
+# backend/app/database/sqlite_repository.py
+"""
+Repositorio de modelos en SQLite embebido (nodo único / edge).
+
+Mismas operaciones que ModelRepository sobre un archivo local, sin servidor
+de base de datos ni salto de red:
+
+- Modo WAL: las lecturas no se bloquean entre sí ni con la escritura.
+- sqlite3 es síncrono: cada operación se ejecuta en un pool de hilos propio
+  (una conexión por hilo), así el event loop nunca espera al disco.
+- Índice espacial R*Tree (model_rtree) con la posición de los modelos activos:
+  la búsqueda de candidatos lee la caja envolvente del radio y rank_candidates
+  filtra por distancia real.
+- Las escrituras que tocan asignaciones usan BEGIN IMMEDIATE (un único
+  escritor), que cumple el papel del lock consultivo de PostgreSQL.
+
+    DATABASE_URL=sqlite:///data/models.db uvicorn app.main:app
+"""
+import asyncio
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.database import geocell
+from app.database.base_repository import (
+    ASSIGNMENT_MAX_DISTANCE_KM,
+    ASSIGNMENT_MAX_MODELS,
+    DB_SLOW_QUERY_MS,
+    MODEL_ASSIGNMENT_CELL_LEVEL,
+    PREDICTION_CACHE_CELL_LEVEL,
+    PREDICTION_CACHE_TTL_S,
+    BaseModelRepository,
+    ModelAssignment,
+    ModelRecord
+)
+
+SQLITE_THREADS = int(os.getenv("SQLITE_THREADS", "4"))
+SQLITE_BUSY_TIMEOUT_S = float(os.getenv("SQLITE_BUSY_TIMEOUT_S", "5"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trained_models (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    variable_name TEXT NOT NULL,
+    model_metadata TEXT,
+    training_date TEXT DEFAULT CURRENT_TIMESTAMP,
+    accuracy_score REAL,
+    mean_absolute_error REAL,
+    r2_score REAL,
+    data_points_count INTEGER,
+    geographic_hash TEXT,
+    geo_cell INTEGER,
+    is_active INTEGER NOT NULL DEFAULT 1,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS model_blobs (
+    model_id INTEGER PRIMARY KEY REFERENCES trained_models(id) ON DELETE CASCADE,
+    model_data BLOB NOT NULL
+);
+
+-- Solo modelos activos: la entrada se borra al desactivar
+CREATE VIRTUAL TABLE IF NOT EXISTS model_rtree USING rtree(
+    id, min_lat, max_lat, min_lon, max_lon
+);
+
+-- model_ids, latitudes, longitudes y accuracy_scores como arreglos JSON
+CREATE TABLE IF NOT EXISTS model_assignments (
+    geo_cell INTEGER NOT NULL,
+    variable_name TEXT NOT NULL,
+    model_ids TEXT NOT NULL,
+    latitudes TEXT NOT NULL,
+    longitudes TEXT NOT NULL,
+    accuracy_scores TEXT NOT NULL,
+    computed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (geo_cell, variable_name)
+) WITHOUT ROWID;
+
+-- expires_at en segundos desde epoch
+CREATE TABLE IF NOT EXISTS prediction_cache (
+    geo_cell INTEGER NOT NULL,
+    prediction_date TEXT NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    predictions TEXT NOT NULL,
+    model_versions TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (geo_cell, prediction_date)
+) WITHOUT ROWID;
+
+-- last_used en segundos desde epoch
+CREATE TABLE IF NOT EXISTS model_usage_stats (
+    model_id INTEGER PRIMARY KEY REFERENCES trained_models(id),
+    usage_count INTEGER DEFAULT 0,
+    last_used REAL,
+    average_response_time REAL,
+    success_rate REAL
+);
+"""
+
+
+def sqlite_path(database_url: str) -> str:
+    """sqlite:///relativo.db, sqlite:////ruta/absoluta.db o sqlite:///:memory:"""
+    path = database_url.split(":", 1)[1]
+    return path[3:] if path.startswith("///") else path.lstrip("/")
+
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _bounding_boxes(latitude: float, longitude: float,
+                    radius_km: float) -> List[Tuple[float, float, float, float]]:
+    """Cajas (lat_min, lat_max, lon_min, lon_max) que cubren el radio; dos si cruza ±180°"""
+    dlat = radius_km / geocell.KM_PER_DEGREE
+    lat_min, lat_max = max(latitude - dlat, -90.0), min(latitude + dlat, 90.0)
+    cos_lat = min(math.cos(math.radians(lat_min)), math.cos(math.radians(lat_max)))
+    if cos_lat <= 1e-6 or radius_km / (geocell.KM_PER_DEGREE * cos_lat) >= 180:
+        return [(lat_min, lat_max, -180.0, 180.0)]
+
+    dlon = radius_km / (geocell.KM_PER_DEGREE * cos_lat)
+    lon_min, lon_max = longitude - dlon, longitude + dlon
+    if lon_min < -180:
+        return [(lat_min, lat_max, -180.0, lon_max), (lat_min, lat_max, lon_min + 360, 180.0)]
+    if lon_max > 180:
+        return [(lat_min, lat_max, lon_min, 180.0), (lat_min, lat_max, -180.0, lon_max - 360)]
+    return [(lat_min, lat_max, lon_min, lon_max)]
+
+
+class SQLiteModelRepository(BaseModelRepository):
+    def __init__(self, database_url: str,
+                 threads: int = SQLITE_THREADS,
+                 busy_timeout_s: float = SQLITE_BUSY_TIMEOUT_S,
+                 slow_query_ms: float = DB_SLOW_QUERY_MS,
+                 cache_cell_level: int = PREDICTION_CACHE_CELL_LEVEL,
+                 assignment_cell_level: int = MODEL_ASSIGNMENT_CELL_LEVEL):
+        super().__init__(database_url, slow_query_ms, cache_cell_level, assignment_cell_level)
+        self.path = sqlite_path(database_url)
+        # Una base en memoria existe por conexión: un solo hilo la comparte
+        self.threads = 1 if self.path == ":memory:" else threads
+        self.busy_timeout_s = busy_timeout_s
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+    # --- conexiones (una por hilo del pool) ---
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_s,
+                                   isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    async def _run(self, query: str, fn, *args):
+        """Ejecutar fn(conn, *args) en el pool de hilos, midiendo la espera y la consulta"""
+        loop = asyncio.get_running_loop()
+        with self._timed(query):
+            return await loop.run_in_executor(self._executor, lambda: fn(self._connection(), *args))
+
+    async def connect(self):
+        """Crear el pool de hilos y el esquema si el archivo es nuevo"""
+        if self.path != ":memory:" and os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="sqlite")
+        await self._run('init_schema', lambda conn: conn.executescript(SCHEMA))
+
+    async def disconnect(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+    async def check_pool(self, timeout: float = 1.0) -> bool:
+        return self._executor is not None
+
+    # --- modelos ---
+
+    async def save_model(self,
+                         latitude: float,
+                         longitude: float,
+                         variable_name: str,
+                         model,
+                         metadata: dict) -> int:
+        """Guardar modelo entrenado (metadatos, blob e índice espacial en una transacción)"""
+        from app.ml.model_format import serialize_model
+
+        model_data = serialize_model(model)
+
+        def save(conn):
+            with _transaction(conn):
+                model_id = conn.execute(
+                    """
+                    INSERT INTO trained_models
+                    (latitude, longitude, variable_name, model_metadata,
+                     accuracy_score, mean_absolute_error, r2_score, data_points_count, geographic_hash, geo_cell)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (latitude, longitude, variable_name, json.dumps(metadata),
+                     metadata.get('accuracy_score', 0),
+                     metadata.get('mean_absolute_error', 0),
+                     metadata.get('r2_score', 0),
+                     metadata.get('data_points_count', 0),
+                     self.calculate_geo_hash(latitude, longitude),
+                     self.calculate_geo_cell(latitude, longitude))
+                ).lastrowid
+                conn.execute("INSERT INTO model_blobs (model_id, model_data) VALUES (?, ?)",
+                             (model_id, model_data))
+                conn.execute("INSERT INTO model_rtree VALUES (?, ?, ?, ?, ?)",
+                             (model_id, latitude, latitude, longitude, longitude))
+                self._invalidate_assignments(conn, latitude, longitude, variable_name)
+            return model_id
+
+        return await self._run('save_model', save)
+
+    async def find_best_models(self,
+                               latitude: float,
+                               longitude: float,
+                               variable_names: List[str],
+                               max_distance_km: float = 100,
+                               max_models: int = 3) -> Dict[str, List[ModelRecord]]:
+        """Encontrar los mejores modelos para una ubicación específica"""
+        return await self._run(
+            'candidate_models', self._find_best_models,
+            latitude, longitude, variable_names, max_distance_km, max_models
+        )
+
+    def _find_best_models(self, conn, latitude, longitude, variable_names,
+                          max_distance_km, max_models) -> Dict[str, List[ModelRecord]]:
+        placeholders = ",".join("?" * len(variable_names))
+        rows_by_variable = {variable: [] for variable in variable_names}
+        for lat_min, lat_max, lon_min, lon_max in _bounding_boxes(latitude, longitude, max_distance_km):
+            rows = conn.execute(
+                f"""
+                SELECT m.id, m.variable_name, m.latitude, m.longitude, m.accuracy_score
+                FROM model_rtree r
+                JOIN trained_models m ON m.id = r.id
+                WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+                  AND m.variable_name IN ({placeholders})
+                  AND m.is_active = 1
+                  AND m.accuracy_score > 0.7
+                """,
+                (lat_min, lat_max, lon_min, lon_max, *variable_names)
+            ).fetchall()
+            for row in rows:
+                rows_by_variable[row['variable_name']].append(row)
+
+        return {
+            variable: self.rank_candidates(latitude, longitude, rows, max_distance_km, max_models)
+            for variable, rows in rows_by_variable.items()
+        }
+
+    async def get_model_assignments(self,
+                                    latitude: float,
+                                    longitude: float,
+                                    variable_names: List[str]) -> Dict[str, List[ModelAssignment]]:
+        """Modelos a usar por variable para la celda del punto (se calculan la primera vez)"""
+        cell = self.assignment_cell(latitude, longitude)
+
+        def assignments_for(conn):
+            rows = conn.execute(
+                """
+                SELECT variable_name, model_ids, latitudes, longitudes, accuracy_scores
+                FROM model_assignments WHERE geo_cell = ?
+                """,
+                (cell,)
+            ).fetchall()
+            assignments = {row['variable_name']: self._assignments_from_row(row) for row in rows}
+
+            missing = [variable for variable in variable_names if variable not in assignments]
+            if missing:
+                with _transaction(conn):
+                    assignments.update(self._fill_assignments(conn, cell, missing))
+            return {variable: assignments.get(variable, []) for variable in variable_names}
+
+        return await self._run('model_assignments', assignments_for)
+
+    def _assignments_from_row(self, row) -> List[ModelAssignment]:
+        return [
+            ModelAssignment(*values)
+            for values in zip(
+                json.loads(row['model_ids']), json.loads(row['latitudes']),
+                json.loads(row['longitudes']), json.loads(row['accuracy_scores'])
+            )
+        ]
+
+    def _fill_assignments(self, conn, cell: int,
+                          variable_names: List[str]) -> Dict[str, List[ModelAssignment]]:
+        """Calcular y guardar las asignaciones de una celda (también las vacías)"""
+        center_lat, center_lon = self.assignment_center(cell)
+        best_models = self._find_best_models(
+            conn, center_lat, center_lon, variable_names,
+            ASSIGNMENT_MAX_DISTANCE_KM, ASSIGNMENT_MAX_MODELS
+        )
+        assignments = self.build_assignments(cell, best_models)
+        conn.executemany(
+            """
+            INSERT INTO model_assignments
+            (geo_cell, variable_name, model_ids, latitudes, longitudes, accuracy_scores)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (geo_cell, variable_name) DO UPDATE SET
+                model_ids = excluded.model_ids,
+                latitudes = excluded.latitudes,
+                longitudes = excluded.longitudes,
+                accuracy_scores = excluded.accuracy_scores,
+                computed_at = CURRENT_TIMESTAMP
+            """,
+            [
+                (cell, variable,
+                 json.dumps([a.model_id for a in items]),
+                 json.dumps([a.latitude for a in items]),
+                 json.dumps([a.longitude for a in items]),
+                 json.dumps([a.accuracy_score for a in items]))
+                for variable, items in assignments.items()
+            ]
+        )
+        return assignments
+
+    def _invalidate_assignments(self, conn, latitude: float, longitude: float, variable_name: str):
+        """Borrar las asignaciones (y predicciones cacheadas) de las celdas a las que llega el modelo"""
+        starts, ends = geocell.search_ranges(latitude, longitude, ASSIGNMENT_MAX_DISTANCE_KM)
+        conn.executemany(
+            "DELETE FROM model_assignments WHERE variable_name = ? AND geo_cell BETWEEN ? AND ?",
+            [(variable_name, lo, hi) for lo, hi in zip(starts, ends)]
+        )
+        conn.executemany(
+            "DELETE FROM prediction_cache WHERE geo_cell BETWEEN ? AND ?",
+            list(zip(starts, ends))
+        )
+
+    async def deactivate_model(self, model_id: int) -> bool:
+        """Desactivar un modelo y recalcular las celdas que lo usaban"""
+        def deactivate(conn):
+            with _transaction(conn):
+                row = conn.execute(
+                    "SELECT latitude, longitude, variable_name FROM trained_models WHERE id = ? AND is_active = 1",
+                    (model_id,)
+                ).fetchone()
+                if row is None:
+                    return False
+                conn.execute(
+                    "UPDATE trained_models SET is_active = 0, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (model_id,)
+                )
+                conn.execute("DELETE FROM model_rtree WHERE id = ?", (model_id,))
+                self._invalidate_assignments(conn, row['latitude'], row['longitude'], row['variable_name'])
+            return True
+
+        return await self._run('deactivate_model', deactivate)
+
+    async def load_model(self, model_id: int):
+        """Cargar modelo (la deserialización también ocurre fuera del event loop)"""
+        def load(conn):
+            row = conn.execute("SELECT model_data FROM model_blobs WHERE model_id = ?", (model_id,)).fetchone()
+            return self.deserialize_model(row['model_data']) if row else None
+
+        return await self._run('model_data', load)
+
+    async def get_active_models_fingerprint(self) -> str:
+        """Huella barata del conjunto de modelos activos (cambia al insertar/desactivar)"""
+        def fingerprint(conn):
+            row = conn.execute(
+                """
+                SELECT COUNT(*) AS total, COALESCE(SUM(id), 0) AS id_sum, MAX(updated_at) AS last_update
+                FROM trained_models WHERE is_active = 1
+                """
+            ).fetchone()
+            return f"{row['total']}:{row['id_sum']}:{row['last_update'] or ''}"
+
+        return await self._run('active_models_fingerprint', fingerprint)
+
+    async def iter_active_model_blobs(self, batch_size: int = 20):
+        """Recorrer (id, model_data) de los modelos activos por lotes"""
+        last_id = 0
+        while True:
+            rows = await self._run('active_model_blobs', lambda conn: conn.execute(
+                """
+                SELECT m.id, b.model_data FROM trained_models m
+                JOIN model_blobs b ON b.model_id = m.id
+                WHERE m.is_active = 1 AND m.id > ? ORDER BY m.id LIMIT ?
+                """,
+                (last_id, batch_size)
+            ).fetchall())
+            if not rows:
+                return
+            for row in rows:
+                yield row['id'], row['model_data']
+            last_id = rows[-1]['id']
+
+    async def get_most_used_model_ids(self, limit: int) -> List[int]:
+        """IDs de los modelos activos más usados (para precalentar cachés)"""
+        rows = await self._run('most_used_models', lambda conn: conn.execute(
+            """
+            SELECT m.id FROM trained_models m
+            LEFT JOIN model_usage_stats u ON u.model_id = m.id
+            WHERE m.is_active = 1
+            ORDER BY COALESCE(u.usage_count, 0) DESC, m.accuracy_score DESC
+            LIMIT ?
+            """,
+            (limit,)
+        ).fetchall())
+        return [row['id'] for row in rows]
+
+    # --- caché de predicciones y uso ---
+
+    async def cache_prediction(self,
+                               latitude: float,
+                               longitude: float,
+                               prediction_date: str,
+                               predictions: dict,
+                               model_versions: dict):
+        """Guardar predicción en caché"""
+        date_key = datetime.strptime(prediction_date, '%Y-%m-%d').date().isoformat()
+        await self._run('cache_prediction', lambda conn: conn.execute(
+            """
+            INSERT INTO prediction_cache
+            (geo_cell, prediction_date, latitude, longitude, predictions, model_versions, expires_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (geo_cell, prediction_date) DO UPDATE SET
+                predictions = excluded.predictions,
+                model_versions = excluded.model_versions,
+                created_at = CURRENT_TIMESTAMP,
+                expires_at = excluded.expires_at
+            """,
+            (self.cache_cell(latitude, longitude), date_key, latitude, longitude,
+             json.dumps(predictions), json.dumps(model_versions),
+             time.time() + PREDICTION_CACHE_TTL_S)
+        ))
+
+    async def get_cached_prediction(self,
+                                    latitude: float,
+                                    longitude: float,
+                                    prediction_date: str) -> Optional[dict]:
+        """Obtener predicción del caché si existe y no ha expirado"""
+        date_key = datetime.strptime(prediction_date, '%Y-%m-%d').date().isoformat()
+        row = await self._run('cached_prediction', lambda conn: conn.execute(
+            """
+            SELECT predictions, model_versions FROM prediction_cache
+            WHERE geo_cell = ? AND prediction_date = ? AND expires_at > ?
+            """,
+            (self.cache_cell(latitude, longitude), date_key, time.time())
+        ).fetchone())
+        if row is None:
+            return None
+        return {
+            'predictions': json.loads(row['predictions']),
+            'model_versions': json.loads(row['model_versions'] or 'null')
+        }
+
+    async def update_model_usage(self, model_id: int, response_time_ms: float, success: bool):
+        """Actualizar estadísticas de uso del modelo"""
+        await self._run('update_model_usage', lambda conn: conn.execute(
+            """
+            INSERT INTO model_usage_stats (model_id, usage_count, last_used, average_response_time, success_rate)
+            VALUES (?, 1, ?, ?, ?)
+            ON CONFLICT (model_id) DO UPDATE SET
+                usage_count = usage_count + 1,
+                average_response_time = (average_response_time + excluded.average_response_time) / 2,
+                success_rate = (success_rate + excluded.success_rate) / 2,
+                last_used = excluded.last_used
+            """,
+            (model_id, time.time(), response_time_ms, 1.0 if success else 0.0)
+        ))
+
+    async def get_model_stats(self, days: int = 30) -> Dict[str, Any]:
+        """Obtener estadísticas de uso de modelos"""
+        def stats(conn):
+            models = conn.execute(
+                """
+                SELECT
+                    COUNT(*) AS total_models,
+                    COALESCE(SUM(is_active), 0) AS active_models,
+                    AVG(accuracy_score) AS avg_accuracy,
+                    COUNT(DISTINCT geographic_hash) AS regions_covered
+                FROM trained_models
+                """
+            ).fetchone()
+            usage = conn.execute(
+                """
+                SELECT
+                    SUM(usage_count) AS total_predictions,
+                    AVG(average_response_time) AS avg_response_time,
+                    AVG(success_rate) AS avg_success_rate
+                FROM model_usage_stats
+                WHERE last_used > ?
+                """,
+                (time.time() - days * 86400,)
+            ).fetchone()
+            return models, usage
+
+        models, usage = await self._run('model_stats', stats)
+        return {
+            'total_models': models['total_models'],
+            'active_models': models['active_models'],
+            'average_accuracy': float(models['avg_accuracy'] or 0),
+            'regions_covered': models['regions_covered'],
+            'total_predictions': usage['total_predictions'] or 0,
+            'average_response_time_ms': float(usage['avg_response_time'] or 0),
+            'average_success_rate': float(usage['avg_success_rate'] or 0)
+        }
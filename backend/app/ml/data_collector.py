@@ -4,13 +4,27 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from app.services.nasapower import get_complete_climate_projection
+from app.services.upstream import BULK
+
+# Nombres de columna del dataset de entrenamiento por parámetro POWER
+COLUMN_NAMES = {
+    "PRECTOTCORR": "Precipitation_mm_per_day",
+    "T2M": "Temperature_C",
+    "T2M_MAX": "Temperature_Max_C",
+    "T2M_MIN": "Temperature_Min_C",
+    "RH2M": "Humidity_Percent",
+    "WS2M": "Wind_Speed_ms",
+    "PS": "Pressure_kPa",
+    "CLOUD_AMT": "Cloud_Cover_Percent"
+}
 
 async def collect_data(location,year):
     all_data = []
 
     lat, lon = location
     try:
-        data = await get_complete_climate_projection(lat, lon, year-5, year)
+        # Barrido masivo: cede el presupuesto de POWER a las consultas interactivas
+        data = await get_complete_climate_projection(lat, lon, year-5, year, priority=BULK)
         if "parameters" in data and data["parameters"]:
             # Crear lista vacía para los registros
             records_list = []
@@ -37,16 +51,7 @@ async def collect_data(location,year):
                     for param_name, param_data in parameters.items():
                         if date_str in param_data["data"]:
                             # Usar nombres más descriptivos para las columnas
-                            column_name = {
-                                "PRECTOTCORR": "Precipitation_mm_per_day",
-                                "T2M": "Temperature_C",
-                                "T2M_MAX": "Temperature_Max_C",
-                                "T2M_MIN": "Temperature_Min_C",
-                                "RH2M": "Humidity_Percent",
-                                "WS2M": "Wind_Speed_ms",
-                                "PS": "Pressure_kPa",
-                                "CLOUD_AMT": "Cloud_Cover_Percent"
-                            }.get(param_name, param_name)
+                            column_name = COLUMN_NAMES.get(param_name, param_name)
                             
                             record[column_name] = param_data["data"][date_str]
                     
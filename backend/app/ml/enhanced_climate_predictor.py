@@ -1,20 +1,42 @@
 # backend/app/ml/enhanced_climate_predictor.py
-from app.database.model_repository import ModelRepository, ModelRecord
+from app.database.base_repository import BaseModelRepository, create_model_repository
+from app.services.metrics import PREDICT_STAGE_SECONDS, PREDICTION_CACHE_REQUESTS
 import os
-from typing import Dict, List, Optional
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 import asyncio
 from datetime import datetime
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
 class EnhancedClimatePredictor:
-    def __init__(self, database_url: str = None):
-        self.use_database = database_url is not None
+    VARIABLE_NAMES = [
+        'Temperature_C',
+        'Humidity_Percent',
+        'Pressure_kPa',
+        'Precipitation_mm_per_day',
+        'Cloud_Cover_Percent'
+    ]
+
+    def __init__(self,
+                 database_url: str = None,
+                 grid_dir: str = None,
+                 stats_ttl_seconds: float = 60,
+                 model_cache_size: int = 64,
+                 model_repo: BaseModelRepository = None,
+                 shared_store_dir: str = None,
+                 shared_store_refresh_seconds: float = 60,
+                 warm_up_retry_seconds: float = 5,
+                 warm_up_retry_max_seconds: float = 300):
+        self.use_database = database_url is not None or model_repo is not None
+        self.model_repo = model_repo
         
-        if self.use_database:
+        if self.use_database and self.model_repo is None:
             try:
-                self.model_repo = ModelRepository(database_url)
+                self.model_repo = create_model_repository(database_url)
             except Exception as e:
                 logger.error(f"Error inicializando ModelRepository: {e}")
                 self.use_database = False
@@ -32,24 +54,147 @@ class EnhancedClimatePredictor:
         else:
             self.predictor = None
         
-        self.variable_names = [
-            'Temperature_C',
-            'Humidity_Percent', 
-            'Pressure_kPa',
-            'Precipitation_mm_per_day',
-            'Cloud_Cover_Percent'
-        ]
+        self.variable_names = list(self.VARIABLE_NAMES)
+        
+        # Rejilla climatológica precalculada (opcional; numpy solo se importa si se usa)
+        self.grid = None
+        if grid_dir:
+            from app.ml.climatology_grid import ClimatologyGrid
+            self.grid = ClimatologyGrid.open(grid_dir)
+        if self.grid:
+            logger.info(f"Rejilla climatológica cargada desde {grid_dir}")
+        
+        # Estadísticas cacheadas con intervalo de refresco
+        self.stats_ttl_seconds = stats_ttl_seconds
+        self._stats_cache: Optional[Dict] = None
+        self._stats_cached_at = 0.0
+        self._stats_refresh: Optional[asyncio.Task] = None
+        
+        # Caché LRU de modelos ya deserializados
+        self.model_cache_size = model_cache_size
+        self._model_cache: "OrderedDict[int, object]" = OrderedDict()
+        self.model_cache_warm = False
+        
+        # Reintentos del arranque (conexión + calentamiento) si la base no está disponible
+        self.warm_up_retry_seconds = warm_up_retry_seconds
+        self.warm_up_retry_max_seconds = warm_up_retry_max_seconds
+        self._repo_connected = False
+        self._warm_up_task: Optional[asyncio.Task] = None
+        
+        # Almacén de modelos en memoria compartida entre workers (opcional)
+        self.shared_store_dir = shared_store_dir
+        self.shared_store_refresh_seconds = shared_store_refresh_seconds
+        self.shared_store = None
+        self._shared_store_task: Optional[asyncio.Task] = None
+        
+        # Cola de entrenamiento para celdas sin modelos (app.ml.training_queue; opcional)
+        self.training_queue = None
     
     async def initialize(self):
-        """Inicializar conexión a base de datos"""
+        """Inicializar conexión a base de datos y precalentar caché de modelos"""
         if self.use_database and self.model_repo:
             try:
-                await self.model_repo.connect()
+                await self._start_up()
             except Exception as e:
                 logger.error(f"Error conectando a base de datos: {e}")
+                self._warm_up_task = asyncio.create_task(self._retry_start_up_loop())
+    
+    async def _start_up(self):
+        """Conexión, almacén compartido y calentamiento; cada paso se omite si ya se completó"""
+        if not self._repo_connected:
+            await self.model_repo.connect()
+            self._repo_connected = True
+        if self.shared_store_dir and self.shared_store is None:
+            await self._init_shared_store()
+        if not self.model_cache_warm:
+            await self.warm_model_cache()
+    
+    async def _retry_start_up_loop(self):
+        """Reintentar el arranque con backoff exponencial hasta que /readyz pueda pasar"""
+        delay = self.warm_up_retry_seconds
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self._start_up()
+            except Exception as e:
+                delay = min(delay * 2, self.warm_up_retry_max_seconds)
+                logger.error(f"Reintento de arranque fallido (siguiente en {delay:g} s): {e}")
+                continue
+            logger.info("Base de datos disponible; arranque completado en reintento")
+            return
+    
+    async def _init_shared_store(self):
+        """Publicar (si hace falta) y mapear el almacén de modelos compartido"""
+        from app.ml.shared_model_store import SharedModelStore
+        
+        # Se asigna solo ya mapeado, para que un fallo se reintente desde cero
+        shared_store = SharedModelStore(self.shared_store_dir)
+        await shared_store.sync_from_repository(self.model_repo)
+        shared_store.attach()
+        self.shared_store = shared_store
+        self._shared_store_task = asyncio.create_task(self._refresh_shared_store_loop())
+    
+    async def _refresh_shared_store_loop(self):
+        """Refresco periódico coordinado: solo el worker con el lock reconstruye"""
+        while True:
+            await asyncio.sleep(self.shared_store_refresh_seconds)
+            try:
+                await self.shared_store.sync_from_repository(self.model_repo)
+            except Exception as e:
+                logger.error(f"Error refrescando almacén compartido: {e}")
+    
+    async def warm_model_cache(self):
+        """Cargar en memoria los modelos activos más usados"""
+        model_ids = await self.model_repo.get_most_used_model_ids(self.model_cache_size)
+        for model_id in model_ids:
+            await self._get_model(model_id)
+        self.model_cache_warm = True
+        logger.info(f"Caché de modelos precalentado con {len(self._model_cache)} modelos")
+    
+    async def _get_model(self, model_id: int):
+        """Obtener modelo del almacén compartido, del caché LRU o de la base de datos"""
+        if self.shared_store is not None:
+            model = self.shared_store.get(model_id)
+            if model is not None:
+                return model
+        
+        model = self._model_cache.get(model_id)
+        if model is not None:
+            self._model_cache.move_to_end(model_id)
+            return model
+        
+        model = await self.model_repo.load_model(model_id)
+        if model is not None and self.model_cache_size > 0:
+            self._model_cache[model_id] = model
+            if len(self._model_cache) > self.model_cache_size:
+                self._model_cache.popitem(last=False)
+        return model
+    
+    async def readiness(self) -> Dict:
+        """Comprobar disponibilidad del pool y calentamiento del caché (sin consultas)"""
+        if self.use_database and self.model_repo:
+            pool_available = await self.model_repo.check_pool()
+            cache_warm = (self.model_cache_warm or self.grid is not None
+                          or (self.shared_store is not None and self.shared_store.attached))
+        else:
+            pool_available = None
+            cache_warm = self.predictor is not None or self.grid is not None
+        
+        return {
+            'ready': pool_available is not False and cache_warm,
+            'pool_available': pool_available,
+            'model_cache_warm': cache_warm,
+            'models_cached': len(self._model_cache),
+            'models_shared': len(self.shared_store) if self.shared_store is not None else 0,
+            'grid_loaded': self.grid is not None
+        }
     
     async def cleanup(self):
         """Limpiar recursos"""
+        if self._warm_up_task is not None:
+            self._warm_up_task.cancel()
+        if self._shared_store_task is not None:
+            self._shared_store_task.cancel()
         if self.use_database and self.model_repo:
             try:
                 await self.model_repo.disconnect()
@@ -60,6 +205,11 @@ class EnhancedClimatePredictor:
         """Predecir clima usando modelos de base de datos o archivos"""
         
         try:
+            if self.grid is not None:
+                grid_prediction = self._predict_with_grid(latitude, longitude, target_date)
+                if grid_prediction is not None:
+                    return grid_prediction
+            
             if self.use_database and self.model_repo:
                 return await self._predict_with_database(latitude, longitude, target_date)
             elif self.predictor:
@@ -80,31 +230,205 @@ class EnhancedClimatePredictor:
                 'prediction_date': target_date
             }
     
+    def prediction_version(self, prediction: Dict) -> Optional[str]:
+        """
+        Versión de los datos que produjeron una predicción (ETag de /predict)
+        
+        Son los ids de los modelos usados, que el caché de predicciones guarda
+        junto a los valores, o la fecha de construcción de la rejilla. None si
+        la predicción no tiene versión (valores por defecto o archivos).
+        """
+        if 'training' in prediction:
+            # Con valores por defecto la respuesta cambiará al entrenarse la celda
+            return None
+        if prediction.get('source') == 'climatology_grid':
+            return f"grid:{self.grid.metadata.get('built_at')}"
+        
+        model_info = prediction.get('model_info') or {}
+        if not all(variable in model_info for variable in self.variable_names):
+            return None
+        return "models:" + ",".join(
+            f"{variable}={model_info[variable]['model_id']}" for variable in sorted(self.variable_names)
+        )
+    
+    def _model_info(self, latitude: float, longitude: float, model_versions: Dict) -> Dict:
+        """Modelos usados por variable, con la distancia medida desde el punto consultado"""
+        return {
+            variable: {
+                'model_id': version['model_id'],
+                'accuracy': version['accuracy'],
+                'distance_km': self.model_repo.calculate_distance(
+                    latitude, longitude, version['latitude'], version['longitude']
+                )
+            }
+            for variable, version in model_versions.items()
+        }
+    
+    async def predict_window(self, latitude: float, longitude: float,
+                             start_date: str, days: int) -> Dict:
+        """
+        Predecir una ventana de días consecutivos de una sola vez
+        
+        Cada modelo se evalúa una vez sobre la matriz de features de todos los
+        días (en lugar de un predict por día). No pasa por el caché de
+        predicciones: está pensado para barridos de semanas o meses.
+        
+        Returns:
+            Dict con 'dates', 'predictions' (un arreglo por campo del esquema
+            de /predict) y 'source'. Si alguna variable no tiene modelo la
+            ventana no se rellena con valores por defecto: 'success' es False
+            y 'training' trae las variables faltantes y el trabajo encolado.
+        """
+        dates = np.datetime64(start_date, 'D') + np.arange(days)
+        months = dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        month_days = (dates - dates.astype('datetime64[M]')).astype(np.int64) + 1
+        date_strings = [str(d) for d in dates]
+        
+        values = None
+        source = None
+        if self.grid is not None:
+            from app.ml.climatology_grid import day_indices
+            
+            grid_values = self.grid.interpolate_days(latitude, longitude, day_indices(dates))
+            if grid_values is not None:
+                values = {variable.lower(): value for variable, value in grid_values.items()}
+                source = 'climatology_grid'
+        
+        if values is None and self.use_database and self.model_repo:
+            day_of_year = (dates - dates.astype('datetime64[Y]')).astype(np.int64) + 1
+            features = np.column_stack([
+                np.full(days, latitude), np.full(days, longitude),
+                day_of_year, months, month_days
+            ]).astype(np.float64)
+            values, training = await self._predict_window_with_database(latitude, longitude, features)
+            source = 'database_models'
+            if training is not None:
+                return {
+                    'success': False,
+                    'error': 'Models not available for every variable',
+                    'dates': date_strings,
+                    'source': source,
+                    'training': training
+                }
+        
+        if values is None:
+            # Predictor de archivos: no admite lotes, se predice día a día
+            results = await asyncio.gather(*(
+                self.predict_climate(latitude, longitude, target_date) for target_date in date_strings
+            ))
+            if not all(result.get('success') for result in results):
+                return {'success': False, 'error': 'No prediction method available for the window'}
+            return {
+                'success': True,
+                'dates': date_strings,
+                'predictions': {
+                    field: np.array([result['predictions'][field] for result in results], dtype=np.float64)
+                    for field in results[0]['predictions']
+                },
+                'source': results[0].get('source')
+            }
+        
+        formatted = self._format_predictions(values)
+        return {
+            'success': True,
+            'dates': date_strings,
+            'predictions': {
+                field: np.broadcast_to(np.asarray(value, dtype=np.float64), (days,))
+                for field, value in formatted.items()
+            },
+            'source': source
+        }
+    
+    async def _predict_window_with_database(self, latitude: float, longitude: float,
+                                            features: np.ndarray) -> Tuple[Dict[str, np.ndarray], Optional[Dict]]:
+        """
+        Un predict por variable sobre todas las filas de features
+        
+        Returns:
+            (valores por variable, None) o, si falta alguna variable, el
+            estado de entrenamiento de _request_training con las faltantes
+        """
+        with PREDICT_STAGE_SECONDS.time(stage='model_assignments'):
+            best_models = await self.model_repo.get_model_assignments(
+                latitude, longitude, self.variable_names
+            )
+        
+        training = self._request_training(latitude, longitude, best_models)
+        if training is not None:
+            return {}, training
+        
+        values = {}
+        for variable_name in self.variable_names:
+            models = best_models.get(variable_name, [])
+            if not models:
+                continue
+            model = await self._get_model(models[0].model_id)
+            if model is None:
+                continue
+            try:
+                with PREDICT_STAGE_SECONDS.time(stage='predict_window'):
+                    values[variable_name.lower()] = np.asarray(model.predict(features), dtype=np.float64)
+            except Exception as e:
+                logger.error(f"Error prediciendo ventana de {variable_name}: {e}")
+        
+        # Modelos asignados que no se pudieron cargar o evaluar: tampoco se rellenan
+        missing = [variable for variable in self.variable_names if variable.lower() not in values]
+        if missing:
+            return values, {'missing_variables': missing, 'job': None}
+        return values, None
+    
+    def _predict_with_grid(self, latitude: float, longitude: float, target_date: str) -> Optional[Dict]:
+        """Predicción por interpolación bilineal sobre la rejilla precalculada"""
+        values = self.grid.interpolate(latitude, longitude, target_date)
+        if values is None:
+            return None
+        
+        predictions = {variable.lower(): value for variable, value in values.items()}
+        return {
+            'success': True,
+            'location': {'latitude': latitude, 'longitude': longitude},
+            'prediction_date': target_date,
+            'predictions': self._format_predictions(predictions),
+            'generated_at': datetime.now().isoformat(),
+            'source': 'climatology_grid'
+        }
+    
     async def _predict_with_database(self, latitude: float, longitude: float, target_date: str) -> Dict:
         """Predicción usando modelos de base de datos"""
         
         try:
             # 1. Verificar caché
-            cached_prediction = await self.model_repo.get_cached_prediction(
-                latitude, longitude, target_date
-            )
+            with PREDICT_STAGE_SECONDS.time(stage='cache_lookup'):
+                cached_prediction = await self.model_repo.get_cached_prediction(
+                    latitude, longitude, target_date
+                )
             if cached_prediction:
-                return {
+                PREDICTION_CACHE_REQUESTS.inc(result='hit')
+                result = {
                     'success': True,
                     'location': {'latitude': latitude, 'longitude': longitude},
                     'prediction_date': target_date,
-                    'predictions': cached_prediction,
+                    'predictions': cached_prediction['predictions'],
                     'generated_at': datetime.now().isoformat(),
                     'source': 'cache'
                 }
+                model_versions = cached_prediction['model_versions'] or {}
+                if all('latitude' in version for version in model_versions.values()):
+                    # Las filas anteriores a guardar la ubicación del modelo van sin model_info
+                    result['model_info'] = self._model_info(latitude, longitude, model_versions)
+                return result
             
-            # 2. Buscar mejores modelos para cada variable
-            best_models = await self.model_repo.find_best_models(
-                latitude, longitude, self.variable_names
-            )
+            PREDICTION_CACHE_REQUESTS.inc(result='miss')
+            
+            # 2. Modelos asignados a la celda para cada variable
+            with PREDICT_STAGE_SECONDS.time(stage='model_assignments'):
+                best_models = await self.model_repo.get_model_assignments(
+                    latitude, longitude, self.variable_names
+                )
             
             predictions = {}
             model_versions = {}
+            training = self._request_training(latitude, longitude, best_models)
             
             # 3. Hacer predicciones para cada variable
             for variable_name in self.variable_names:
@@ -112,28 +436,34 @@ class EnhancedClimatePredictor:
                 
                 if models:
                     # Usar el mejor modelo (primero en la lista)
-                    best_model_record = models[0]
-                    model = await self.model_repo.load_model(best_model_record.id)
+                    best_model = models[0]
+                    load_start = time.perf_counter()
+                    model = await self._get_model(best_model.model_id)
+                    load_elapsed = time.perf_counter() - load_start
+                    PREDICT_STAGE_SECONDS.observe(load_elapsed, stage='load_model')
                     
                     if model:
                         try:
                             # Preparar features para predicción
+                            predict_start = time.perf_counter()
                             features = self._prepare_features(latitude, longitude, target_date)
                             prediction_value = model.predict([features])[0]
+                            predict_elapsed = time.perf_counter() - predict_start
+                            PREDICT_STAGE_SECONDS.observe(predict_elapsed, stage='predict')
                             
                             predictions[variable_name.lower()] = float(prediction_value)
                             model_versions[variable_name] = {
-                                'model_id': best_model_record.id,
-                                'accuracy': best_model_record.accuracy_score,
-                                'distance_km': self.model_repo.calculate_distance(
-                                    latitude, longitude,
-                                    best_model_record.latitude, best_model_record.longitude
-                                )
+                                'model_id': best_model.model_id,
+                                'accuracy': best_model.accuracy_score,
+                                'latitude': best_model.latitude,
+                                'longitude': best_model.longitude
                             }
                             
-                            # Registrar uso del modelo
+                            # Registrar uso del modelo (tiempo real de carga + inferencia)
                             await self.model_repo.update_model_usage(
-                                best_model_record.id, 50.0, True
+                                best_model.model_id,
+                                (load_elapsed + predict_elapsed) * 1000,
+                                True
                             )
                             
                         except Exception as e:
@@ -141,37 +471,57 @@ class EnhancedClimatePredictor:
                             predictions[variable_name.lower()] = 0.0
             
             # 4. Formatear resultado
-            formatted_predictions = {
-                'temperature_c': predictions.get('temperature_c', 20.0),
-                'temperature_max_c': predictions.get('temperature_c', 20.0) + 5,
-                'temperature_min_c': predictions.get('temperature_c', 20.0) - 5,
-                'humidity_percent': predictions.get('humidity_percent', 65.0),
-                'pressure_kpa': predictions.get('pressure_kpa', 81.0),
-                'precipitation_mm_per_day': predictions.get('precipitation_mm_per_day', 1.0),
-                'cloud_cover_percent': predictions.get('cloud_cover_percent', 40.0),
-                'wind_speed_ms': 2.5
-            }
-            
-            # 5. Guardar en caché
-            await self.model_repo.cache_prediction(
-                latitude, longitude, target_date, 
-                formatted_predictions, model_versions
-            )
+            formatted_predictions = self._format_predictions(predictions)
             
-            return {
+            result = {
                 'success': True,
                 'location': {'latitude': latitude, 'longitude': longitude},
                 'prediction_date': target_date,
                 'predictions': formatted_predictions,
                 'generated_at': datetime.now().isoformat(),
                 'source': 'database_models',
-                'model_info': model_versions
+                'model_info': self._model_info(latitude, longitude, model_versions)
             }
+            if training is not None:
+                # Valores por defecto: no se cachean para usar los modelos en cuanto existan
+                result['training'] = training
+                return result
+            
+            # 5. Guardar en caché
+            with PREDICT_STAGE_SECONDS.time(stage='cache_write'):
+                await self.model_repo.cache_prediction(
+                    latitude, longitude, target_date, 
+                    formatted_predictions, model_versions
+                )
+            
+            return result
         
         except Exception as e:
             logger.error(f"Error en _predict_with_database: {e}")
             raise
     
+    def _request_training(self, latitude: float, longitude: float,
+                          best_models: Dict[str, list]) -> Optional[Dict]:
+        """
+        Encolar el entrenamiento de las variables sin modelos cerca del punto
+        
+        Returns:
+            None si todas las variables tienen modelo; si no, las variables
+            faltantes y el estado del trabajo de entrenamiento (None sin cola
+            o con la cola llena)
+        """
+        missing = [variable for variable in self.variable_names if not best_models.get(variable)]
+        if not missing:
+            return None
+        
+        job = None
+        if self.training_queue is not None:
+            job = self.training_queue.enqueue(latitude, longitude, missing)
+        return {
+            'missing_variables': missing,
+            'job': job.to_dict() if job is not None else None
+        }
+    
     async def _predict_with_files(self, latitude: float, longitude: float, target_date: str) -> Dict:
         """Fallback: predicción usando FunctionalClimatePredictor"""
         
@@ -209,16 +559,7 @@ class EnhancedClimatePredictor:
                 # Adaptar formato de respuesta
                 predictions_data = prediction.get('predictions', {})
                 
-                formatted_predictions = {
-                    'temperature_c': predictions_data.get('temperature_c', 20.0),
-                    'temperature_max_c': predictions_data.get('temperature_c', 20.0) + 5,
-                    'temperature_min_c': predictions_data.get('temperature_c', 20.0) - 5,
-                    'humidity_percent': predictions_data.get('humidity_percent', 65.0),
-                    'pressure_kpa': predictions_data.get('pressure_kpa', 81.0),
-                    'precipitation_mm_per_day': predictions_data.get('precipitation_mm_per_day', 1.0),
-                    'cloud_cover_percent': predictions_data.get('cloud_cover_percent', 40.0),
-                    'wind_speed_ms': 2.5
-                }
+                formatted_predictions = self._format_predictions(predictions_data)
                 
                 return {
                     'success': True,
@@ -239,6 +580,19 @@ class EnhancedClimatePredictor:
                 'source': 'file_fallback'
             }
     
+    def _format_predictions(self, predictions: Dict[str, float]) -> Dict[str, float]:
+        """Formatear predicciones por variable al esquema de respuesta de la API"""
+        return {
+            'temperature_c': predictions.get('temperature_c', 20.0),
+            'temperature_max_c': predictions.get('temperature_c', 20.0) + 5,
+            'temperature_min_c': predictions.get('temperature_c', 20.0) - 5,
+            'humidity_percent': predictions.get('humidity_percent', 65.0),
+            'pressure_kpa': predictions.get('pressure_kpa', 81.0),
+            'precipitation_mm_per_day': predictions.get('precipitation_mm_per_day', 1.0),
+            'cloud_cover_percent': predictions.get('cloud_cover_percent', 40.0),
+            'wind_speed_ms': 2.5
+        }
+    
     def _prepare_features(self, latitude: float, longitude: float, target_date: str) -> List[float]:
         """Preparar features para el modelo ML"""
         try:
@@ -292,7 +646,34 @@ class EnhancedClimatePredictor:
         return model_id
     
     async def get_stats(self) -> Dict:
-        """Obtener estadísticas del sistema"""
+        """
+        Obtener estadísticas del sistema desde caché.
+        
+        Si el valor expiró se devuelve el anterior y se refresca en segundo plano,
+        así las sondas frecuentes no lanzan agregados sobre la base de datos.
+        """
+        if self._stats_cache is None:
+            if self._stats_refresh is None:
+                self._stats_refresh = asyncio.create_task(self._refresh_stats())
+            return await asyncio.shield(self._stats_refresh)
+        
+        if (time.monotonic() - self._stats_cached_at >= self.stats_ttl_seconds
+                and self._stats_refresh is None):
+            self._stats_refresh = asyncio.create_task(self._refresh_stats())
+        return self._stats_cache
+    
+    async def _refresh_stats(self) -> Dict:
+        try:
+            stats = await self._compute_stats()
+            if stats.get('source') != 'error':
+                self._stats_cache = stats
+                self._stats_cached_at = time.monotonic()
+            return stats
+        finally:
+            self._stats_refresh = None
+    
+    async def _compute_stats(self) -> Dict:
+        """Calcular estadísticas del sistema"""
         try:
             if self.use_database and self.model_repo:
                 return await self.model_repo.get_model_stats()
@@ -0,0 +1,115 @@
+# backend/app/ml/flat_model.py
+"""
+Representación plana (arrays NumPy) de ensambles de árboles de scikit-learn.
+
+Un GradientBoostingRegressor se reduce a seis arrays con todos los nodos de
+todos los árboles concatenados, más la constante inicial y el learning rate.
+La predicción recorre todos los árboles a la vez con operaciones vectorizadas
+y reproduce la de scikit-learn (mismas comparaciones en float32).
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+# Nombre y dtype de cada array del formato plano
+ARRAY_DTYPES = {
+    'feature': np.int32,     # feature evaluada en el nodo (0 en hojas)
+    'threshold': np.float64, # umbral: va a la izquierda si x <= umbral
+    'left': np.int32,        # índice global del hijo izquierdo (-1 en hojas)
+    'right': np.int32,       # índice global del hijo derecho (-1 en hojas)
+    'value': np.float64,     # valor de la hoja
+    'roots': np.int32        # índice global de la raíz de cada árbol
+}
+
+
+class FlatTreeEnsemble:
+    """Ensamble de árboles de regresión: base + scale * Σ hoja(árbol, x)"""
+
+    __slots__ = ('feature', 'threshold', 'left', 'right', 'value', 'roots',
+                 'base', 'scale', 'n_features', 'max_depth')
+
+    def __init__(self, arrays: Dict[str, np.ndarray], base: float, scale: float,
+                 n_features: int, max_depth: int):
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.base = float(base)
+        self.scale = float(scale)
+        self.n_features = int(n_features)
+        self.max_depth = int(max_depth)
+
+    @property
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in ARRAY_DTYPES}
+
+    @property
+    def metadata(self) -> Dict:
+        return {
+            'base': self.base,
+            'scale': self.scale,
+            'n_features': self.n_features,
+            'max_depth': self.max_depth
+        }
+
+    def predict(self, X) -> np.ndarray:
+        # scikit-learn compara features en float32 contra umbrales en float64
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], self.roots.shape[0])).copy()
+        for _ in range(self.max_depth):
+            left = self.left[nodes]
+            internal = left >= 0
+            if not internal.any():
+                break
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(internal, np.where(go_left, left, self.right[nodes]), nodes)
+
+        return self.base + self.scale * self.value[nodes].sum(axis=1)
+
+
+def from_sklearn(model) -> Optional[FlatTreeEnsemble]:
+    """
+    Convertir un GradientBoostingRegressor entrenado al formato plano.
+
+    Devuelve None para estimadores no soportados (se siguen usando vía joblib).
+    """
+    if isinstance(model, FlatTreeEnsemble):
+        return model
+
+    from sklearn.ensemble import GradientBoostingRegressor
+
+    if not isinstance(model, GradientBoostingRegressor) or not hasattr(model, 'estimators_'):
+        return None
+
+    n_features = model.n_features_in_
+    trees = [estimator[0].tree_ for estimator in model.estimators_]
+
+    parts = {name: [] for name in ARRAY_DTYPES}
+    offset = 0
+    max_depth = 0
+    for tree in trees:
+        is_leaf = tree.children_left < 0
+        parts['feature'].append(np.where(is_leaf, 0, tree.feature))
+        parts['threshold'].append(tree.threshold)
+        parts['left'].append(np.where(is_leaf, -1, tree.children_left + offset))
+        parts['right'].append(np.where(is_leaf, -1, tree.children_right + offset))
+        parts['value'].append(tree.value[:, 0, 0])
+        parts['roots'].append(np.array([offset]))
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    arrays = {
+        name: np.ascontiguousarray(np.concatenate(chunks), dtype=ARRAY_DTYPES[name])
+        for name, chunks in parts.items()
+    }
+
+    # Predicción inicial (init_) constante: se evalúa sobre una fila cualquiera
+    base = model._raw_predict_init(np.zeros((1, n_features), dtype=np.float32))[0, 0]
+
+    return FlatTreeEnsemble(arrays, base, model.learning_rate, n_features, max_depth)
@@ -0,0 +1,229 @@
+# backend/app/ml/model_format.py
+"""
+Formato compacto de almacenamiento de modelos (EWFM).
+
+Un GradientBoostingRegressor se guarda solo con lo que necesita la inferencia:
+los arrays del formato plano (flat_model.py) empaquetados uno tras otro y
+comprimidos, sin los atributos de entrenamiento del estimador de scikit-learn.
+
+    magic "EWFM" | versión u8 | códec u8 | reservado u16 | largo cabecera u32
+    cabecera JSON (metadatos + [nombre, dtype, largo] de cada array)
+    arrays empaquetados y comprimidos (zstd si está instalado, si no zlib)
+
+Umbrales y valores de hoja van en float32. El umbral se redondea hacia abajo
+al float32 anterior, así `x <= umbral` da lo mismo para cualquier x float32
+(scikit-learn compara las features en float32). Al cargar los arrays vuelven a
+los dtypes de ARRAY_DTYPES.
+
+Los estimadores que no se pueden aplanar se guardan con joblib comprimido; la
+carga distingue ambos formatos por el magic, así que conviven en la misma tabla.
+
+Migración de los modelos ya guardados:
+    python -m app.ml.model_format --database-url "$DATABASE_URL"
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import struct
+import zlib
+from typing import Dict, Tuple
+
+import numpy as np
+
+from app.ml.flat_model import ARRAY_DTYPES, FlatTreeEnsemble, from_sklearn
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard está en requirements.txt
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"EWFM"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sBBHI")
+
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_NAMES = {CODEC_ZLIB: "zlib", CODEC_ZSTD: "zstd"}
+
+# ewfm: formato compacto cuando el estimador lo admite; joblib: pickle completo
+MODEL_STORAGE_FORMAT = os.getenv("MODEL_STORAGE_FORMAT", "ewfm")
+MODEL_COMPRESSION_LEVEL = int(os.getenv("MODEL_COMPRESSION_LEVEL", "9"))
+
+# dtypes en disco (más angostos que los de ARRAY_DTYPES)
+STORAGE_DTYPES = {
+    'feature': np.uint16,
+    'threshold': np.float32,
+    'left': np.int32,
+    'right': np.int32,
+    'value': np.float32,
+    'roots': np.int32
+}
+
+
+def is_compact(data: bytes) -> bool:
+    return data[:len(MAGIC)] == MAGIC
+
+
+def _compress(payload: bytes, level: int) -> Tuple[int, bytes]:
+    if zstandard is not None:
+        return CODEC_ZSTD, zstandard.ZstdCompressor(level=level).compress(payload)
+    return CODEC_ZLIB, zlib.compress(payload, min(level, 9))
+
+
+def _decompress(codec: int, payload: bytes) -> bytes:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("Modelo comprimido con zstd y el paquete zstandard no está instalado")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload)
+    raise ValueError(f"Códec de modelo desconocido: {codec}")
+
+
+def _threshold_to_float32(threshold: np.ndarray) -> np.ndarray:
+    """Mayor float32 <= umbral: conserva el resultado de x <= umbral para x float32"""
+    rounded = threshold.astype(np.float32)
+    too_high = rounded.astype(np.float64) > threshold
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+
+def encode_flat(model: FlatTreeEnsemble, level: int = MODEL_COMPRESSION_LEVEL) -> bytes:
+    """Serializar un ensamble plano en formato EWFM"""
+    arrays = model.arrays
+    packed = {
+        name: (_threshold_to_float32(array) if name == 'threshold' else array).astype(STORAGE_DTYPES[name])
+        for name, array in arrays.items()
+    }
+    header = json.dumps({
+        'kind': 'tree_ensemble',
+        'metadata': model.metadata,
+        'arrays': [[name, np.dtype(STORAGE_DTYPES[name]).str, len(array)] for name, array in packed.items()]
+    }).encode("utf-8")
+    codec, payload = _compress(b"".join(array.tobytes() for array in packed.values()), level)
+    return HEADER.pack(MAGIC, FORMAT_VERSION, codec, 0, len(header)) + header + payload
+
+
+def decode_flat(data: bytes) -> FlatTreeEnsemble:
+    """Cargar un modelo EWFM como FlatTreeEnsemble"""
+    magic, version, codec, _, header_length = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("No es un modelo EWFM")
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Versión de formato de modelo no soportada: {version}")
+
+    start = HEADER.size
+    header = json.loads(data[start:start + header_length])
+    payload = _decompress(codec, data[start + header_length:])
+
+    arrays = {}
+    offset = 0
+    for name, dtype, length in header['arrays']:
+        dtype = np.dtype(dtype)
+        stored = np.frombuffer(payload, dtype=dtype, count=length, offset=offset)
+        arrays[name] = stored.astype(ARRAY_DTYPES[name])
+        offset += length * dtype.itemsize
+    return FlatTreeEnsemble(arrays, **header['metadata'])
+
+
+def serialize_model(model, storage_format: str = MODEL_STORAGE_FORMAT) -> bytes:
+    """Bytes a guardar en model_blobs: EWFM si el estimador lo admite, si no joblib"""
+    if storage_format == "ewfm":
+        flat = from_sklearn(model)
+        if flat is not None:
+            return encode_flat(flat)
+
+    import joblib  # diferido: solo para estimadores sin formato compacto
+
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer, compress=3)
+    return buffer.getvalue()
+
+
+def deserialize_model(data: bytes):
+    """Cargar un modelo guardado en cualquiera de los dos formatos"""
+    if is_compact(data):
+        return decode_flat(data)
+
+    import joblib  # diferido: solo para blobs en formato joblib
+
+    return joblib.load(io.BytesIO(data))
+
+
+def convert_blob(data: bytes):
+    """Blob en EWFM si se puede convertir; None si ya lo está o no es convertible"""
+    if is_compact(data):
+        return None
+    flat = from_sklearn(deserialize_model(data))
+    if flat is None:
+        return None
+    return encode_flat(flat)
+
+
+async def migrate_models(model_repo, batch_size: int = 20, dry_run: bool = False) -> Dict[str, int]:
+    """Reescribir en EWFM los blobs guardados con joblib"""
+    async with model_repo._acquire() as conn:
+        model_ids = [row['model_id'] for row in await conn.fetch(
+            "SELECT model_id FROM model_blobs WHERE substring(model_data FROM 1 FOR 4) <> $1 ORDER BY model_id",
+            MAGIC
+        )]
+
+    loop = asyncio.get_running_loop()
+    totals = {'converted': 0, 'skipped': 0, 'bytes_before': 0, 'bytes_after': 0}
+    for index in range(0, len(model_ids), batch_size):
+        batch = model_ids[index:index + batch_size]
+        async with model_repo._acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT model_id, model_data FROM model_blobs WHERE model_id = ANY($1::int[])", batch
+            )
+
+        updates = []
+        for row in rows:
+            converted = await loop.run_in_executor(None, convert_blob, row['model_data'])
+            if converted is None:
+                totals['skipped'] += 1
+                continue
+            totals['converted'] += 1
+            totals['bytes_before'] += len(row['model_data'])
+            totals['bytes_after'] += len(converted)
+            updates.append((row['model_id'], converted))
+
+        if updates and not dry_run:
+            async with model_repo._acquire() as conn, model_repo._timed('migrate_model_blobs'):
+                await conn.executemany(
+                    "UPDATE model_blobs SET model_data = $2 WHERE model_id = $1", updates
+                )
+        logger.info(f"Modelos procesados: {index + len(batch)}/{len(model_ids)}")
+    return totals
+
+
+async def _main(args):
+    from app.database.model_repository import ModelRepository
+
+    model_repo = ModelRepository(args.database_url)
+    await model_repo.connect()
+    try:
+        totals = await migrate_models(model_repo, args.batch_size, args.dry_run)
+    finally:
+        await model_repo.disconnect()
+
+    ratio = totals['bytes_after'] / totals['bytes_before'] if totals['bytes_before'] else 0
+    logger.info(
+        f"Convertidos: {totals['converted']}, sin convertir: {totals['skipped']}, "
+        f"{totals['bytes_before'] / 1e6:.1f} MB -> {totals['bytes_after'] / 1e6:.1f} MB ({ratio:.1%})"
+        + (" [dry-run]" if args.dry_run else "")
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convertir los modelos guardados con joblib al formato EWFM")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--dry-run", action="store_true")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,252 @@
+# backend/app/ml/regional_ingest.py
+"""
+Ingesta regional de NASA POWER para el dataset de entrenamiento.
+
+Recolectar una malla punto por punto (get_complete_climate_projection) cuesta
+una llamada por punto. El endpoint regional mensual de POWER devuelve todos
+los puntos de su malla (0.5° x 0.625°, MERRA-2) dentro de un rectángulo, con
+dos límites: cada lado entre REGIONAL_MIN_SPAN_DEG y REGIONAL_MAX_SPAN_DEG
+grados y un solo parámetro por petición. La región se parte en mosaicos que
+cumplen esos límites (uno menor al mínimo se amplía y el resultado se recorta
+a la región) y se hace una llamada por mosaico y parámetro: un estado completo
+son unas decenas de llamadas en lugar de miles.
+
+Cada respuesta GeoJSON se decodifica directo a columnas NumPy y el resultado
+se escribe particionado por celda de nivel DATASET_CELL_LEVEL:
+
+    <dataset_dir>/cell=<geo_cell>/part-<inicio>-<fin>.csv
+
+con las columnas de data_collector (Date, Year, Month, Latitude, Longitude y
+una por variable; NaN = sin dato). TrainingQueue lee la partición de la celda
+antes de ir a POWER.
+
+    python -m app.ml.regional_ingest --lat-min 15.6 --lat-max 18.7 \\
+        --lon-min -98.6 --lon-max -93.8 --start 2001 --end 2024 --output data/regional
+"""
+import argparse
+import asyncio
+import glob
+import logging
+import math
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.database import geocell
+from app.ml.data_collector import COLUMN_NAMES
+from app.ml.training_queue import REGIONAL_DATASET_DIR, TRAINING_CELL_LEVEL
+from app.services.upstream import BULK
+
+logger = logging.getLogger(__name__)
+
+REGIONAL_MIN_SPAN_DEG = float(os.getenv("REGIONAL_MIN_SPAN_DEG", "2"))
+REGIONAL_MAX_SPAN_DEG = float(os.getenv("REGIONAL_MAX_SPAN_DEG", "10"))
+# Un nivel más grueso que las celdas de entrenamiento: con la malla de POWER
+# una celda de nivel 9 (~0.35° de latitud) puede no tener ningún punto, una de
+# nivel 8 siempre tiene alguno
+DATASET_CELL_LEVEL = TRAINING_CELL_LEVEL - 1
+
+MISSING_VALUE = -999.0
+KEY_COLUMNS = ['Latitude', 'Longitude', 'Date']
+
+Tile = Tuple[float, float, float, float]
+
+
+def _split_span(low: float, high: float, bound_low: float, bound_high: float,
+                min_span: float, max_span: float) -> List[Tuple[float, float]]:
+    count = max(1, math.ceil((high - low) / max_span - 1e-9))
+    step = (high - low) / count
+    spans = []
+    for index in range(count):
+        start, end = low + index * step, low + (index + 1) * step
+        if end - start < min_span:
+            start = min(max((start + end - min_span) / 2, bound_low), bound_high - min_span)
+            end = start + min_span
+        spans.append((round(start, 4), round(end, 4)))
+    return spans
+
+
+def plan_tiles(lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+               min_span: float = REGIONAL_MIN_SPAN_DEG,
+               max_span: float = REGIONAL_MAX_SPAN_DEG) -> List[Tile]:
+    """Mosaicos (lat_min, lat_max, lon_min, lon_max) que cubren la región dentro de los límites de POWER"""
+    return [
+        (tile_lat_min, tile_lat_max, tile_lon_min, tile_lon_max)
+        for tile_lat_min, tile_lat_max in _split_span(lat_min, lat_max, -90, 90, min_span, max_span)
+        for tile_lon_min, tile_lon_max in _split_span(lon_min, lon_max, -180, 180, min_span, max_span)
+    ]
+
+
+def decode_features(data: dict, parameter: str) -> pd.DataFrame:
+    """Respuesta GeoJSON de un parámetro a columnas (Latitude, Longitude, Date, valor)"""
+    latitudes, longitudes, periods, values = [], [], [], []
+    for feature in data.get("features", []):
+        lon, lat = feature["geometry"]["coordinates"][:2]
+        series = feature.get("properties", {}).get("parameter", {}).get(parameter) or {}
+        if not series:
+            continue
+        periods.append(np.array(list(series.keys())).astype(np.int64))
+        values.append(np.fromiter(series.values(), dtype=np.float64, count=len(series)))
+        latitudes.append(np.full(len(series), lat, dtype=np.float64))
+        longitudes.append(np.full(len(series), lon, dtype=np.float64))
+    if not periods:
+        return pd.DataFrame(columns=[*KEY_COLUMNS, COLUMN_NAMES.get(parameter, parameter)])
+
+    period = np.concatenate(periods)
+    value = np.concatenate(values)
+    keep = period % 100 <= 12  # el mes 13 es el promedio anual, no una muestra
+    value[value == MISSING_VALUE] = np.nan
+    return pd.DataFrame({
+        'Latitude': np.concatenate(latitudes)[keep],
+        'Longitude': np.concatenate(longitudes)[keep],
+        'Date': period[keep],
+        COLUMN_NAMES.get(parameter, parameter): value[keep]
+    })
+
+
+async def _fetch_tile(tile: Tile, parameter: str, start: int, end: int,
+                      community: str) -> Optional[pd.DataFrame]:
+    from app.services.nasapower import REGIONAL_URL, _request_power
+
+    tile_lat_min, tile_lat_max, tile_lon_min, tile_lon_max = tile
+    status, data, url = await _request_power({
+        "latitude-min": tile_lat_min,
+        "latitude-max": tile_lat_max,
+        "longitude-min": tile_lon_min,
+        "longitude-max": tile_lon_max,
+        "parameters": parameter,
+        "community": community,
+        "start": start,
+        "end": end,
+        "format": "JSON"
+    }, BULK, endpoint=REGIONAL_URL)
+    if status != 200:
+        logger.warning(f"POWER regional devolvió {status} para {parameter} en {tile} ({url})")
+        return None
+    return decode_features(data, parameter)
+
+
+async def collect_region(lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+                         start: int, end: int, parameters: Optional[List[str]] = None,
+                         community: str = "RE") -> pd.DataFrame:
+    """
+    Dataset de todos los puntos de la malla de POWER dentro de la región
+
+    Una fila por (punto, mes) con una columna por parámetro; los parámetros
+    que fallen quedan como NaN.
+    """
+    parameters = list(parameters or COLUMN_NAMES)
+    tiles = plan_tiles(lat_min, lat_max, lon_min, lon_max)
+    logger.info(f"Región en {len(tiles)} mosaicos x {len(parameters)} parámetros = "
+                f"{len(tiles) * len(parameters)} llamadas a POWER")
+
+    # El planificador de nasapower limita la concurrencia de las llamadas BULK
+    frames = await asyncio.gather(*(
+        _fetch_tile(tile, parameter, start, end, community)
+        for parameter in parameters for tile in tiles
+    ))
+
+    columns = []
+    for index, parameter in enumerate(parameters):
+        tile_frames = [frame for frame in frames[index * len(tiles):(index + 1) * len(tiles)]
+                       if frame is not None and not frame.empty]
+        if not tile_frames:
+            continue
+        # Mosaicos vecinos comparten los puntos del borde
+        merged = pd.concat(tile_frames, ignore_index=True).drop_duplicates(KEY_COLUMNS)
+        columns.append(merged.set_index(KEY_COLUMNS))
+    if not columns:
+        return pd.DataFrame()
+
+    values = pd.concat(columns, axis=1).reset_index()
+    values = values[values['Latitude'].between(lat_min, lat_max)
+                    & values['Longitude'].between(lon_min, lon_max)]
+    dataset = pd.DataFrame({
+        'Date': values['Date'].astype(str),
+        'Year': values['Date'] // 100,
+        'Month': values['Date'] % 100,
+        'Latitude': values['Latitude'],
+        'Longitude': values['Longitude']
+    })
+    dataset = pd.concat([dataset, values.drop(columns=KEY_COLUMNS)], axis=1)
+    return dataset.sort_values(KEY_COLUMNS, ignore_index=True)
+
+
+def dataset_cell(latitude: float, longitude: float) -> int:
+    """Partición del dataset que contiene el punto"""
+    return geocell.truncate(geocell.encode(latitude, longitude), DATASET_CELL_LEVEL)
+
+
+def write_partitions(dataset: pd.DataFrame, dataset_dir: str, start: int, end: int) -> int:
+    """Escribir el dataset particionado por celda; devuelve cuántas particiones se escribieron"""
+    points = dataset[['Latitude', 'Longitude']].drop_duplicates()
+    cells = {
+        (lat, lon): dataset_cell(lat, lon)
+        for lat, lon in zip(points['Latitude'], points['Longitude'])
+    }
+    cell_column = [cells[point] for point in zip(dataset['Latitude'], dataset['Longitude'])]
+
+    written = 0
+    for cell, partition in dataset.groupby(cell_column):
+        directory = os.path.join(dataset_dir, f"cell={cell}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{start}-{end}.csv")
+        # Escritura atómica: un lector nunca ve una partición a medias
+        partition.to_csv(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
+        written += 1
+    return written
+
+
+def load_partition(dataset_dir: str, cell: int) -> pd.DataFrame:
+    """Filas de la partición de la celda (de cualquier nivel más fino que DATASET_CELL_LEVEL)"""
+    cell = geocell.truncate(cell, DATASET_CELL_LEVEL)
+    paths = sorted(glob.glob(os.path.join(dataset_dir, f"cell={cell}", "part-*.csv")))
+    if not paths:
+        return pd.DataFrame()
+    frame = pd.concat([pd.read_csv(path, dtype={'Date': str}) for path in paths], ignore_index=True)
+    # Periodos que se solapan: gana el archivo que ordena último (el de inicio posterior)
+    return frame.drop_duplicates(KEY_COLUMNS, keep='last').sort_values(KEY_COLUMNS, ignore_index=True)
+
+
+async def ingest_region(lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+                        start: int, end: int, dataset_dir: str,
+                        parameters: Optional[List[str]] = None) -> Dict[str, int]:
+    """Descargar una región y escribirla en el dataset particionado"""
+    dataset = await collect_region(lat_min, lat_max, lon_min, lon_max, start, end, parameters)
+    if dataset.empty:
+        return {'points': 0, 'rows': 0, 'partitions': 0}
+    partitions = await asyncio.get_running_loop().run_in_executor(
+        None, write_partitions, dataset, dataset_dir, start, end
+    )
+    return {
+        'points': len(dataset[['Latitude', 'Longitude']].drop_duplicates()),
+        'rows': len(dataset),
+        'partitions': partitions
+    }
+
+
+async def _main(args):
+    totals = await ingest_region(
+        args.lat_min, args.lat_max, args.lon_min, args.lon_max,
+        args.start, args.end, args.output, args.parameters.split(",")
+    )
+    logger.info(f"Puntos: {totals['points']}, filas: {totals['rows']}, "
+                f"particiones: {totals['partitions']} en {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingesta regional de NASA POWER al dataset de entrenamiento")
+    parser.add_argument("--lat-min", type=float, required=True)
+    parser.add_argument("--lat-max", type=float, required=True)
+    parser.add_argument("--lon-min", type=float, required=True)
+    parser.add_argument("--lon-max", type=float, required=True)
+    parser.add_argument("--start", type=int, default=2001)
+    parser.add_argument("--end", type=int, default=datetime.now().year - 1)
+    parser.add_argument("--parameters", default=",".join(COLUMN_NAMES))
+    parser.add_argument("--output", default=REGIONAL_DATASET_DIR or "data/regional")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
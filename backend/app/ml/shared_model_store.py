@@ -0,0 +1,203 @@
+# backend/app/ml/shared_model_store.py
+"""
+Almacén de modelos compartido entre workers de uvicorn.
+
+Todos los modelos activos se publican, en formato plano (ver flat_model.py),
+en un único archivo dentro de un directorio en memoria compartida
+(p. ej. /dev/shm). Cada worker lo mapea en solo lectura, así que la memoria
+de modelos no crece al añadir workers.
+
+Estructura del directorio:
+    CURRENT             nombre de la generación activa (se reemplaza atómicamente)
+    .lock               flock que elige a un único worker constructor
+    gen-<n>/models.bin  arrays concatenados (alineados a 64 bytes)
+    gen-<n>/index.json  offsets por modelo + huella de los modelos publicados
+
+Refresco coordinado: cada worker intenta periódicamente tomar el lock; el que
+lo obtiene compara la huella de modelos activos de la base de datos con la de
+la generación publicada y, si cambió, construye una generación nueva. Los
+demás solo detectan el cambio de CURRENT y vuelven a mapear.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from app.ml.flat_model import ARRAY_DTYPES, FlatTreeEnsemble, from_sklearn
+
+logger = logging.getLogger(__name__)
+
+ALIGNMENT = 64
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = ".lock"
+
+
+class SharedModelStore:
+    def __init__(self, directory: str, check_interval_s: float = 1.0):
+        self.directory = directory
+        self.check_interval_s = check_interval_s
+        os.makedirs(directory, exist_ok=True)
+
+        self.generation: Optional[str] = None
+        self.fingerprint: Optional[str] = None
+        self._index: Dict[str, Dict] = {}
+        self._buffer: Optional[np.memmap] = None
+        self._models: Dict[int, FlatTreeEnsemble] = {}
+        self._next_check = 0.0
+
+    # --- lectura (todos los workers) ---
+
+    def _read_current(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.directory, CURRENT_FILE), 'r') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def attach(self) -> bool:
+        """Mapear la generación publicada si cambió desde el último mapeo"""
+        generation = self._read_current()
+        if generation is None or generation == self.generation:
+            return generation is not None
+
+        gen_dir = os.path.join(self.directory, generation)
+        with open(os.path.join(gen_dir, "index.json"), 'r') as f:
+            index = json.load(f)
+
+        bin_path = os.path.join(gen_dir, "models.bin")
+        buffer = np.memmap(bin_path, dtype=np.uint8, mode='r') if os.path.getsize(bin_path) else None
+
+        self._index = index['models']
+        self._buffer = buffer
+        self._models = {}
+        self.fingerprint = index['fingerprint']
+        self.generation = generation
+        logger.info(f"Almacén compartido: generación {generation} mapeada ({len(self._index)} modelos)")
+        return True
+
+    def _maybe_attach(self):
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval_s
+            try:
+                self.attach()
+            except (OSError, ValueError) as e:
+                logger.error(f"Error mapeando almacén compartido: {e}")
+
+    def get(self, model_id: int) -> Optional[FlatTreeEnsemble]:
+        """Modelo plano (vistas sobre el mmap) o None si no está publicado"""
+        self._maybe_attach()
+
+        model = self._models.get(model_id)
+        if model is not None:
+            return model
+
+        entry = self._index.get(str(model_id))
+        if entry is None or self._buffer is None:
+            return None
+
+        arrays = {}
+        for name, (offset, length) in entry['arrays'].items():
+            dtype = np.dtype(ARRAY_DTYPES[name])
+            arrays[name] = self._buffer[offset:offset + length * dtype.itemsize].view(dtype)
+        model = FlatTreeEnsemble(arrays, **entry['metadata'])
+        self._models[model_id] = model
+        return model
+
+    @property
+    def attached(self) -> bool:
+        return self.generation is not None
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    # --- escritura (solo el worker que obtiene el lock) ---
+
+    def publish(self, models: Dict[int, FlatTreeEnsemble], fingerprint: str) -> str:
+        """Escribir una generación nueva y activarla de forma atómica"""
+        generation = f"gen-{time.time_ns()}"
+        gen_dir = os.path.join(self.directory, generation)
+        os.makedirs(gen_dir)
+
+        index = {}
+        offset = 0
+        with open(os.path.join(gen_dir, "models.bin"), 'wb') as f:
+            for model_id, model in models.items():
+                entry = {}
+                for name, array in model.arrays.items():
+                    data = np.ascontiguousarray(array, dtype=ARRAY_DTYPES[name]).tobytes()
+                    padding = (-offset) % ALIGNMENT
+                    f.write(b"\0" * padding)
+                    offset += padding
+                    entry[name] = [offset, len(array)]
+                    f.write(data)
+                    offset += len(data)
+                index[str(model_id)] = {'arrays': entry, 'metadata': model.metadata}
+
+        with open(os.path.join(gen_dir, "index.json"), 'w') as f:
+            json.dump({'fingerprint': fingerprint, 'models': index}, f)
+
+        tmp_current = os.path.join(self.directory, f"{CURRENT_FILE}.tmp")
+        with open(tmp_current, 'w') as f:
+            f.write(generation)
+        os.replace(tmp_current, os.path.join(self.directory, CURRENT_FILE))
+
+        self._cleanup(keep={generation, self.generation})
+        return generation
+
+    def _cleanup(self, keep):
+        """Borrar generaciones antiguas (se conserva la anterior para workers rezagados)"""
+        for name in os.listdir(self.directory):
+            if name.startswith("gen-") and name not in keep:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def _published_fingerprint(self) -> Optional[str]:
+        generation = self._read_current()
+        if generation is None:
+            return None
+        try:
+            with open(os.path.join(self.directory, generation, "index.json"), 'r') as f:
+                return json.load(f)['fingerprint']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    async def sync_from_repository(self, model_repo) -> bool:
+        """
+        Publicar los modelos activos si cambiaron. Devuelve True si este worker
+        construyó una generación nueva.
+        """
+        lock_fd = os.open(os.path.join(self.directory, LOCK_FILE), os.O_CREAT | os.O_RDWR)
+        try:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False  # otro worker está construyendo
+
+            fingerprint = await model_repo.get_active_models_fingerprint()
+            if fingerprint == self._published_fingerprint():
+                return False
+
+            loop = asyncio.get_running_loop()
+            models = {}
+            skipped = 0
+            async for model_id, model_data in model_repo.iter_active_model_blobs():
+                model = await loop.run_in_executor(None, model_repo.deserialize_model, model_data)
+                flat = await loop.run_in_executor(None, from_sklearn, model)
+                if flat is None:
+                    skipped += 1
+                    continue
+                models[model_id] = flat
+
+            generation = await loop.run_in_executor(None, self.publish, models, fingerprint)
+            logger.info(f"Almacén compartido: generación {generation} publicada "
+                        f"({len(models)} modelos, {skipped} no convertibles)")
+            return True
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
@@ -0,0 +1,293 @@
+# backend/app/ml/training_queue.py
+"""
+Cola de entrenamiento bajo demanda para ubicaciones sin modelos.
+
+Cuando una predicción no encuentra modelos de alguna variable dentro del radio
+de búsqueda, la celda del punto (nivel TRAINING_CELL_LEVEL) se encola una sola
+vez. El worker descarga de NASA POWER los últimos años de la celda (prioridad
+masiva), entrena en un pool de procesos un modelo por variable faltante y los
+guarda con save_model, que invalida las asignaciones de las celdas vecinas: las
+siguientes peticiones de la zona ya usan los modelos nuevos. La petición que
+dispara el entrenamiento no espera; responde con los valores por defecto.
+
+La deduplicación es por proceso: con varios workers de uvicorn cada uno tiene
+su cola, pero antes de descargar se vuelve a comprobar qué variables siguen sin
+modelo.
+
+Con REGIONAL_DATASET_DIR se entrena primero con la partición de la celda del
+dataset regional (app.ml.regional_ingest) y solo se va a POWER si no existe.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.database import geocell
+from app.services.metrics import TRAINING_JOBS, TRAINING_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+TRAINING_QUEUE_ENABLED = os.getenv("TRAINING_QUEUE_ENABLED", "true").lower() in ("1", "true", "yes")
+TRAINING_PROCESSES = int(os.getenv("TRAINING_PROCESSES", "2"))
+# Celdas de ~40 km x 80 km: desde el centro, cualquier punto de la celda queda
+# dentro del radio de búsqueda de modelos (100 km)
+TRAINING_CELL_LEVEL = int(os.getenv("TRAINING_CELL_LEVEL", "9"))
+TRAINING_MAX_QUEUED = int(os.getenv("TRAINING_MAX_QUEUED", "100"))
+# Una celda ya procesada (con o sin éxito) no se vuelve a encolar antes de este intervalo
+TRAINING_RETRY_AFTER_S = float(os.getenv("TRAINING_RETRY_AFTER_S", "3600"))
+TRAINING_HISTORY_SIZE = int(os.getenv("TRAINING_HISTORY_SIZE", "256"))
+TRAINING_MIN_SAMPLES = 24
+# Dataset particionado por celda escrito por app.ml.regional_ingest (opcional)
+REGIONAL_DATASET_DIR = os.getenv("REGIONAL_DATASET_DIR")
+
+MISSING_VALUE = -999.0
+# Mismo orden que EnhancedClimatePredictor._prepare_features; las series son
+# mensuales, así que cada mes se representa con su día 15
+FEATURE_NAMES = ['latitude', 'longitude', 'day_of_year', 'month', 'day']
+MID_MONTH_DAY = 15
+
+ACTIVE_STATES = ('queued', 'fetching', 'training')
+
+
+def train_variable_model(frame, latitude: float, longitude: float, variable_name: str):
+    """
+    Entrenar el modelo de una variable (se ejecuta en un proceso del pool)
+
+    Las features usan la posición de cada fila (Latitude/Longitude): una
+    partición regional trae varios puntos de la malla de POWER.
+
+    Returns:
+        (variable, modelo o None, métricas o {'error': ...})
+    """
+    import numpy as np
+    from app.ml.model_trainer import train_single_model
+
+    if variable_name not in frame.columns:
+        return variable_name, None, {'error': 'variable ausente en los datos de NASA POWER'}
+
+    frame = frame[frame[variable_name].notna() & (frame[variable_name] != MISSING_VALUE)]
+    if len(frame) < TRAINING_MIN_SAMPLES:
+        return variable_name, None, {'error': f'datos insuficientes ({len(frame)} meses)'}
+
+    dates = np.array(
+        [f"{year:04d}-{month:02d}-{MID_MONTH_DAY:02d}" for year, month in zip(frame['Year'], frame['Month'])],
+        dtype='datetime64[D]'
+    )
+    day_of_year = (dates - dates.astype('datetime64[Y]')).astype(np.int64) + 1
+    X = np.column_stack([
+        frame['Latitude'].to_numpy(), frame['Longitude'].to_numpy(),
+        day_of_year, frame['Month'].to_numpy(), np.full(len(frame), MID_MONTH_DAY)
+    ]).astype(np.float64)
+
+    result = train_single_model(X, frame[variable_name].to_numpy(dtype=np.float64), variable_name)
+    if result is None:
+        return variable_name, None, {'error': 'falló el entrenamiento'}
+    model, metrics = result
+    return variable_name, model, {name: float(value) for name, value in metrics.items()}
+
+
+@dataclass
+class TrainingJob:
+    cell: int
+    latitude: float
+    longitude: float
+    variables: List[str]
+    state: str = 'queued'
+    enqueued_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    trained: Dict[str, Dict] = field(default_factory=dict)
+    skipped: Dict[str, str] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        job = asdict(self)
+        job['progress'] = {
+            'done': len(self.trained) + len(self.skipped),
+            'total': len(self.variables)
+        }
+        for name in ('enqueued_at', 'started_at', 'finished_at'):
+            if job[name] is not None:
+                job[name] = datetime.fromtimestamp(job[name]).isoformat()
+        return job
+
+
+class TrainingQueue:
+    """Cola deduplicada por celda con un worker async y un pool de procesos"""
+
+    def __init__(self, model_repo,
+                 processes: int = TRAINING_PROCESSES,
+                 cell_level: int = TRAINING_CELL_LEVEL,
+                 max_queued: int = TRAINING_MAX_QUEUED,
+                 retry_after_s: float = TRAINING_RETRY_AFTER_S,
+                 history_size: int = TRAINING_HISTORY_SIZE,
+                 dataset_dir: Optional[str] = REGIONAL_DATASET_DIR):
+        self.model_repo = model_repo
+        self.processes = processes
+        self.cell_level = cell_level
+        self.max_queued = max_queued
+        self.retry_after_s = retry_after_s
+        self.history_size = history_size
+        self.dataset_dir = dataset_dir
+        self.jobs: "OrderedDict[int, TrainingJob]" = OrderedDict()
+        self._queue: "asyncio.Queue[TrainingJob]" = asyncio.Queue()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self):
+        # spawn: los procesos hijos no heredan el event loop ni el pool de asyncpg
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._worker = asyncio.create_task(self._run_worker())
+        TRAINING_QUEUE_DEPTH.callback = lambda: {(): float(self._queue.qsize())}
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        TRAINING_QUEUE_DEPTH.callback = None
+
+    def cell(self, latitude: float, longitude: float) -> int:
+        return geocell.truncate(geocell.encode(latitude, longitude), self.cell_level)
+
+    def cell_center(self, cell: int) -> Tuple[float, float]:
+        return geocell.decode(geocell.parent(cell, self.cell_level), self.cell_level)
+
+    def enqueue(self, latitude: float, longitude: float, variables: List[str]) -> Optional[TrainingJob]:
+        """
+        Encolar la celda del punto si no está ya en curso ni se procesó hace poco
+
+        Returns:
+            El trabajo de la celda (nuevo o existente), o None si la cola está llena
+        """
+        cell = self.cell(latitude, longitude)
+        job = self.jobs.get(cell)
+        if job is not None and (job.state in ACTIVE_STATES
+                                or time.time() - job.finished_at < self.retry_after_s):
+            return job
+
+        if self._queue.qsize() >= self.max_queued:
+            TRAINING_JOBS.inc(result='rejected')
+            return None
+
+        center_lat, center_lon = self.cell_center(cell)
+        job = TrainingJob(cell, round(center_lat, 4), round(center_lon, 4), list(variables))
+        self.jobs[cell] = job
+        self.jobs.move_to_end(cell)
+        self._prune_history()
+        self._queue.put_nowait(job)
+        TRAINING_JOBS.inc(result='queued')
+        logger.info(f"Celda {cell} encolada para entrenar {', '.join(variables)}")
+        return job
+
+    def _prune_history(self):
+        finished = [cell for cell, job in self.jobs.items() if job.state not in ACTIVE_STATES]
+        for cell in finished[:max(0, len(self.jobs) - self.history_size)]:
+            del self.jobs[cell]
+
+    def status(self, latitude: Optional[float] = None, longitude: Optional[float] = None) -> Dict:
+        """Profundidad de la cola y progreso por celda (o solo la celda del punto)"""
+        if latitude is not None and longitude is not None:
+            job = self.jobs.get(self.cell(latitude, longitude))
+            jobs = [job] if job is not None else []
+        else:
+            jobs = list(self.jobs.values())
+        return {
+            'queue_depth': self._queue.qsize(),
+            'running': sum(1 for job in self.jobs.values() if job.state in ('fetching', 'training')),
+            'processes': self.processes,
+            'jobs': [job.to_dict() for job in reversed(jobs)]
+        }
+
+    async def _run_worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._train(job)
+            except Exception as e:
+                logger.error(f"Error entrenando la celda {job.cell}: {e}")
+                job.state, job.error = 'failed', str(e)
+            finally:
+                job.finished_at = time.time()
+                TRAINING_JOBS.inc(result=job.state)
+                self._queue.task_done()
+
+    async def _train(self, job: TrainingJob):
+        from app.ml.data_collector import collect_data
+
+        job.state, job.started_at = 'fetching', time.time()
+
+        # Otro proceso (u otra celda vecina) pudo haber cubierto ya la zona
+        best_models = await self.model_repo.find_best_models(job.latitude, job.longitude, job.variables)
+        for variable in job.variables:
+            if best_models.get(variable):
+                job.skipped[variable] = 'ya cubierta'
+        variables = [variable for variable in job.variables if variable not in job.skipped]
+        if not variables:
+            job.state = 'done'
+            return
+
+        frame = await self._load_dataset(job.cell)
+        if frame.empty:
+            frame = await collect_data((job.latitude, job.longitude), datetime.now().year)
+        if frame.empty:
+            raise RuntimeError("NASA POWER no devolvió datos para la celda")
+        frame = frame[frame['Month'] <= 12]  # el mes 13 de POWER es el promedio anual
+
+        job.state = 'training'
+        loop = asyncio.get_running_loop()
+        futures = [
+            loop.run_in_executor(self._executor, train_variable_model,
+                                 frame, job.latitude, job.longitude, variable)
+            for variable in variables
+        ]
+        for future in asyncio.as_completed(futures):
+            variable, model, metrics = await future
+            if model is None:
+                job.skipped[variable] = metrics['error']
+                continue
+            model_id = await self.model_repo.save_model(
+                job.latitude, job.longitude, variable, model, self._metadata(metrics)
+            )
+            job.trained[variable] = {'model_id': model_id, 'r2_score': round(metrics['test_r2'], 4)}
+
+        job.state = 'done' if job.trained else 'failed'
+        if not job.trained:
+            job.error = 'no se entrenó ningún modelo'
+
+    async def _load_dataset(self, cell: int):
+        """Partición regional de la celda, o un DataFrame vacío si no hay dataset"""
+        import pandas as pd
+        from app.ml.regional_ingest import load_partition
+
+        if not self.dataset_dir:
+            return pd.DataFrame()
+        return await asyncio.get_running_loop().run_in_executor(None, load_partition, self.dataset_dir, cell)
+
+    @staticmethod
+    def _metadata(metrics: Dict[str, float]) -> Dict:
+        # accuracy_score y r2_score son DECIMAL(5, 4): se acotan al rango de la columna
+        r2 = max(metrics['test_r2'], -9.9999)
+        return {
+            'training_date': datetime.now().isoformat(),
+            'model_type': 'GradientBoostingRegressor',
+            'source': 'on_demand',
+            'features': FEATURE_NAMES,
+            'metrics': metrics,
+            'accuracy_score': round(min(max(r2, 0.0), 1.0), 4),
+            'mean_absolute_error': metrics['test_mae'],
+            'r2_score': round(r2, 4),
+            'data_points_count': int(metrics['train_samples'] + metrics['test_samples'])
+        }
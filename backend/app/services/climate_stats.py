@@ -0,0 +1,199 @@
+# backend/app/services/climate_stats.py
+"""
+Estadísticas climáticas históricas de una ubicación (/climate/stats).
+
+En lugar de mandar años de series mensuales al cliente, se resumen en el
+servidor. La respuesta POWER ({parámetro: {YYYYMM: valor}}) se decodifica a
+columnas y se acomoda en un cubo parámetro x año x mes (NaN = sin dato); cada
+estadística es una reducción de NumPy sobre ese cubo:
+
+- normals: media de cada mes del año
+- p10 / p50 / p90: percentiles de cada mes entre los años del periodo
+- rain_probability (solo precipitación): fracción de años en que el mes
+  promedió al menos RAIN_THRESHOLD_MM_PER_DAY; las series mensuales de POWER
+  no tienen resolución diaria
+- trend_per_decade: pendiente de mínimos cuadrados de las anomalías mensuales
+  (valor menos la normal del mes), en unidades por década
+
+Los resultados se guardan por celda de observaciones (CLIMATE_CELL_LEVEL), así
+que los puntos cercanos comparten descarga y cálculo. Los calculados sobre una
+respuesta degradada (stale de POWER con el circuito abierto, o datos locales
+con huecos que POWER no completó) llevan "stale" o "partial": true y no se guardan.
+"""
+import os
+import time
+import warnings
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.database import geocell
+from app.database.climate_store import CLIMATE_CELL_LEVEL
+from app.services.metrics import CLIMATE_STATS_REQUESTS
+from app.services.nasapower import _get_power
+from app.services.upstream import INTERACTIVE, degraded_marker
+
+CLIMATE_STATS_CACHE_SIZE = int(os.getenv("CLIMATE_STATS_CACHE_SIZE", "1024"))
+CLIMATE_STATS_CACHE_TTL_S = float(os.getenv("CLIMATE_STATS_CACHE_TTL_S", "86400"))
+RAIN_THRESHOLD_MM_PER_DAY = float(os.getenv("RAIN_THRESHOLD_MM_PER_DAY", "1.0"))
+# Años con datos necesarios para reportar una tendencia
+MIN_TREND_YEARS = 5
+STATS_DECIMALS = 2
+
+MISSING_VALUE = -999.0
+PERCENTILES = (10, 50, 90)
+PRECIPITATION_PARAMETER = "PRECTOTCORR"
+# Mismos parámetros que /climate/complete
+STATS_PARAMETERS = {
+    "PRECTOTCORR": "mm/day",
+    "T2M": "°C",
+    "T2M_MAX": "°C",
+    "T2M_MIN": "°C",
+    "RH2M": "%",
+    "WS2M": "m/s",
+    "PS": "kPa",
+    "CLOUD_AMT": "%"
+}
+
+_stats_cache: "OrderedDict[tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+
+def build_cube(series: Dict[str, Dict[str, float]], parameters: List[str],
+               start: int, end: int) -> np.ndarray:
+    """Cubo parámetro x año x mes a partir de las series POWER (el mes 13 se descarta)"""
+    cube = np.full((len(parameters), end - start + 1, 12), np.nan)
+    for index, parameter in enumerate(parameters):
+        data = series.get(parameter) or {}
+        if not data:
+            continue
+        periods = np.array(list(data.keys())).astype(np.int64)
+        values = np.fromiter(data.values(), dtype=np.float64, count=len(data))
+        year, month = np.divmod(periods, 100)
+        keep = ((month >= 1) & (month <= 12) & (year >= start) & (year <= end)
+                & (values != MISSING_VALUE))
+        cube[index, year[keep] - start, month[keep] - 1] = values[keep]
+    return cube
+
+
+def summarize(cube: np.ndarray) -> Dict[str, np.ndarray]:
+    """Normales, percentiles, probabilidad de lluvia y tendencia de cada parámetro del cubo"""
+    valid = ~np.isnan(cube)
+    with warnings.catch_warnings():
+        # Meses sin ningún dato: las reducciones nan* devuelven NaN y avisan
+        warnings.simplefilter("ignore", RuntimeWarning)
+        normals = np.nanmean(cube, axis=1)
+        percentiles = np.nanpercentile(cube, PERCENTILES, axis=1)
+
+    # Tiempo en años desde el inicio del periodo, a mitad de cada mes
+    years, months = cube.shape[1], cube.shape[2]
+    t = np.arange(years)[:, None] + (np.arange(months)[None, :] + 0.5) / months
+    samples = valid.sum(axis=(1, 2))
+    t_mean = np.where(valid, t, 0).sum(axis=(1, 2)) / np.maximum(samples, 1)
+    dt = np.where(valid, t - t_mean[:, None, None], 0)
+    anomalies = np.where(valid, cube - normals[:, None, :], 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = (dt * anomalies).sum(axis=(1, 2)) / (dt ** 2).sum(axis=(1, 2))
+
+    years_with_data = valid.any(axis=2).sum(axis=1)
+    trend = np.where(years_with_data >= MIN_TREND_YEARS, slope * 10, np.nan)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        wet_share = (valid & (cube >= RAIN_THRESHOLD_MM_PER_DAY)).sum(axis=1) / valid.sum(axis=1)
+
+    return {
+        "normals": normals,
+        "percentiles": percentiles,
+        "wet_share": wet_share,
+        "trend_per_decade": trend,
+        "years": years_with_data
+    }
+
+
+def _rounded(values: np.ndarray) -> List[Optional[float]]:
+    return [None if np.isnan(value) else value for value in np.round(values, STATS_DECIMALS).tolist()]
+
+
+def stats_payload(cube: np.ndarray, parameters: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Estadísticas por parámetro; cada lista tiene 12 valores (enero a diciembre)"""
+    summary = summarize(cube)
+    result = {}
+    for index, parameter in enumerate(parameters):
+        trend = float(summary["trend_per_decade"][index])
+        stats = {
+            "units": STATS_PARAMETERS[parameter],
+            "years": int(summary["years"][index]),
+            "normals": _rounded(summary["normals"][index]),
+            **{f"p{q}": _rounded(summary["percentiles"][i, index]) for i, q in enumerate(PERCENTILES)},
+            "trend_per_decade": None if np.isnan(trend) else round(trend, STATS_DECIMALS + 1)
+        }
+        if parameter == PRECIPITATION_PARAMETER:
+            stats["rain_probability"] = _rounded(summary["wet_share"][index])
+        result[parameter] = stats
+    return result
+
+
+def _cached_stats(key: tuple) -> Optional[Dict[str, Any]]:
+    entry = _stats_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, stats = entry
+    if expires_at <= time.monotonic():
+        del _stats_cache[key]
+        return None
+    _stats_cache.move_to_end(key)
+    return stats
+
+
+def _store_stats(key: tuple, stats: Dict[str, Any]):
+    _stats_cache[key] = (time.monotonic() + CLIMATE_STATS_CACHE_TTL_S, stats)
+    _stats_cache.move_to_end(key)
+    while len(_stats_cache) > CLIMATE_STATS_CACHE_SIZE:
+        _stats_cache.popitem(last=False)
+
+
+async def get_climate_stats(lat: float, lon: float, start: int, end: int,
+                            parameters: Optional[List[str]] = None,
+                            priority: int = INTERACTIVE) -> Dict[str, Any]:
+    """Estadísticas históricas de la celda del punto (mismo formato de error que /climate*)"""
+    parameters = list(parameters or STATS_PARAMETERS)
+    cell = geocell.truncate(geocell.encode(lat, lon), CLIMATE_CELL_LEVEL)
+    key = (cell, start, end, tuple(parameters))
+    stats = _cached_stats(key)
+    if stats is not None:
+        CLIMATE_STATS_REQUESTS.inc(result="cache")
+        return stats
+
+    center_lat, center_lon = geocell.decode(geocell.parent(cell, CLIMATE_CELL_LEVEL), CLIMATE_CELL_LEVEL)
+    status, data, url = await _get_power({
+        "latitude": round(center_lat, 4),
+        "longitude": round(center_lon, 4),
+        "start": start,
+        "end": end,
+        "parameters": ",".join(parameters),
+        "community": "RE",
+        "format": "JSON"
+    }, priority)
+    if status != 200:
+        CLIMATE_STATS_REQUESTS.inc(result="error")
+        return {
+            "error": f"NASA POWER API devolvió {status}",
+            "url": url
+        }
+
+    cube = build_cube(data.get("properties", {}).get("parameter", {}), parameters, start, end)
+    stats = {
+        "cell": {"latitude": round(center_lat, 4), "longitude": round(center_lon, 4)},
+        "period": {"start": start, "end": end},
+        "rain_threshold_mm_per_day": RAIN_THRESHOLD_MM_PER_DAY,
+        "parameters": stats_payload(cube, parameters),
+        "data_source": data.get("header", {}).get("sources", [])
+    }
+    marker = degraded_marker(url)
+    if marker is not None:
+        stats[marker] = True
+        CLIMATE_STATS_REQUESTS.inc(result=marker)
+        return stats
+    _store_stats(key, stats)
+    CLIMATE_STATS_REQUESTS.inc(result="computed")
+    return stats
@@ -0,0 +1,87 @@
+# backend/app/services/comfort.py
+"""
+Índice de confort para eventos al aire libre.
+
+Mismas reglas que el nivel de confort de la descripción por reglas de Gemini,
+escritas como operaciones de NumPy: funcionan igual con un pronóstico (escalares)
+que con una ventana completa de días (arreglos).
+
+    temperatura dentro de la banda del evento   +2
+    precipitación < 2 mm/día                    +2
+    viento < 5 m/s                              +1
+    humedad entre 40 y 70 %                     +1
+"""
+from typing import Dict, Tuple
+
+import numpy as np
+
+MAX_COMFORT_SCORE = 6
+
+# Banda de temperatura cómoda (°C) por tipo de evento
+DEFAULT_TEMPERATURE_BAND = (20.0, 26.0)
+EVENT_TEMPERATURE_BANDS: Dict[str, Tuple[float, float]] = {
+    'outdoor': DEFAULT_TEMPERATURE_BAND,
+    'wedding': DEFAULT_TEMPERATURE_BAND,
+    'concert': (18.0, 26.0),
+    'sports': (15.0, 22.0),
+    'beach': (25.0, 32.0)
+}
+
+# Puntaje mínimo de cada nivel, de mayor a menor
+COMFORT_LEVELS = (
+    (5, 'Excelente'),
+    (3, 'Bueno'),
+    (2, 'Regular'),
+    (0, 'Malo')
+)
+
+
+def temperature_band(event_type: str) -> Tuple[float, float]:
+    """Banda de temperatura del tipo de evento (la general si no se conoce)"""
+    return EVENT_TEMPERATURE_BANDS.get(event_type, DEFAULT_TEMPERATURE_BAND)
+
+
+def comfort_score(temperature, precipitation, wind_speed, humidity,
+                  band: Tuple[float, float] = DEFAULT_TEMPERATURE_BAND) -> np.ndarray:
+    """Puntaje de confort 0..MAX_COMFORT_SCORE elemento a elemento"""
+    temperature = np.asarray(temperature, dtype=np.float64)
+    humidity = np.asarray(humidity, dtype=np.float64)
+    low, high = band
+    return (
+        2 * ((temperature >= low) & (temperature <= high))
+        + 2 * (np.asarray(precipitation) < 2)
+        + (np.asarray(wind_speed) < 5)
+        + ((humidity >= 40) & (humidity <= 70))
+    ).astype(np.int64)
+
+
+def comfort_level(score: int) -> str:
+    """Nombre del nivel de confort para un puntaje"""
+    for minimum, level in COMFORT_LEVELS:
+        if score >= minimum:
+            return level
+    return COMFORT_LEVELS[-1][1]
+
+
+def rank_days(predictions: Dict[str, np.ndarray],
+              band: Tuple[float, float] = DEFAULT_TEMPERATURE_BAND) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ordenar los días de una ventana del más al menos cómodo
+
+    A igual puntaje se prefiere menos lluvia y después la temperatura más
+    cercana al centro de la banda.
+
+    Args:
+        predictions: Arreglos por variable con el esquema de respuesta de /predict
+
+    Returns:
+        (índices ordenados, puntajes)
+    """
+    temperature = predictions['temperature_c']
+    precipitation = predictions['precipitation_mm_per_day']
+    scores = comfort_score(temperature, precipitation,
+                           predictions['wind_speed_ms'], predictions['humidity_percent'], band)
+    band_distance = np.abs(temperature - (band[0] + band[1]) / 2)
+    # lexsort ordena por la última clave primero
+    order = np.lexsort((band_distance, precipitation, -scores))
+    return order, scores
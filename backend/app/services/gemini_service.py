@@ -1,10 +1,47 @@
 """
 Servicio de Gemini AI para generar descripciones climáticas inteligentes
 """
+import asyncio
+import hashlib
+import json
+import logging
 import os
-import google.generativeai as genai
-from typing import Dict, Any, Optional
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 from datetime import datetime
+from app.services.metrics import (
+    DESCRIPTION_REQUESTS,
+    UPSTREAM_FIRST_CHUNK_SECONDS,
+    UPSTREAM_REQUEST_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+# Nombres reportados en el campo "model" de las descripciones
+GEMINI_MODEL_NAME = "gemini-2.5-flash"
+FALLBACK_MODEL_NAME = "fallback-rules-based"
+
+# Presupuesto por llamada del modo por lotes (tokens estimados, ~4 caracteres por token)
+GEMINI_BATCH_MAX_PROMPT_TOKENS = int(os.getenv("GEMINI_BATCH_MAX_PROMPT_TOKENS", "6000"))
+GEMINI_BATCH_MAX_OUTPUT_TOKENS = int(os.getenv("GEMINI_BATCH_MAX_OUTPUT_TOKENS", "8192"))
+BATCH_OUTPUT_TOKENS_PER_ITEM = 300
+
+# Caché en proceso de descripciones generadas por Gemini (clave: hash del prompt)
+DESCRIPTION_CACHE_SIZE = int(os.getenv("DESCRIPTION_CACHE_SIZE", "1024"))
+DESCRIPTION_CACHE_TTL_S = float(os.getenv("DESCRIPTION_CACHE_TTL_S", "21600"))
+
+COMFORT_DESCRIPTIONS = {
+    "Excelente": "Condiciones ideales para actividades al aire libre.",
+    "Bueno": "Condiciones favorables con precauciones menores.",
+    "Regular": "Condiciones aceptables pero con algunas molestias.",
+    "Malo": "Condiciones adversas, planificar con cuidado."
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación local de tokens (evita una llamada a count_tokens por prompt)"""
+    return len(text) // 4 + 1
 
 
 class GeminiClimateService:
@@ -29,12 +66,13 @@ class GeminiClimateService:
                 "Proporciona una API key o configura la variable de entorno GEMINI_API_KEY"
             )
         
-        # Configurar Gemini
+        # Configurar Gemini (import diferido: google.generativeai es costoso de cargar)
+        import google.generativeai as genai
         genai.configure(api_key=self.api_key)
         
         # Configurar el modelo - usando gemini-2.5-flash (estable, rápido y eficiente)
         # Nota: Los modelos se especifican sin el prefijo "models/"
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.model = genai.GenerativeModel(GEMINI_MODEL_NAME)
         
         # Configuración de generación OPTIMIZADA para velocidad
         self.generation_config = {
@@ -64,6 +102,64 @@ class GeminiClimateService:
                 "threshold": "BLOCK_ONLY_HIGH"
             },
         ]
+        
+        self._init_description_cache()
+    
+    def _init_description_cache(self):
+        """Caché LRU de descripciones y tareas de generación en curso"""
+        self._description_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._description_tasks: Dict[str, asyncio.Task] = {}
+    
+    async def _generate_async(self, prompt: str, **kwargs):
+        """
+        Llamar a Gemini sin bloquear el event loop, registrando la latencia
+        
+        Args:
+            prompt: Prompt a enviar
+            **kwargs: generation_config, safety_settings, etc.
+        """
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await self.model.generate_content_async(prompt, **kwargs)
+            outcome = "ok"
+            return response
+        finally:
+            UPSTREAM_REQUEST_SECONDS.observe(
+                time.perf_counter() - start, upstream="gemini", outcome=outcome
+            )
+    
+    async def _generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """
+        Llamar a Gemini en streaming y entregar el texto de cada fragmento
+        según llega, registrando el tiempo al primer fragmento y el total
+        
+        Args:
+            prompt: Prompt a enviar
+            **kwargs: generation_config, safety_settings, etc.
+        """
+        start = time.perf_counter()
+        outcome = "error"
+        first_chunk = True
+        try:
+            response = await self.model.generate_content_async(prompt, stream=True, **kwargs)
+            async for chunk in response:
+                # .text lanza ValueError si el fragmento fue bloqueado
+                text = chunk.text
+                if first_chunk:
+                    UPSTREAM_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - start, upstream="gemini")
+                    first_chunk = False
+                if text:
+                    yield text
+            outcome = "ok"
+        except (GeneratorExit, asyncio.CancelledError):
+            # El consumidor dejó de leer (deadline o cliente desconectado)
+            outcome = "cancelled"
+            raise
+        finally:
+            UPSTREAM_REQUEST_SECONDS.observe(
+                time.perf_counter() - start, upstream="gemini", outcome=outcome
+            )
     
     def _build_climate_prompt(self, prediction_data: Dict[str, Any]) -> str:
         """
@@ -183,6 +279,87 @@ Sé específico y práctico."""
 
         return prompt
     
+    def _build_event_batch_preamble(self, event_type: str) -> str:
+        """
+        Instrucciones comunes del modo por lotes (se envían una sola vez por llamada)
+        
+        Args:
+            event_type: Tipo de evento (outdoor, sports, wedding, concert, etc.)
+        """
+        return f"""Eres un consultor experto en planificación de eventos. Analiza las condiciones climáticas predichas para un evento tipo "{event_type}" en cada una de las opciones listadas (fechas o sedes).
+
+Cada opción tiene el formato:
+[id] fecha | lat, lon | temp min-max (prom) °C | humedad % | lluvia mm | viento m/s | nubes %
+
+Responde EN ESPAÑOL únicamente con un arreglo JSON, un objeto por opción y en el mismo orden:
+[{{"id": <id>, "viability": "Excelente|Bueno|Regular|No recomendado", "risks": ["..."], "recommendations": ["..."], "plan_b": "..."}}]
+Máximo 3 riesgos y 4 recomendaciones por opción, frases cortas.
+
+Opciones:
+"""
+    
+    def _format_batch_item(self, item_id: int, prediction_data: Dict[str, Any]) -> str:
+        """Línea compacta con el pronóstico de una opción del lote"""
+        location = prediction_data.get('location', {})
+        predictions = prediction_data.get('predictions', {})
+        return (
+            f"[{item_id}] {prediction_data.get('prediction_date', 'N/A')} | "
+            f"{location.get('latitude', 'N/A')}, {location.get('longitude', 'N/A')} | "
+            f"{predictions.get('temperature_min_c', 0)}-{predictions.get('temperature_max_c', 0)} "
+            f"({predictions.get('temperature_c', 0)}) | "
+            f"{predictions.get('humidity_percent', 0)} | "
+            f"{predictions.get('precipitation_mm_per_day', 0)} | "
+            f"{predictions.get('wind_speed_ms', 0)} | "
+            f"{predictions.get('cloud_cover_percent', 0)}"
+        )
+    
+    def _split_batch(self, preamble: str, lines: List[str]) -> List[List[int]]:
+        """
+        Repartir las opciones en grupos que respeten el presupuesto de tokens
+        de entrada y de salida de una llamada
+        """
+        base_tokens = estimate_tokens(preamble)
+        max_items = max(1, GEMINI_BATCH_MAX_OUTPUT_TOKENS // BATCH_OUTPUT_TOKENS_PER_ITEM)
+        
+        groups: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = base_tokens
+        for index, line in enumerate(lines):
+            line_tokens = estimate_tokens(line)
+            if current and (current_tokens + line_tokens > GEMINI_BATCH_MAX_PROMPT_TOKENS
+                            or len(current) >= max_items):
+                groups.append(current)
+                current, current_tokens = [], base_tokens
+            current.append(index)
+            current_tokens += line_tokens
+        if current:
+            groups.append(current)
+        return groups
+    
+    def _parse_batch_response(self, text: str) -> Dict[int, Dict[str, Any]]:
+        """Extraer {id: consejo} de la respuesta JSON (tolera bloques ```json)"""
+        text = text.strip()
+        if text.startswith("```"):
+            text = text.strip("`")
+            text = text[text.find("["):]
+        items = json.loads(text)
+        return {int(item['id']): item for item in items if isinstance(item, dict) and 'id' in item}
+    
+    async def _generate_event_batch_group(self, preamble: str, lines: List[str]) -> Dict[int, Dict[str, Any]]:
+        """Una llamada a Gemini para un grupo de opciones"""
+        prompt = preamble + "\n".join(lines)
+        response = await self._generate_async(
+            prompt,
+            generation_config={
+                **self.generation_config,
+                'max_output_tokens': min(GEMINI_BATCH_MAX_OUTPUT_TOKENS,
+                                         BATCH_OUTPUT_TOKENS_PER_ITEM * len(lines)),
+                'response_mime_type': 'application/json'
+            },
+            safety_settings=self.safety_settings
+        )
+        return self._parse_batch_response(response.text)
+    
     async def generate_climate_description(
         self, 
         prediction_data: Dict[str, Any]
@@ -201,7 +378,7 @@ Sé específico y práctico."""
             prompt = self._build_climate_prompt(prediction_data)
             
             # Generar respuesta con configuración optimizada + safety settings
-            response = self.model.generate_content(
+            response = await self._generate_async(
                 prompt,
                 generation_config=self.generation_config,
                 safety_settings=self.safety_settings
@@ -218,7 +395,7 @@ Sé específico y práctico."""
             if finish_reason == 2:  # SAFETY block
                 # Intentar con prompt ultra-simple sin formateo
                 simple_prompt = self._build_simple_prompt(prediction_data)
-                response = self.model.generate_content(
+                response = await self._generate_async(
                     simple_prompt,
                     generation_config=self.generation_config,
                     safety_settings=self.safety_settings
@@ -243,13 +420,111 @@ Sé específico y práctico."""
                 "description": generated_text,
                 "prediction_data": prediction_data,
                 "generated_at": datetime.now().isoformat(),
-                "model": "gemini-2.5-flash"
+                "model": GEMINI_MODEL_NAME
             }
             
         except Exception as e:
             # Si falla completamente, generar descripción manual
             return self._generate_fallback_description(prediction_data)
     
+    def _description_key(self, prediction_data: Dict[str, Any]) -> str:
+        """El prompt solo depende de la fecha y los valores predichos"""
+        prompt = self._build_climate_prompt(prediction_data)
+        return hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+    
+    def get_cached_description(self, prediction_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Descripción de Gemini ya generada para estos valores, si sigue vigente"""
+        key = self._description_key(prediction_data)
+        entry = self._description_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, description = entry
+        if expires_at <= time.monotonic():
+            del self._description_cache[key]
+            return None
+        self._description_cache.move_to_end(key)
+        return {**description, "prediction_data": prediction_data}
+    
+    def _store_description(self, key: str, description: Dict[str, Any]):
+        self._description_cache[key] = (time.monotonic() + DESCRIPTION_CACHE_TTL_S, description)
+        self._description_cache.move_to_end(key)
+        while len(self._description_cache) > DESCRIPTION_CACHE_SIZE:
+            self._description_cache.popitem(last=False)
+    
+    def _description_task(self, key: str, prediction_data: Dict[str, Any]) -> asyncio.Task:
+        """
+        Tarea que genera la descripción y la guarda en caché. Peticiones
+        concurrentes con los mismos valores comparten la misma tarea.
+        """
+        task = self._description_tasks.get(key)
+        if task is not None:
+            return task
+        
+        async def generate():
+            try:
+                description = await self.generate_climate_description(prediction_data)
+                # Las descripciones por reglas no se guardan: se reintenta Gemini
+                if description.get("model") != FALLBACK_MODEL_NAME:
+                    self._store_description(key, description)
+                return description
+            finally:
+                self._description_tasks.pop(key, None)
+        
+        task = asyncio.create_task(generate())
+        self._description_tasks[key] = task
+        return task
+    
+    async def describe_within(self, prediction_data: Dict[str, Any], timeout_s: float) -> Dict[str, Any]:
+        """
+        Descripción con tiempo máximo de espera
+        
+        Si Gemini no termina antes de timeout_s se devuelve la descripción por
+        reglas; la generación sigue en segundo plano y llena la caché para las
+        siguientes peticiones con los mismos valores.
+        
+        Args:
+            prediction_data: Datos de predicción del endpoint /predict
+            timeout_s: Segundos disponibles para esperar a Gemini
+            
+        Returns:
+            Dict con la descripción y `source` (cache, gemini o fallback)
+        """
+        cached = self.get_cached_description(prediction_data)
+        if cached is not None:
+            DESCRIPTION_REQUESTS.inc(source="cache")
+            return {**cached, "source": "cache"}
+        
+        task = self._description_task(self._description_key(prediction_data), prediction_data)
+        try:
+            if timeout_s <= 0:
+                raise asyncio.TimeoutError
+            # shield: al vencer el plazo se deja de esperar, pero la tarea sigue
+            description = await asyncio.wait_for(asyncio.shield(task), timeout_s)
+        except asyncio.TimeoutError:
+            DESCRIPTION_REQUESTS.inc(source="timeout")
+            return {**self._generate_fallback_description(prediction_data), "source": "fallback"}
+        
+        source = "fallback" if description.get("model") == FALLBACK_MODEL_NAME else "gemini"
+        DESCRIPTION_REQUESTS.inc(source=source)
+        return {**description, "source": source}
+    
+    def stream_climate_description(self, prediction_data: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Generar la descripción climática en streaming
+        
+        Args:
+            prediction_data: Datos de predicción del endpoint /predict
+            
+        Returns:
+            Iterador asíncrono con los fragmentos de texto tal como los entrega Gemini
+        """
+        prompt = self._build_climate_prompt(prediction_data)
+        return self._generate_stream(
+            prompt,
+            generation_config=self.generation_config,
+            safety_settings=self.safety_settings
+        )
+    
     async def generate_event_planning_advice(
         self,
         prediction_data: Dict[str, Any],
@@ -270,7 +545,7 @@ Sé específico y práctico."""
             prompt = self._build_event_planning_prompt(prediction_data, event_type)
             
             # Generar respuesta sin configuraciones problemáticas
-            response = self.model.generate_content(prompt)
+            response = await self._generate_async(prompt)
             
             # Verificar respuesta válida
             if response.candidates and response.candidates[0].finish_reason == 1:
@@ -281,7 +556,7 @@ Sé específico y práctico."""
             else:
                 # Fallback: prompt simple
                 simple_prompt = f"Dame consejos para un evento tipo {event_type} con temperatura {prediction_data.get('predictions', {}).get('temperature_c')}°C"
-                response = self.model.generate_content(simple_prompt)
+                response = await self._generate_async(simple_prompt)
                 generated_text = response.text
             
             return {
@@ -290,7 +565,7 @@ Sé específico y práctico."""
                 "advice": generated_text,
                 "prediction_data": prediction_data,
                 "generated_at": datetime.now().isoformat(),
-                "model": "gemini-2.5-flash"
+                "model": GEMINI_MODEL_NAME
             }
             
         except Exception as e:
@@ -303,6 +578,66 @@ Sé específico y práctico."""
                 "generated_at": datetime.now().isoformat()
             }
     
+    async def generate_event_planning_advice_batch(
+        self,
+        predictions: List[Dict[str, Any]],
+        event_type: str = "outdoor"
+    ) -> Dict[str, Any]:
+        """
+        Consejos de planificación para varias opciones (días o sedes) en un solo prompt
+        
+        Las opciones se agrupan según el presupuesto de tokens; cada grupo es una
+        llamada a Gemini y los grupos se envían en paralelo.
+        
+        Args:
+            predictions: Lista de respuestas del endpoint /predict
+            event_type: Tipo de evento a planificar
+            
+        Returns:
+            Dict con un consejo estructurado por opción, en el orden recibido
+        """
+        preamble = self._build_event_batch_preamble(event_type)
+        lines = [self._format_batch_item(index, data) for index, data in enumerate(predictions)]
+        groups = self._split_batch(preamble, lines)
+        
+        results = await asyncio.gather(
+            *(self._generate_event_batch_group(preamble, [lines[i] for i in group]) for group in groups),
+            return_exceptions=True
+        )
+        
+        advice_by_id: Dict[int, Dict[str, Any]] = {}
+        for group, result in zip(groups, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error en lote de planificación ({len(group)} opciones): {result}")
+                continue
+            advice_by_id.update(result)
+        
+        items = []
+        for index, prediction_data in enumerate(predictions):
+            advice = advice_by_id.get(index)
+            if advice is None:
+                items.append({
+                    "success": False,
+                    "error": "Sin respuesta para esta opción",
+                    "prediction_data": prediction_data
+                })
+            else:
+                advice.pop('id', None)
+                items.append({
+                    "success": True,
+                    "advice": advice,
+                    "prediction_data": prediction_data
+                })
+        
+        return {
+            "success": any(item["success"] for item in items),
+            "event_type": event_type,
+            "items": items,
+            "llm_calls": len(groups),
+            "generated_at": datetime.now().isoformat(),
+            "model": GEMINI_MODEL_NAME
+        }
+    
     async def generate_simple_summary(
         self,
         prediction_data: Dict[str, Any]
@@ -328,7 +663,7 @@ Sé específico y práctico."""
             
             prompt = f"""Resume el clima para {date}: Temperatura {temp_min}-{temp_max}°C, Lluvia {precipitation}mm, Nubes {cloud_cover}%. Responde en 2 líneas."""
 
-            response = self.model.generate_content(prompt)
+            response = await self._generate_async(prompt)
             
             # Manejo robusto de respuesta
             if response.candidates and response.candidates[0].finish_reason == 1:
@@ -354,7 +689,8 @@ Sé específico y práctico."""
                 "generated_at": datetime.now().isoformat()
             }
     
-    def _generate_fallback_description(self, prediction_data: Dict[str, Any]) -> Dict[str, Any]:
+    @staticmethod
+    def _generate_fallback_description(prediction_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Generar descripción manual cuando Gemini falla o bloquea la respuesta.
         Esta es la última opción de fallback para garantizar siempre una respuesta.
@@ -434,25 +770,11 @@ La temperatura oscilará entre {temp_min:.1f}°C y {temp_max}°C, con un promedi
         
         description_parts.append("\n".join(recommendations))
         
-        # 4. NIVEL DE CONFORT
-        comfort_score = 0
-        if 20 <= temp <= 26:
-            comfort_score += 2
-        if precipitation < 2:
-            comfort_score += 2
-        if wind_speed < 5:
-            comfort_score += 1
-        if 40 <= humidity <= 70:
-            comfort_score += 1
-        
-        if comfort_score >= 5:
-            comfort = "**NIVEL DE CONFORT**: Excelente - Condiciones ideales para actividades al aire libre."
-        elif comfort_score >= 3:
-            comfort = "**NIVEL DE CONFORT**: Bueno - Condiciones favorables con precauciones menores."
-        elif comfort_score >= 2:
-            comfort = "**NIVEL DE CONFORT**: Regular - Condiciones aceptables pero con algunas molestias."
-        else:
-            comfort = "**NIVEL DE CONFORT**: Malo - Condiciones adversas, planificar con cuidado."
+        # 4. NIVEL DE CONFORT (reglas compartidas con /plan/best-days)
+        from app.services.comfort import comfort_level, comfort_score
+        
+        level = comfort_level(int(comfort_score(temp, precipitation, wind_speed, humidity)))
+        comfort = f"**NIVEL DE CONFORT**: {level} - {COMFORT_DESCRIPTIONS[level]}"
         
         description_parts.append(comfort)
         
@@ -464,7 +786,7 @@ La temperatura oscilará entre {temp_min:.1f}°C y {temp_max}°C, con un promedi
             "description": full_description,
             "prediction_data": prediction_data,
             "generated_at": datetime.now().isoformat(),
-            "model": "fallback-rules-based",
+            "model": FALLBACK_MODEL_NAME,
             "note": "Descripción generada mediante reglas (Gemini no disponible)"
         }
 
@@ -0,0 +1,260 @@
+# backend/app/services/metrics.py
+"""
+Métricas en formato de texto de Prometheus.
+
+Registro mínimo en proceso (contadores, histogramas y gauges calculados al
+momento del scrape) pensado para instrumentar la ruta caliente con el menor
+costo posible: observar un valor es un bisect y dos sumas.
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UPSTREAM_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0.0)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class _Timer:
+    """Context manager que observa el tiempo transcurrido en un histograma"""
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: "Histogram", labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # clave de labels -> [conteos por bucket..., +Inf, suma]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, **labels) -> _Timer:
+        return _Timer(self, labels)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackGauge:
+    """Gauge cuyo valor se calcula al exportar (sin costo en la ruta caliente)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        if self.callback is None:
+            return lines
+        try:
+            values = self.callback()
+        except Exception:
+            return lines
+        for key, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+PREDICT_STAGE_SECONDS = REGISTRY.register(Histogram(
+    "eventweather_predict_stage_seconds",
+    "Duración de cada etapa de la predicción con modelos de base de datos",
+    ["stage"]
+))
+
+UPSTREAM_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "eventweather_upstream_request_seconds",
+    "Latencia de llamadas a servicios externos (NASA POWER, Gemini)",
+    ["upstream", "outcome"],
+    buckets=UPSTREAM_BUCKETS
+))
+
+UPSTREAM_FIRST_CHUNK_SECONDS = REGISTRY.register(Histogram(
+    "eventweather_upstream_first_chunk_seconds",
+    "Tiempo hasta el primer fragmento de una respuesta en streaming",
+    ["upstream"],
+    buckets=UPSTREAM_BUCKETS
+))
+
+UPSTREAM_QUEUE_SECONDS = REGISTRY.register(Histogram(
+    "eventweather_upstream_queue_seconds",
+    "Espera por un lugar del planificador de llamadas externas",
+    ["upstream", "priority"]
+))
+
+UPSTREAM_RETRIES = REGISTRY.register(Counter(
+    "eventweather_upstream_retries_total",
+    "Reintentos de llamadas externas tras errores transitorios",
+    ["upstream"]
+))
+
+UPSTREAM_DEGRADED = REGISTRY.register(Counter(
+    "eventweather_upstream_degraded_total",
+    "Respuestas sin llamada exitosa al servicio externo (stale o failed_fast)",
+    ["upstream", "result"]
+))
+
+UPSTREAM_CIRCUIT_OPEN = REGISTRY.register(CallbackGauge(
+    "eventweather_upstream_circuit_open",
+    "1 si el circuit breaker del servicio externo está abierto o en prueba",
+    ["upstream"]
+))
+
+PREDICTION_CACHE_REQUESTS = REGISTRY.register(Counter(
+    "eventweather_prediction_cache_requests_total",
+    "Consultas al caché de predicciones por resultado",
+    ["result"]
+))
+
+
+def _prediction_cache_hit_ratio() -> Dict[Tuple[str, ...], float]:
+    hits = PREDICTION_CACHE_REQUESTS.get(result="hit")
+    total = hits + PREDICTION_CACHE_REQUESTS.get(result="miss")
+    return {(): hits / total if total else 0.0}
+
+
+PREDICTION_CACHE_HIT_RATIO = REGISTRY.register(CallbackGauge(
+    "eventweather_prediction_cache_hit_ratio",
+    "Proporción de aciertos del caché de predicciones desde el arranque",
+    callback=_prediction_cache_hit_ratio
+))
+
+DESCRIPTION_REQUESTS = REGISTRY.register(Counter(
+    "eventweather_description_requests_total",
+    "Descripciones servidas por origen (cache, gemini, fallback, timeout)",
+    ["source"]
+))
+
+CLIMATE_STATS_REQUESTS = REGISTRY.register(Counter(
+    "eventweather_climate_stats_requests_total",
+    "Estadísticas climáticas servidas por resultado (cache, computed, stale, partial, error)",
+    ["result"]
+))
+
+TRAINING_JOBS = REGISTRY.register(Counter(
+    "eventweather_training_jobs_total",
+    "Trabajos de entrenamiento bajo demanda por resultado (queued, rejected, done, failed)",
+    ["result"]
+))
+
+TRAINING_QUEUE_DEPTH = REGISTRY.register(CallbackGauge(
+    "eventweather_training_queue_depth",
+    "Celdas en espera de entrenamiento"
+))
+
+DB_QUERY_SECONDS = REGISTRY.register(Histogram(
+    "eventweather_db_query_seconds",
+    "Duración de consultas a la base de datos por consulta",
+    ["query"]
+))
+
+DB_SLOW_QUERIES = REGISTRY.register(Counter(
+    "eventweather_db_slow_queries_total",
+    "Consultas que superaron DB_SLOW_QUERY_MS",
+    ["query"]
+))
+
+DB_POOL_CONNECTIONS = REGISTRY.register(CallbackGauge(
+    "eventweather_db_pool_connections",
+    "Conexiones del pool de base de datos por estado",
+    ["state"]
+))
+
+
+def pool_connection_counts(pool) -> Dict[Tuple[str, ...], float]:
+    """Conexiones en uso / ociosas de un pool asyncpg"""
+    if pool is None:
+        return {}
+    size = pool.get_size()
+    idle = pool.get_idle_size()
+    return {("in_use",): size - idle, ("idle",): idle}
@@ -1,9 +1,193 @@
 # backend/app/services/nasa_power.py
-import aiohttp
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from app.services.metrics import (
+    UPSTREAM_CIRCUIT_OPEN,
+    UPSTREAM_DEGRADED,
+    UPSTREAM_REQUEST_SECONDS,
+    UPSTREAM_RETRIES
+)
+from app.services.power_fixtures import fixture_key, load_fixture, save_fixture
+from app.services.upstream import (
+    BULK,
+    INTERACTIVE,
+    STALE_URL_PREFIX,
+    CircuitBreaker,
+    UpstreamScheduler,
+    backoff_delay,
+    degraded_marker,
+    is_retriable
+)
 
-BASE_URL = "https://power.larc.nasa.gov/api/temporal/monthly/point"
+logger = logging.getLogger(__name__)
 
-async def get_climate_projection(lat: float, lon: float, start: int, end: int):
+# Apuntar a un servidor simulado (python -m benchmarks.stand_ins) para pruebas sin red
+BASE_URL = os.getenv("NASA_POWER_BASE_URL", "https://power.larc.nasa.gov/api/temporal/monthly/point")
+# Rectángulos de la malla de POWER (ingesta regional, app.ml.regional_ingest)
+REGIONAL_URL = os.getenv("NASA_POWER_REGIONAL_URL", "https://power.larc.nasa.gov/api/temporal/monthly/regional")
+# live: solo red; record: red + guardar cada respuesta en NASA_POWER_FIXTURE_DIR;
+# replay: responder solo desde los fixtures (sin red, 404 si falta alguno)
+NASA_POWER_MODE = os.getenv("NASA_POWER_MODE", "live")
+NASA_POWER_FIXTURE_DIR = os.getenv("NASA_POWER_FIXTURE_DIR", "power_fixtures")
+
+# Presupuesto compartido de llamadas a POWER (ver app.services.upstream)
+POWER_MAX_CONCURRENCY = int(os.getenv("POWER_MAX_CONCURRENCY", "4"))
+POWER_BULK_MAX_CONCURRENCY = int(os.getenv("POWER_BULK_MAX_CONCURRENCY", "2"))
+# Timeout y reintentos por clase: las interactivas acotan la latencia del usuario
+POWER_TIMEOUT_S = {
+    INTERACTIVE: float(os.getenv("POWER_TIMEOUT_S", "8")),
+    BULK: float(os.getenv("POWER_BULK_TIMEOUT_S", "60"))
+}
+POWER_RETRIES = {
+    INTERACTIVE: int(os.getenv("POWER_RETRIES", "1")),
+    BULK: int(os.getenv("POWER_BULK_RETRIES", "4"))
+}
+POWER_BACKOFF_BASE_S = float(os.getenv("POWER_BACKOFF_BASE_S", "0.5"))
+POWER_BACKOFF_MAX_S = float(os.getenv("POWER_BACKOFF_MAX_S", "10"))
+POWER_BREAKER_FAILURES = int(os.getenv("POWER_BREAKER_FAILURES", "5"))
+POWER_BREAKER_RESET_S = float(os.getenv("POWER_BREAKER_RESET_S", "30"))
+# Últimas respuestas buenas, servidas si POWER falla o el circuito está abierto
+POWER_STALE_CACHE_SIZE = int(os.getenv("POWER_STALE_CACHE_SIZE", "128"))
+
+POWER_SCHEDULER = UpstreamScheduler("nasa_power", POWER_MAX_CONCURRENCY, POWER_BULK_MAX_CONCURRENCY)
+POWER_BREAKER = CircuitBreaker(POWER_BREAKER_FAILURES, POWER_BREAKER_RESET_S)
+UPSTREAM_CIRCUIT_OPEN.callback = lambda: {
+    ("nasa_power",): 0.0 if POWER_BREAKER.state == "closed" else 1.0
+}
+
+_stale_responses: "OrderedDict[str, dict]" = OrderedDict()
+
+
+def _remember_response(key: str, data: dict):
+    _stale_responses[key] = data
+    _stale_responses.move_to_end(key)
+    while len(_stale_responses) > POWER_STALE_CACHE_SIZE:
+        _stale_responses.popitem(last=False)
+
+
+def _degraded_response(key: str, status: int, url: str):
+    """Última respuesta buena para estos parámetros o el error si no hay ninguna"""
+    data = _stale_responses.get(key)
+    if data is not None:
+        UPSTREAM_DEGRADED.inc(upstream="nasa_power", result="stale")
+        return 200, data, f"{STALE_URL_PREFIX}{key}"
+    UPSTREAM_DEGRADED.inc(upstream="nasa_power", result="failed_fast")
+    return status, None, url
+
+async def _fetch_power(params: dict, timeout_s: float, endpoint: str = None):
+    """Una llamada HTTP a POWER; timeouts y errores de conexión se devuelven como 504/502"""
+    import aiohttp  # diferido: no pesa en el arranque del worker
+
+    endpoint = endpoint or BASE_URL
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout_s)) as session:
+            async with session.get(endpoint, params=params) as resp:
+                data = await resp.json() if resp.status == 200 else None
+                if NASA_POWER_MODE == "record":
+                    save_fixture(NASA_POWER_FIXTURE_DIR, params, resp.status, data)
+                if resp.status != 200:
+                    return resp.status, None, str(resp.url)  # url útil para depuración
+
+                outcome = "ok"
+                return resp.status, data, str(resp.url)
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        return 504, None, endpoint
+    except aiohttp.ClientError as e:
+        logger.warning(f"Error de conexión con NASA POWER: {e}")
+        return 502, None, endpoint
+    finally:
+        UPSTREAM_REQUEST_SECONDS.observe(
+            time.perf_counter() - start, upstream="nasa_power", outcome=outcome
+        )
+
+async def _request_power(params: dict, priority: int = INTERACTIVE, endpoint: str = None):
+    """
+    Hacer la petición a NASA POWER y devolver (status, json o None, url)
+    
+    Pasa por el planificador (límite de concurrencia por prioridad), reintenta
+    errores transitorios con backoff y jitter, y con el circuito abierto
+    responde de inmediato con la última respuesta buena o un 503.
+    
+    endpoint: otra API de POWER (p. ej. REGIONAL_URL); sus respuestas no se
+    guardan para servirlas como stale.
+    """
+    if NASA_POWER_MODE == "replay":
+        fixture = load_fixture(NASA_POWER_FIXTURE_DIR, params)
+        url = f"fixture://{fixture_key(params)}"
+        if fixture is None:
+            logger.warning(f"Sin fixture de NASA POWER para {params}")
+            return 404, None, url
+        status, data = fixture
+        return status, data, url
+
+    key = fixture_key(params)
+    allowed, probe = POWER_BREAKER.allow()
+    if not allowed:
+        return _degraded_response(key, 503, "circuit-open://nasa_power")
+
+    retries = POWER_RETRIES[priority]
+    try:
+        for attempt in range(retries + 1):
+            # El lugar se libera durante la espera entre reintentos
+            async with POWER_SCHEDULER.slot(priority):
+                status, data, url = await _fetch_power(params, POWER_TIMEOUT_S[priority], endpoint)
+            if not is_retriable(status) or attempt == retries:
+                break
+            UPSTREAM_RETRIES.inc(upstream="nasa_power")
+            await asyncio.sleep(backoff_delay(attempt, POWER_BACKOFF_BASE_S, POWER_BACKOFF_MAX_S))
+    except asyncio.CancelledError:
+        # Sin resultado: si era la prueba del circuito medio abierto, se libera
+        if probe:
+            POWER_BREAKER.abandon_probe()
+        raise
+    except BaseException:
+        # Respuesta inesperada (p. ej. JSON inválido): cuenta como fallo
+        POWER_BREAKER.record_failure()
+        raise
+
+    if is_retriable(status):
+        POWER_BREAKER.record_failure()
+        return _degraded_response(key, status, url)
+
+    POWER_BREAKER.record_success()
+    if status == 200 and endpoint is None:
+        _remember_response(key, data)
+    return status, data, url
+
+# Almacén local de observaciones (app.database.climate_store); None = siempre a POWER
+_observation_store = None
+
+
+def set_observation_store(store):
+    """Servir /climate* desde el almacén local (solo va a POWER por los huecos)"""
+    global _observation_store
+    _observation_store = store
+
+
+async def _get_power(params: dict, priority: int = INTERACTIVE):
+    """(status, json POWER, url) desde el almacén local si está configurado"""
+    if _observation_store is not None:
+        try:
+            return await _observation_store.fetch(params, priority)
+        except Exception as e:
+            logger.error(f"Error en el almacén de observaciones, consultando POWER: {e}")
+    return await _request_power(params, priority)
+
+
+def _mark_degraded(payload: dict, url: str) -> dict:
+    """Agregar "stale": true o "partial": true si los datos no vienen completos de POWER"""
+    marker = degraded_marker(url)
+    if marker is not None:
+        payload[marker] = True
+    return payload
+
+async def get_climate_projection(lat: float, lon: float, start: int, end: int, priority: int = INTERACTIVE):
     params = {
         "latitude": lat,
         "longitude": lon,
@@ -14,37 +198,35 @@ async def get_climate_projection(lat: float, lon: float, start: int, end: int):
         "format": "JSON"
     }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(BASE_URL, params=params) as resp:
-            if resp.status != 200:
-                return {
-                    "error": f"NASA POWER API devolvió {resp.status}",
-                    "url": str(resp.url)  # útil para depuración
-                }
-
-            data = await resp.json()
-            props = data.get("properties", {})
-            parameters = props.get("parameter", {})
-            
-            # Intentar obtener PRECTOTCORR primero, luego PRECTOT como fallback
-            prectot = parameters.get("PRECTOTCORR") or parameters.get("PRECTOT", {})
-            
-            # Filtrar valores -999.0 (datos no disponibles)
-            filtered_data = {k: v for k, v in prectot.items() if v != -999.0}
-            
-            return {
-                "data": filtered_data,
-                "metadata": {
-                    "units": "mm/day",
-                    "parameter": "PRECTOTCORR" if "PRECTOTCORR" in parameters else "PRECTOT",
-                    "description": "Precipitation Corrected" if "PRECTOTCORR" in parameters else "Total Precipitation",
-                    "total_records": len(prectot),
-                    "valid_records": len(filtered_data),
-                    "data_source": data.get("header", {}).get("sources", [])
-                }
-            }
-
-async def get_complete_climate_projection(lat: float, lon: float, start: int, end: int):
+    status, data, url = await _get_power(params, priority)
+    if status != 200:
+        return {
+            "error": f"NASA POWER API devolvió {status}",
+            "url": url
+        }
+
+    props = data.get("properties", {})
+    parameters = props.get("parameter", {})
+    
+    # Intentar obtener PRECTOTCORR primero, luego PRECTOT como fallback
+    prectot = parameters.get("PRECTOTCORR") or parameters.get("PRECTOT", {})
+    
+    # Filtrar valores -999.0 (datos no disponibles)
+    filtered_data = {k: v for k, v in prectot.items() if v != -999.0}
+    
+    return _mark_degraded({
+        "data": filtered_data,
+        "metadata": {
+            "units": "mm/day",
+            "parameter": "PRECTOTCORR" if "PRECTOTCORR" in parameters else "PRECTOT",
+            "description": "Precipitation Corrected" if "PRECTOTCORR" in parameters else "Total Precipitation",
+            "total_records": len(prectot),
+            "valid_records": len(filtered_data),
+            "data_source": data.get("header", {}).get("sources", [])
+        }
+    }, url)
+
+async def get_complete_climate_projection(lat: float, lon: float, start: int, end: int, priority: int = INTERACTIVE):
     params = {
         "latitude": lat,
         "longitude": lon,
@@ -55,50 +237,48 @@ async def get_complete_climate_projection(lat: float, lon: float, start: int, en
         "format": "JSON"
     }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(BASE_URL, params=params) as resp:
-            if resp.status != 200:
-                return {
-                    "error": f"NASA POWER API devolvió {resp.status}",
-                    "url": str(resp.url)
-                }
-
-            data = await resp.json()
-            props = data.get("properties", {})
-            parameters = props.get("parameter", {})
-            
-            # Extraer y filtrar cada parámetro
-            result = {}
-            param_info = {
-                "PRECTOTCORR": {"units": "mm/day", "description": "Precipitación Corregida"},
-                "T2M": {"units": "°C", "description": "Temperatura a 2 metros"},
-                "T2M_MAX": {"units": "°C", "description": "Temperatura Máxima a 2 metros"},
-                "T2M_MIN": {"units": "°C", "description": "Temperatura Mínima a 2 metros"},
-                "RH2M": {"units": "%", "description": "Humedad Relativa a 2 metros"},
-                "WS2M": {"units": "m/s", "description": "Velocidad del Viento a 2 metros"},
-                "PS": {"units": "kPa", "description": "Presión Superficial"},
-                "CLOUD_AMT": {"units": "%", "description": "Nubosidad"}
-            }
-            
-            for param, info in param_info.items():
-                raw_data = parameters.get(param, {})
-                filtered = {k: v for k, v in raw_data.items() if v != -999.0}
-                result[param] = {
-                    "data": filtered,
-                    "units": info["units"],
-                    "description": info["description"],
-                    "valid_records": len(filtered)
-                }
-            
-            return {
-                "parameters": result,
-                "metadata": {
-                    "data_source": data.get("header", {}).get("sources", []),
-                    "total_parameters": len(result)
-                }
-            }
-        
-async def get_temperature_projection(lat: float, lon: float, start: int, end: int):
+    status, data, url = await _get_power(params, priority)
+    if status != 200:
+        return {
+            "error": f"NASA POWER API devolvió {status}",
+            "url": url
+        }
+
+    props = data.get("properties", {})
+    parameters = props.get("parameter", {})
+    
+    # Extraer y filtrar cada parámetro
+    result = {}
+    param_info = {
+        "PRECTOTCORR": {"units": "mm/day", "description": "Precipitación Corregida"},
+        "T2M": {"units": "°C", "description": "Temperatura a 2 metros"},
+        "T2M_MAX": {"units": "°C", "description": "Temperatura Máxima a 2 metros"},
+        "T2M_MIN": {"units": "°C", "description": "Temperatura Mínima a 2 metros"},
+        "RH2M": {"units": "%", "description": "Humedad Relativa a 2 metros"},
+        "WS2M": {"units": "m/s", "description": "Velocidad del Viento a 2 metros"},
+        "PS": {"units": "kPa", "description": "Presión Superficial"},
+        "CLOUD_AMT": {"units": "%", "description": "Nubosidad"}
+    }
+    
+    for param, info in param_info.items():
+        raw_data = parameters.get(param, {})
+        filtered = {k: v for k, v in raw_data.items() if v != -999.0}
+        result[param] = {
+            "data": filtered,
+            "units": info["units"],
+            "description": info["description"],
+            "valid_records": len(filtered)
+        }
+    
+    return _mark_degraded({
+        "parameters": result,
+        "metadata": {
+            "data_source": data.get("header", {}).get("sources", []),
+            "total_parameters": len(result)
+        }
+    }, url)
+
+async def get_temperature_projection(lat: float, lon: float, start: int, end: int, priority: int = INTERACTIVE):
     params  = {
         "latitude": lat,
         "longitude": lon,
@@ -109,42 +289,41 @@ async def get_temperature_projection(lat: float, lon: float, start: int, end: in
         "format": "JSON"
     }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(BASE_URL, params=params) as resp:
-            if resp.status != 200:
-                return{
-                    "error": f"NASA POWER API devolvió {resp.status}",
-                    "url": str(resp.url)
-                }
-            data = await resp.json()
-            props = data.get("properties", {})
-            parameters = props.get("parameter", {})
-
-            result ={}
-            term_params = {
-                "T2M": {"units": "°C", "description": "Temperatura a 2 metros"},
-                "T2M_MAX": {"units": "°C", "description": "Temperatura Máxima a 2 metros"},
-                "T2M_MIN": {"units": "°C", "description": "Temperatura Mínima a 2 metros"}
-            }
-
-            for param, info in term_params.items():
-                raw_data = parameters.get(param, {})
-                filtered = {k: v for k, v in raw_data.items() if v != -999.0}
-                result[param] = {
-                    "data": filtered,
-                    "units": info["units"],
-                    "description": info["description"],
-                    "valid_records": len(filtered)
-                }
-            return {
-                "parameters": result,
-                "metadata": {
-                    "data_source": data.get("header", {}).get("sources", []),
-                    "total_parameters": len(result)
-                }
-            }
-
-async def get_atmospheric_projection(lat: float, lon: float, start: int, end: int):
+    status, data, url = await _get_power(params, priority)
+    if status != 200:
+        return {
+            "error": f"NASA POWER API devolvió {status}",
+            "url": url
+        }
+
+    props = data.get("properties", {})
+    parameters = props.get("parameter", {})
+
+    result ={}
+    term_params = {
+        "T2M": {"units": "°C", "description": "Temperatura a 2 metros"},
+        "T2M_MAX": {"units": "°C", "description": "Temperatura Máxima a 2 metros"},
+        "T2M_MIN": {"units": "°C", "description": "Temperatura Mínima a 2 metros"}
+    }
+
+    for param, info in term_params.items():
+        raw_data = parameters.get(param, {})
+        filtered = {k: v for k, v in raw_data.items() if v != -999.0}
+        result[param] = {
+            "data": filtered,
+            "units": info["units"],
+            "description": info["description"],
+            "valid_records": len(filtered)
+        }
+    return _mark_degraded({
+        "parameters": result,
+        "metadata": {
+            "data_source": data.get("header", {}).get("sources", []),
+            "total_parameters": len(result)
+        }
+    }, url)
+
+async def get_atmospheric_projection(lat: float, lon: float, start: int, end: int, priority: int = INTERACTIVE):
     params = {
         "latitude": lat,
         "longitude": lon,
@@ -155,48 +334,46 @@ async def get_atmospheric_projection(lat: float, lon: float, start: int, end: in
         "format": "JSON"
     }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(BASE_URL, params=params) as resp:
-            if resp.status != 200:
-                return {
-                    "error": f"NASA POWER API devolvió {resp.status}",
-                    "url": str(resp.url)
-                }
-
-            data = await resp.json()
-            props = data.get("properties", {})
-            parameters = props.get("parameter", {})
-            
-            result = {}
-            atm_params = {
-                "RH2M": {"units": "%", "description": "Humedad Relativa a 2 metros"},
-                "WS2M": {"units": "m/s", "description": "Velocidad del Viento a 2 metros"},
-                "WS10M": {"units": "m/s", "description": "Velocidad del Viento a 10 metros"},
-                "WS50M": {"units": "m/s", "description": "Velocidad del Viento a 50 metros"},
-                "WD2M": {"units": "grados", "description": "Dirección del Viento a 2 metros"},
-                "WD10M": {"units": "grados", "description": "Dirección del Viento a 10 metros"},
-                "WD50M": {"units": "grados", "description": "Dirección del Viento a 50 metros"},
-                "PS": {"units": "kPa", "description": "Presión Superficial"}
-            }
-            
-            for param, info in atm_params.items():
-                raw_data = parameters.get(param, {})
-                filtered = {k: v for k, v in raw_data.items() if v != -999.0}
-                result[param] = {
-                    "data": filtered,
-                    "units": info["units"],
-                    "description": info["description"],
-                    "valid_records": len(filtered)
-                }
-            
-            return {
-                "atmospheric": result,
-                "metadata": {
-                    "data_source": data.get("header", {}).get("sources", [])
-                }
-            }
-
-async def get_solar_projection(lat: float, lon: float, start: int, end: int):
+    status, data, url = await _get_power(params, priority)
+    if status != 200:
+        return {
+            "error": f"NASA POWER API devolvió {status}",
+            "url": url
+        }
+
+    props = data.get("properties", {})
+    parameters = props.get("parameter", {})
+    
+    result = {}
+    atm_params = {
+        "RH2M": {"units": "%", "description": "Humedad Relativa a 2 metros"},
+        "WS2M": {"units": "m/s", "description": "Velocidad del Viento a 2 metros"},
+        "WS10M": {"units": "m/s", "description": "Velocidad del Viento a 10 metros"},
+        "WS50M": {"units": "m/s", "description": "Velocidad del Viento a 50 metros"},
+        "WD2M": {"units": "grados", "description": "Dirección del Viento a 2 metros"},
+        "WD10M": {"units": "grados", "description": "Dirección del Viento a 10 metros"},
+        "WD50M": {"units": "grados", "description": "Dirección del Viento a 50 metros"},
+        "PS": {"units": "kPa", "description": "Presión Superficial"}
+    }
+    
+    for param, info in atm_params.items():
+        raw_data = parameters.get(param, {})
+        filtered = {k: v for k, v in raw_data.items() if v != -999.0}
+        result[param] = {
+            "data": filtered,
+            "units": info["units"],
+            "description": info["description"],
+            "valid_records": len(filtered)
+        }
+    
+    return _mark_degraded({
+        "atmospheric": result,
+        "metadata": {
+            "data_source": data.get("header", {}).get("sources", [])
+        }
+    }, url)
+
+async def get_solar_projection(lat: float, lon: float, start: int, end: int, priority: int = INTERACTIVE):
     params = {
         "latitude": lat,
         "longitude": lon,
@@ -206,50 +383,48 @@ async def get_solar_projection(lat: float, lon: float, start: int, end: int):
         "community": "RE",
         "format": "JSON"
     }
-    async with aiohttp.ClientSession() as session:
-        async with session.get(BASE_URL, params=params) as resp:
-            if resp.status != 200:
-                return {
-                    "error": f"NASA POWER API devolvió {resp.status}",
-                    "url": str(resp.url)
-                }
-
-            data = await resp.json()
-            props = data.get("properties", {})
-            parameters = props.get("parameter", {})
-            
-            result = {}
-
-            solar_params ={
-                "ALLSKY_SFC_SW_DWN": {
-                    "units": "kW-hr/m^2/day", 
-                    "description": "Irradiancia de Onda Corta Descendente"
-                },
-                "ALLSKY_SFC_LW_DWN": {
-                    "units": "kW-hr/m^2/day", 
-                    "description": "Irradiancia de Onda Larga Descendente"
-                },
-                "CLOUD_AMT": {
-                    "units": "%", 
-                    "description": "Nubosidad"
-                }
-            }
-            
-            for param, info in solar_params.items():
-                raw_data = parameters.get(param, {})
-                filtered = {k: v for k, v in raw_data.items() if v != -999.0}
-                result[param] = {
-                    "data": filtered,
-                    "units": info["units"],
-                    "description": info["description"],
-                    "valid_records": len(filtered)
-                }
-            
-            return {
-                "solar": result,
-                "metadata": {
-                    "data_source": data.get("header", {}).get("sources", [])
-                }
-            }
-        
+    status, data, url = await _get_power(params, priority)
+    if status != 200:
+        return {
+            "error": f"NASA POWER API devolvió {status}",
+            "url": url
+        }
+
+    props = data.get("properties", {})
+    parameters = props.get("parameter", {})
+    
+    result = {}
+
+    solar_params ={
+        "ALLSKY_SFC_SW_DWN": {
+            "units": "kW-hr/m^2/day", 
+            "description": "Irradiancia de Onda Corta Descendente"
+        },
+        "ALLSKY_SFC_LW_DWN": {
+            "units": "kW-hr/m^2/day", 
+            "description": "Irradiancia de Onda Larga Descendente"
+        },
+        "CLOUD_AMT": {
+            "units": "%", 
+            "description": "Nubosidad"
+        }
+    }
+    
+    for param, info in solar_params.items():
+        raw_data = parameters.get(param, {})
+        filtered = {k: v for k, v in raw_data.items() if v != -999.0}
+        result[param] = {
+            "data": filtered,
+            "units": info["units"],
+            "description": info["description"],
+            "valid_records": len(filtered)
+        }
+    
+    return _mark_degraded({
+        "solar": result,
+        "metadata": {
+            "data_source": data.get("header", {}).get("sources", [])
+        }
+    }, url)
+
 #http://127.0.0.1:8000/climate?lat=17.866667&lon=-97.783333&start=2020&end=2025
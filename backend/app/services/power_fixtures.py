@@ -0,0 +1,47 @@
+# backend/app/services/power_fixtures.py
+"""
+Fixtures de respuestas de NASA POWER para grabar y reproducir sin red.
+
+Cada respuesta se guarda como `<clave>.json` con los parámetros de la consulta,
+el status y el cuerpo. La clave es un hash de los parámetros normalizados a
+texto, igual que llegan como query string al servidor simulado
+(benchmarks.stand_ins), así que el cliente en modo replay y el servidor
+simulado encuentran los mismos archivos.
+"""
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional, Tuple
+
+
+def normalize_params(params: Dict[str, Any]) -> Dict[str, str]:
+    return {str(key): str(value) for key, value in sorted(params.items())}
+
+
+def fixture_key(params: Dict[str, Any]) -> str:
+    canonical = json.dumps(normalize_params(params), sort_keys=True)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def fixture_path(fixture_dir: str, params: Dict[str, Any]) -> str:
+    return os.path.join(fixture_dir, f"{fixture_key(params)}.json")
+
+
+def save_fixture(fixture_dir: str, params: Dict[str, Any], status: int, data: Optional[dict]):
+    """Guardar una respuesta (escritura atómica: nunca queda un fixture a medias)"""
+    os.makedirs(fixture_dir, exist_ok=True)
+    path = fixture_path(fixture_dir, params)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"params": normalize_params(params), "status": status, "data": data}, f)
+    os.replace(tmp_path, path)
+
+
+def load_fixture(fixture_dir: str, params: Dict[str, Any]) -> Optional[Tuple[int, Optional[dict]]]:
+    """(status, cuerpo) grabados para estos parámetros, o None si no hay fixture"""
+    path = fixture_path(fixture_dir, params)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        fixture = json.load(f)
+    return fixture["status"], fixture["data"]
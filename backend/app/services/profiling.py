@@ -0,0 +1,195 @@
+# backend/app/services/profiling.py
+"""
+Perfilado de peticiones bajo demanda con un profiler de muestreo (pyinstrument).
+
+Dos modos, ambos desactivados por defecto:
+
+- Bajo demanda: una petición con `?profile=1` (o cabecera `X-Profile: 1`) y la
+  cabecera `X-Profile-Token` correcta se ejecuta bajo el profiler; el perfil se
+  guarda y su id vuelve en `X-Profile-Id`. Con `profile=html` o
+  `profile=speedscope` la respuesta es el propio perfil.
+- Muestreado: `PROFILING_SAMPLE_RATE=N` perfila 1 de cada N peticiones.
+
+Los perfiles se guardan en formato speedscope (flame graph) en un directorio
+rotativo. Si ningún modo está configurado el middleware no se registra, así
+que el costo en la ruta normal es nulo. El render y la escritura del perfil
+se hacen en un hilo, fuera del event loop.
+"""
+import asyncio
+import hmac
+import itertools
+import logging
+import os
+import time
+import uuid
+from typing import List, Optional
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import FileResponse
+
+logger = logging.getLogger(__name__)
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+PROFILING_SAMPLE_RATE = int(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", "/tmp/eventweather_profiles")
+PROFILING_MAX_FILES = int(os.getenv("PROFILING_MAX_FILES", "200"))
+PROFILING_INTERVAL_S = float(os.getenv("PROFILING_INTERVAL_S", "0.001"))
+
+PROFILE_SUFFIX = ".speedscope.json"
+
+
+class ProfileStore:
+    """Directorio rotativo de perfiles speedscope (conserva los `max_files` más recientes)"""
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = directory
+        self.max_files = max_files
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, profile_id: str, content: str):
+        path = os.path.join(self.directory, f"{profile_id}{PROFILE_SUFFIX}")
+        with open(path, "w") as f:
+            f.write(content)
+        self._rotate()
+
+    def path_for(self, profile_id: str) -> Optional[str]:
+        # El id se genera internamente; se valida para no aceptar rutas arbitrarias
+        if not profile_id.replace("_", "").replace("-", "").isalnum():
+            return None
+        path = os.path.join(self.directory, f"{profile_id}{PROFILE_SUFFIX}")
+        return path if os.path.exists(path) else None
+
+    def list(self) -> List[dict]:
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(PROFILE_SUFFIX):
+                path = os.path.join(self.directory, name)
+                entries.append({
+                    "id": name[:-len(PROFILE_SUFFIX)],
+                    "size_bytes": os.path.getsize(path),
+                    "created_at": os.path.getmtime(path)
+                })
+        return sorted(entries, key=lambda e: e["created_at"], reverse=True)
+
+    def _rotate(self):
+        entries = self.list()
+        for entry in entries[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.directory, f"{entry['id']}{PROFILE_SUFFIX}"))
+            except OSError:
+                pass
+
+
+def _token_matches(token: Optional[str]) -> bool:
+    return bool(PROFILING_TOKEN and token and hmac.compare_digest(token, PROFILING_TOKEN))
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI que ejecuta la petición bajo pyinstrument cuando corresponde"""
+
+    def __init__(self, app, store: ProfileStore, sample_rate: int = 0):
+        self.app = app
+        self.store = store
+        self.sample_rate = sample_rate
+        self._counter = itertools.count()
+
+    def _requested_mode(self, scope) -> Optional[str]:
+        headers = dict(scope.get("headers") or [])
+        mode = headers.get(b"x-profile", b"").decode() or None
+        if mode is None and b"profile=" in scope.get("query_string", b""):
+            mode = parse_qs(scope["query_string"].decode()).get("profile", [None])[0]
+        if not mode or mode in ("0", "false"):
+            return None
+        if not _token_matches(headers.get(b"x-profile-token", b"").decode() or None):
+            return None
+        return mode
+
+    def _render_and_save(self, profiler, profile_id: str) -> str:
+        """Render speedscope y escritura en el directorio rotativo (se ejecuta en un hilo)"""
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        speedscope = profiler.output(renderer=SpeedscopeRenderer())
+        try:
+            self.store.save(profile_id, speedscope)
+        except OSError as e:
+            logger.error(f"No se pudo guardar el perfil {profile_id}: {e}")
+        return speedscope
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        mode = self._requested_mode(scope)
+        sampled = self.sample_rate > 0 and next(self._counter) % self.sample_rate == 0
+        if mode is None and not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        from pyinstrument import Profiler
+
+        path_slug = scope["path"].strip("/").replace("/", "-") or "root"
+        profile_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{path_slug}_{uuid.uuid4().hex[:8]}"
+        inline = mode in ("html", "speedscope")
+
+        async def send_with_profile_id(message):
+            if inline:
+                return  # la respuesta original se descarta; se envía el perfil
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [
+                    *message.get("headers", []), (b"x-profile-id", profile_id.encode())
+                ]}
+            await send(message)
+
+        profiler = Profiler(interval=PROFILING_INTERVAL_S, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.stop()
+            speedscope = await asyncio.to_thread(self._render_and_save, profiler, profile_id)
+
+        if inline:
+            if mode == "html":
+                html = await asyncio.to_thread(profiler.output_html)
+                body, content_type = html.encode(), b"text/html; charset=utf-8"
+            else:
+                body, content_type = speedscope.encode(), b"application/json"
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", content_type),
+                (b"content-length", str(len(body)).encode()),
+                (b"x-profile-id", profile_id.encode())
+            ]})
+            await send({"type": "http.response.body", "body": body})
+
+
+def configure_profiling(app: FastAPI) -> bool:
+    """Registrar middleware y endpoints de perfiles si el perfilado está configurado"""
+    if not PROFILING_TOKEN and PROFILING_SAMPLE_RATE <= 0:
+        return False
+
+    store = ProfileStore(PROFILING_DIR, PROFILING_MAX_FILES)
+    app.add_middleware(ProfilingMiddleware, store=store, sample_rate=PROFILING_SAMPLE_RATE)
+
+    def require_token(token: Optional[str]):
+        if not _token_matches(token):
+            raise HTTPException(status_code=403, detail="Token de perfilado inválido")
+
+    @app.get("/profiles", include_in_schema=False)
+    async def list_profiles(x_profile_token: Optional[str] = Header(None)):
+        """Listar perfiles guardados"""
+        require_token(x_profile_token)
+        return {"profiles": await asyncio.to_thread(store.list)}
+
+    @app.get("/profiles/{profile_id}", include_in_schema=False)
+    async def get_profile(profile_id: str, x_profile_token: Optional[str] = Header(None)):
+        """Descargar un perfil (formato speedscope: https://www.speedscope.app)"""
+        require_token(x_profile_token)
+        path = store.path_for(profile_id)
+        if path is None:
+            raise HTTPException(status_code=404, detail="Perfil no encontrado")
+        return FileResponse(path, media_type="application/json")
+
+    logger.info(f"Perfilado activo (muestreo 1/{PROFILING_SAMPLE_RATE or '-'}) en {PROFILING_DIR}")
+    return True
@@ -0,0 +1,219 @@
+# backend/app/services/responses.py
+"""
+Formatos de respuesta para cargas grandes.
+
+- FastJSONResponse: JSON serializado con orjson (clase por defecto de la app).
+- format=columnar: las series fecha→valor se reescriben como un arreglo de
+  fechas más un arreglo de valores por parámetro, y las listas de registros
+  como columnas.
+- format=msgpack: el mismo diseño columnar en MessagePack binario.
+- ETag / If-None-Match: validadores fuertes y respuestas 304 sin cuerpo.
+
+La compresión gzip se aplica a todas las rutas salvo las de streaming (SSE),
+donde acumular el cuerpo rompería la entrega incremental. La representación
+comprimida lleva su propio ETag (sufijo -gz), porque un validador fuerte no
+puede compartirse entre cuerpos distintos.
+"""
+import hashlib
+import os
+from datetime import datetime
+from typing import Any, Dict, List
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson está en requirements.txt
+    orjson = None
+
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1000"))
+GZIP_EXCLUDED_PATHS = ("/predict/ai-description/stream",)
+GZIP_ETAG_SUFFIX = "-gz"
+
+# max-age de /climate*: los años ya cerrados no cambian, el año en curso sí
+CLIMATE_HISTORY_MAX_AGE_S = int(os.getenv("CLIMATE_HISTORY_MAX_AGE_S", "604800"))
+CLIMATE_CURRENT_MAX_AGE_S = int(os.getenv("CLIMATE_CURRENT_MAX_AGE_S", "3600"))
+
+RESPONSE_FORMAT_PATTERN = "^(json|columnar|msgpack)$"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serializada con orjson (arreglos NumPy incluidos)"""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        import msgpack  # diferido: solo lo necesitan los clientes que piden msgpack
+
+        return msgpack.packb(content, use_bin_type=True)
+
+
+def _is_series_group(value: Any) -> bool:
+    """{parámetro: {"data": {fecha: valor}, ...}} tal como lo arma nasapower"""
+    return (isinstance(value, dict) and bool(value)
+            and all(isinstance(item, dict) and isinstance(item.get("data"), dict) for item in value.values()))
+
+
+def _series_group_to_columns(group: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    dates = sorted(set().union(*(item["data"] for item in group.values())))
+    columns = {
+        "dates": dates,
+        "values": {name: [item["data"].get(date) for date in dates] for name, item in group.items()}
+    }
+    # Metadatos por parámetro (units, description, ...) como un dict por campo
+    for name, item in group.items():
+        for field, value in item.items():
+            if field != "data":
+                columns.setdefault(field, {})[name] = value
+    return columns
+
+
+def _records_to_columns(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Unión de campos de todos los registros (p. ej. uno con "error" y otros con
+    # "advice"); el registro que no trae un campo queda con None en esa columna
+    fields = dict.fromkeys(field for record in records for field in record)
+    columns = {}
+    for field in fields:
+        values = [record.get(field) for record in records]
+        present = [value for value in values if value is not None]
+        if present and all(isinstance(value, dict) for value in present):
+            columns[field] = _records_to_columns([value or {} for value in values])
+        else:
+            columns[field] = values
+    return columns
+
+
+def to_columnar(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Reescribir series y listas de registros de una respuesta en columnas"""
+    if "error" in payload:
+        return payload
+
+    result = {}
+    for key, value in payload.items():
+        if key == "data" and isinstance(value, dict):
+            result["dates"] = list(value.keys())
+            result["values"] = list(value.values())
+        elif _is_series_group(value):
+            result[key] = _series_group_to_columns(value)
+        elif isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+            result[key] = _records_to_columns(value)
+        else:
+            result[key] = value
+    return result
+
+
+def format_response(payload: Dict[str, Any], response_format: str = "json") -> Response:
+    """Respuesta en el formato pedido por el cliente (json, columnar o msgpack)"""
+    if response_format == "json":
+        return FastJSONResponse(payload)
+    columnar = to_columnar(payload)
+    if response_format == "msgpack":
+        return MsgPackResponse(columnar)
+    return FastJSONResponse(columnar)
+
+
+def make_etag(*parts: Any) -> str:
+    """ETag fuerte a partir de los datos que determinan el cuerpo"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def gzip_etag(etag: str) -> str:
+    """ETag de la representación gzip: '"abc"' -> '"abc-gz"'"""
+    return f'{etag[:-1]}{GZIP_ETAG_SUFFIX}"'
+
+
+def _strip_gzip_suffix(etag: str) -> str:
+    suffix = f'{GZIP_ETAG_SUFFIX}"'
+    return f'{etag[:-len(suffix)]}"' if etag.endswith(suffix) else etag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    If-None-Match usa comparación débil: se ignora el prefijo W/ y también
+    el sufijo -gz, ya que ambas codificaciones comparten contenido
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or any(
+        _strip_gzip_suffix(candidate.removeprefix("W/")) == etag for candidate in candidates
+    )
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def conditional_response(request: Request, response: Response, cache_control: str) -> Response:
+    """Poner ETag (huella del cuerpo) y Cache-Control; 304 si el cliente ya lo tiene"""
+    etag = make_etag(hashlib.sha1(response.body).hexdigest(), response.media_type)
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def climate_cache_control(payload: Dict[str, Any], end_year: int) -> str:
+    """Cache-Control de /climate*: errores sin caché, historia cerrada por más tiempo"""
+    if "error" in payload:
+        return "no-store"
+    if payload.get("stale") or payload.get("partial"):
+        # Datos de respaldo o incompletos mientras POWER falla: revalidar siempre
+        return "no-cache"
+    max_age = CLIMATE_HISTORY_MAX_AGE_S if end_year < datetime.now().year else CLIMATE_CURRENT_MAX_AGE_S
+    return f"public, max-age={max_age}"
+
+
+class SelectiveGZipMiddleware:
+    """
+    GZipMiddleware que deja pasar sin comprimir las rutas de streaming y da
+    a los cuerpos comprimidos un ETag propio (sufijo -gz)
+    """
+
+    def __init__(self, app, minimum_size: int = GZIP_MINIMUM_SIZE,
+                 excluded_paths: tuple = GZIP_EXCLUDED_PATHS):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size)
+        self.excluded_paths = excluded_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+        if scope["type"] != "http":
+            await self.gzip(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        if_none_match = request_headers.get("if-none-match", "")
+
+        async def send_with_gzip_etag(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                etag = headers.get("etag")
+                if etag and etag.endswith('"') and not etag.endswith(f'{GZIP_ETAG_SUFFIX}"'):
+                    if headers.get("content-encoding") == "gzip":
+                        headers["ETag"] = gzip_etag(etag)
+                    elif message["status"] == 304 and gzip_etag(etag) in if_none_match:
+                        # Revalidación de la copia comprimida: se confirma su propio ETag
+                        headers["ETag"] = gzip_etag(etag)
+                if message["status"] == 304:
+                    # El 304 no pasa por la compresión: mismo Vary que la respuesta completa
+                    headers.add_vary_header("Accept-Encoding")
+            await send(message)
+
+        await self.gzip(scope, receive, send_with_gzip_etag)
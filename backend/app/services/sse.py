@@ -0,0 +1,74 @@
+# backend/app/services/sse.py
+"""
+Server-sent events para descripciones de Gemini.
+
+Secuencia de eventos de /predict/ai-description/stream:
+    forecast     JSON de la predicción (se envía de inmediato)
+    description  {"text": ...} un evento por fragmento de Gemini
+    done         {"model": ..., "complete": bool}
+
+Si Gemini no entrega el primer fragmento antes del deadline (o no está
+configurado), se envía la descripción por reglas en un solo evento
+`description`, de modo que el tiempo al primer byte no depende del LLM.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+
+from app.services.gemini_service import FALLBACK_MODEL_NAME, GEMINI_MODEL_NAME, GeminiClimateService
+
+logger = logging.getLogger(__name__)
+
+# Cabeceras para que proxies (nginx) no acumulen el stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"
+}
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Serializar un evento SSE con datos JSON (una sola línea `data:`)"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def description_events(prediction: Dict[str, Any],
+                             service: Optional[GeminiClimateService],
+                             first_chunk_timeout_s: float) -> AsyncIterator[str]:
+    """Eventos SSE: predicción, fragmentos de la descripción y cierre"""
+    yield format_sse("forecast", prediction)
+
+    chunks = None
+    first_text = None
+    if service is not None:
+        chunks = service.stream_climate_description(prediction)
+        try:
+            first_text = await asyncio.wait_for(chunks.__anext__(), first_chunk_timeout_s)
+        except StopAsyncIteration:
+            pass
+        except asyncio.TimeoutError:
+            logger.warning(f"Gemini no respondió en {first_chunk_timeout_s}s; usando descripción por reglas")
+        except Exception as e:
+            logger.error(f"Error iniciando streaming de Gemini: {e}")
+
+    if first_text is None:
+        if chunks is not None:
+            await chunks.aclose()
+        fallback = GeminiClimateService._generate_fallback_description(prediction)
+        yield format_sse("description", {"text": fallback["description"]})
+        yield format_sse("done", {"model": FALLBACK_MODEL_NAME, "complete": True})
+        return
+
+    complete = True
+    try:
+        yield format_sse("description", {"text": first_text})
+        async for text in chunks:
+            yield format_sse("description", {"text": text})
+    except Exception as e:
+        # Ya se enviaron fragmentos: se cierra el stream marcándolo incompleto
+        logger.error(f"Error durante el streaming de Gemini: {e}")
+        complete = False
+    finally:
+        await chunks.aclose()
+
+    yield format_sse("done", {"model": GEMINI_MODEL_NAME, "complete": complete})
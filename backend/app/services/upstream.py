@@ -0,0 +1,167 @@
+# backend/app/services/upstream.py
+"""
+Control de llamadas a servicios externos (NASA POWER).
+
+- UpstreamScheduler: límite global de llamadas concurrentes con dos clases de
+  prioridad. Las interactivas (/climate*) pasan delante de las masivas
+  (collect_data, sincronizaciones), y las masivas nunca ocupan más de
+  `bulk_limit` lugares, de modo que siempre queda capacidad para usuarios.
+- CircuitBreaker: tras `failure_threshold` fallos seguidos deja de llamar
+  durante `reset_timeout_s` (falla de inmediato o se sirve la última respuesta
+  buena); después deja pasar una sola llamada de prueba.
+- backoff_delay: espera exponencial con jitter completo entre reintentos.
+- degraded_marker: las respuestas servidas sin una llamada exitosa llevan una
+  url con prefijo propio (stale:// o partial://) para no cachearlas como buenas.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional, Tuple
+
+from app.services.metrics import UPSTREAM_QUEUE_SECONDS
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Última respuesta buena guardada en memoria (circuito abierto o error)
+STALE_URL_PREFIX = "stale://"
+# Datos locales con huecos que el servicio externo no pudo completar
+PARTIAL_URL_PREFIX = "partial://"
+
+
+class UpstreamScheduler:
+    """Semáforo con prioridades: libera los lugares a la espera de mayor prioridad"""
+
+    def __init__(self, name: str, max_concurrency: int, bulk_limit: Optional[int] = None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.bulk_limit = max_concurrency if bulk_limit is None else min(bulk_limit, max_concurrency)
+        self.active = {INTERACTIVE: 0, BULK: 0}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    @property
+    def in_flight(self) -> int:
+        return self.active[INTERACTIVE] + self.active[BULK]
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def _can_start(self, priority: int) -> bool:
+        if self.in_flight >= self.max_concurrency:
+            return False
+        return priority == INTERACTIVE or self.active[BULK] < self.bulk_limit
+
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE):
+        start = time.perf_counter()
+        # Sin cola pendiente de igual o mayor prioridad se entra directo
+        if self._can_start(priority) and not any(
+            waiting_priority <= priority and not future.done()
+            for waiting_priority, _, future in self._waiters
+        ):
+            self.active[priority] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+            try:
+                await future  # _wake_next ya contó el lugar como ocupado
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._release(priority)
+                raise
+        UPSTREAM_QUEUE_SECONDS.observe(
+            time.perf_counter() - start, upstream=self.name, priority=PRIORITY_NAMES[priority]
+        )
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def _release(self, priority: int):
+        self.active[priority] -= 1
+        self._wake_next()
+
+    def _wake_next(self):
+        # Las esperas canceladas se descartan; una masiva bloqueada por bulk_limit
+        # no impide despertar a interactivas que estén detrás en el heap
+        skipped = []
+        while self._waiters and self.in_flight < self.max_concurrency:
+            priority, sequence, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            if not self._can_start(priority):
+                skipped.append((priority, sequence, future))
+                continue
+            self.active[priority] += 1
+            future.set_result(None)
+        for waiter in skipped:
+            heapq.heappush(self._waiters, waiter)
+
+
+class CircuitBreaker:
+    """Cerrado -> abierto tras fallos consecutivos -> medio abierto (una prueba)"""
+
+    def __init__(self, failure_threshold: int, reset_timeout_s: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout_s:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> Tuple[bool, bool]:
+        """(se permite la llamada, es la prueba del circuito medio abierto)"""
+        state = self.state
+        if state == "closed":
+            return True, False
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True, True
+        return False, False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probe_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def abandon_probe(self):
+        """La prueba se canceló sin resultado: otra petición puede probar"""
+        self._probe_in_flight = False
+
+
+def backoff_delay(attempt: int, base_s: float, max_s: float) -> float:
+    """Espera antes del reintento `attempt` (0, 1, ...): uniforme en [0, base * 2^attempt]"""
+    return random.uniform(0, min(max_s, base_s * (2 ** attempt)))
+
+
+def is_retriable(status: int) -> bool:
+    """Errores transitorios: límite de tasa y errores del servidor (incluye 502/504 locales)"""
+    return status == 429 or status >= 500
+
+
+def degraded_marker(url: Optional[str]) -> Optional[str]:
+    """"stale" o "partial" si la url es de una respuesta degradada; None si no"""
+    if url and url.startswith(STALE_URL_PREFIX):
+        return "stale"
+    if url and url.startswith(PARTIAL_URL_PREFIX):
+        return "partial"
+    return None
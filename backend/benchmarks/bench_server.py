@@ -0,0 +1,75 @@
+# backend/benchmarks/bench_server.py
+"""
+Arranca la API con dobles locales para medirla sin servicios externos.
+
+    python -m benchmarks.bench_server --port 8765 --power-url http://127.0.0.1:8766/
+    python -m benchmarks.bench_server --database-url postgresql://.../eventweather_db --seed
+"""
+import argparse
+import asyncio
+import logging
+import os
+
+import uvicorn
+
+from benchmarks.stand_ins import (
+    FakeGeminiService,
+    InMemoryModelRepository,
+    seed_synthetic_models
+)
+
+
+def build_app(args):
+    """Crear la app con repositorio, NASA POWER y Gemini sustituidos por dobles"""
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+
+    from app import main
+    from app.ml.enhanced_climate_predictor import EnhancedClimatePredictor
+    from app.services import gemini_service, nasapower
+
+    if args.power_url:
+        nasapower.BASE_URL = args.power_url
+
+    gemini_service._gemini_service = FakeGeminiService(latency_ms=args.gemini_latency_ms)
+
+    if args.database_url:
+        predictor = main.build_predictor()
+    else:
+        predictor = EnhancedClimatePredictor(model_repo=InMemoryModelRepository())
+
+    return main.create_app(predictor), predictor
+
+
+async def serve(args):
+    app, predictor = build_app(args)
+
+    if args.seed or not args.database_url:
+        await predictor.initialize()
+        saved = await seed_synthetic_models(
+            predictor.model_repo, predictor.variable_names,
+            points_per_side=args.points_per_side
+        )
+        logging.info(f"{saved} modelos sintéticos sembrados")
+
+    config = uvicorn.Config(app, host=args.host, port=args.port, log_level="warning")
+    await uvicorn.Server(config).serve()
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--database-url", default=None,
+                        help="Postgres local; si se omite se usa el repositorio en memoria")
+    parser.add_argument("--seed", action="store_true",
+                        help="Sembrar modelos sintéticos también en Postgres")
+    parser.add_argument("--points-per-side", type=int, default=3)
+    parser.add_argument("--power-url", default=None, help="URL del servidor POWER simulado")
+    parser.add_argument("--gemini-latency-ms", type=float, default=800)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API con dobles locales para benchmarks")
+    add_server_arguments(parser)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(parser.parse_args()))
@@ -0,0 +1,105 @@
+# backend/benchmarks/cold_start.py
+"""
+Benchmark de arranque en frío.
+
+Mide, en procesos nuevos:
+- import_s: tiempo de `import app.main`
+- first_request_s: desde lanzar uvicorn hasta la primera respuesta de /livez
+
+    python -m benchmarks.cold_start --runs 5
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def _env():
+    return {**os.environ, "PYTHONPATH": BACKEND_DIR}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import() -> float:
+    output = subprocess.check_output(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=_env(), stderr=subprocess.DEVNULL
+    )
+    return float(output.decode().strip().splitlines()[-1])
+
+
+def measure_first_request(timeout_s: float = 60) -> float:
+    port = _free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR, env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout_s:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/livez", timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError("uvicorn no respondió a /livez")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def _summary(values):
+    return {
+        "median": round(statistics.median(values), 4),
+        "min": round(min(values), 4),
+        "max": round(max(values), 4),
+        "runs": [round(v, 4) for v in values]
+    }
+
+
+def main(args):
+    imports = [measure_import() for _ in range(args.runs)]
+    first_requests = [measure_first_request() for _ in range(args.runs)]
+
+    report = {
+        "benchmark": "cold_start",
+        "generated_at": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "import_s": _summary(imports),
+        "first_request_s": _summary(first_requests)
+    }
+    print(f"import app.main      mediana {report['import_s']['median']:.3f} s")
+    print(f"primera respuesta    mediana {report['first_request_s']['median']:.3f} s")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"cold_start_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultados guardados en {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de arranque en frío de la API")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", default=None)
+    main(parser.parse_args())
@@ -0,0 +1,230 @@
+# backend/benchmarks/http_load.py
+"""
+Benchmark HTTP de /predict, /stats y /climate* con dobles locales.
+
+Levanta el servidor POWER simulado y la API (repositorio en memoria o Postgres
+local) en procesos separados, genera carga con concurrencia configurable y
+reporta req/s y latencias p50/p95/p99 por endpoint y escenario
+(cache_hit: misma consulta repetida; cache_miss: consulta distinta cada vez).
+
+    python -m benchmarks.http_load --concurrency 32 --requests 500
+    python -m benchmarks.http_load --database-url postgresql://... --seed
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List
+
+import aiohttp
+
+from benchmarks.bench_server import add_server_arguments
+from benchmarks.stand_ins import DEFAULT_REGION
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+FIXED_POINT = {"lat": 17.827, "lon": -97.8043}
+
+
+def _random_point() -> Dict:
+    lat_min, lat_max, lon_min, lon_max = DEFAULT_REGION
+    return {
+        "lat": round(random.uniform(lat_min, lat_max), 4),
+        "lon": round(random.uniform(lon_min, lon_max), 4)
+    }
+
+
+def _random_date() -> str:
+    return (date(2026, 1, 1) + timedelta(days=random.randint(0, 364))).isoformat()
+
+
+def _climate_params(point: Dict) -> Dict:
+    return {**point, "start": 2015, "end": 2024}
+
+
+# endpoint -> escenario -> generador de parámetros de consulta
+SCENARIOS: Dict[str, Dict[str, Callable[[], Dict]]] = {
+    "/predict": {
+        "cache_hit": lambda: {**FIXED_POINT, "date": "2026-12-25"},
+        "cache_miss": lambda: {**_random_point(), "date": _random_date()}
+    },
+    "/stats": {
+        "default": lambda: {}
+    },
+    "/climate": {
+        "cache_hit": lambda: _climate_params(FIXED_POINT),
+        "cache_miss": lambda: _climate_params(_random_point())
+    },
+    "/climate/complete": {
+        "cache_hit": lambda: _climate_params(FIXED_POINT),
+        "cache_miss": lambda: _climate_params(_random_point())
+    },
+    "/climate/atmosferic": {
+        "cache_hit": lambda: _climate_params(FIXED_POINT),
+        "cache_miss": lambda: _climate_params(_random_point())
+    }
+}
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(base_url: str, path: str, make_params: Callable[[], Dict],
+                       total_requests: int, concurrency: int, warmup: int) -> Dict:
+    """Lanzar `total_requests` peticiones con `concurrency` clientes simultáneos"""
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=60)
+    latencies: List[float] = []
+    errors = 0
+    status_counts: Dict[int, int] = {}
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        for _ in range(warmup):
+            async with session.get(base_url + path, params=make_params()) as resp:
+                await resp.read()
+
+        remaining = total_requests
+
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                params = make_params()
+                start = time.perf_counter()
+                try:
+                    async with session.get(base_url + path, params=params) as resp:
+                        await resp.read()
+                        status_counts[resp.status] = status_counts.get(resp.status, 0) + 1
+                        if resp.status >= 500:
+                            errors += 1
+                except Exception:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "status_counts": status_counts,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(latencies[-1], 3) if latencies else 0.0
+        }
+    }
+
+
+async def wait_until_ready(url: str, timeout_s: float = 120):
+    deadline = time.monotonic() + timeout_s
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as resp:
+                    if resp.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.25)
+    raise TimeoutError(f"El servidor no respondió en {url}")
+
+
+def _spawn(module: str, args: List[str]) -> subprocess.Popen:
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": backend_dir}
+    return subprocess.Popen([sys.executable, "-m", module, *args], cwd=backend_dir, env=env)
+
+
+async def main(args):
+    power_port = args.port + 1
+    processes = [
+        _spawn("benchmarks.stand_ins", [
+            "--port", str(power_port),
+            "--latency-ms", str(args.power_latency_ms)
+        ])
+    ]
+    server_args = [
+        "--host", args.host, "--port", str(args.port),
+        "--points-per-side", str(args.points_per_side),
+        "--power-url", f"http://127.0.0.1:{power_port}/api/temporal/monthly/point",
+        "--gemini-latency-ms", str(args.gemini_latency_ms)
+    ]
+    if args.database_url:
+        server_args += ["--database-url", args.database_url]
+    if args.seed:
+        server_args.append("--seed")
+    processes.append(_spawn("benchmarks.bench_server", server_args))
+
+    base_url = f"http://{args.host}:{args.port}"
+    endpoints = args.endpoints or list(SCENARIOS)
+    results = {}
+
+    try:
+        await wait_until_ready(base_url + "/health")
+
+        for path in endpoints:
+            for scenario, make_params in SCENARIOS[path].items():
+                result = await run_scenario(
+                    base_url, path, make_params,
+                    args.requests, args.concurrency, args.warmup
+                )
+                results.setdefault(path, {})[scenario] = result
+                latency = result["latency_ms"]
+                print(f"{path:<22} {scenario:<11} {result['requests_per_second']:>9.1f} req/s  "
+                      f"p50 {latency['p50']:>8.2f} ms  p95 {latency['p95']:>8.2f} ms  "
+                      f"p99 {latency['p99']:>8.2f} ms  errores {result['errors']}")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    report = {
+        "benchmark": "http_load",
+        "generated_at": datetime.now().isoformat(),
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "repository": "postgres" if args.database_url else "memory",
+            "power_latency_ms": args.power_latency_ms,
+            "gemini_latency_ms": args.gemini_latency_ms
+        },
+        "results": results
+    }
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"http_load_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultados guardados en {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark HTTP de la API con dobles locales")
+    add_server_arguments(parser)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=300, help="Peticiones por escenario")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--power-latency-ms", type=float, default=50)
+    parser.add_argument("--endpoints", nargs="*", choices=list(SCENARIOS), default=None)
+    parser.add_argument("--output", default=None, help="Ruta del JSON de resultados")
+    asyncio.run(main(parser.parse_args()))
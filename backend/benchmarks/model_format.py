@@ -0,0 +1,139 @@
+# backend/benchmarks/model_format.py
+"""
+Benchmark del formato de almacenamiento de modelos.
+
+Entrena GradientBoostingRegressor sintéticos (mismos que seed_synthetic_models)
+y compara, por formato:
+- bytes: tamaño del blob guardado en model_blobs
+- load_ms: deserialización (lo que paga load_model en un fallo de caché)
+- max_abs_diff: diferencia máxima de predicción frente al estimador original
+
+Formatos: joblib sin comprimir (el anterior), joblib comprimido, y EWFM con
+zlib y con zstd.
+
+    python -m benchmarks.model_format --models 10 --n-estimators 100
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import zlib
+from datetime import datetime
+from unittest import mock
+
+import joblib
+import numpy as np
+
+from app.ml import model_format
+from app.ml.flat_model import from_sklearn
+from benchmarks.stand_ins import _synthetic_target
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+VARIABLES = ['Temperature_C', 'Humidity_Percent', 'Pressure_kPa',
+             'Precipitation_mm_per_day', 'Cloud_Cover_Percent']
+
+
+def _train_models(count: int, n_estimators: int, seed: int):
+    from sklearn.ensemble import GradientBoostingRegressor
+
+    rng = np.random.default_rng(seed)
+    models = []
+    for index in range(count):
+        doy = rng.integers(1, 367, 400)
+        X = np.column_stack([
+            np.full(len(doy), 17.8), np.full(len(doy), -97.8), doy,
+            np.minimum(doy // 31 + 1, 12), doy % 28 + 1
+        ]).astype(np.float64)
+        y = _synthetic_target(VARIABLES[index % len(VARIABLES)], X) + rng.normal(0, 0.5, len(doy))
+        models.append(GradientBoostingRegressor(
+            n_estimators=n_estimators, max_depth=5, random_state=seed + index
+        ).fit(X, y))
+    return models
+
+
+def _joblib_bytes(model, compress=0) -> bytes:
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer, compress=compress)
+    return buffer.getvalue()
+
+
+def _ewfm_zlib(model) -> bytes:
+    # Fuerza el códec de respaldo aunque zstandard esté instalado
+    with mock.patch.object(model_format, "zstandard", None):
+        return model_format.encode_flat(from_sklearn(model))
+
+
+FORMATS = {
+    "joblib": lambda model: _joblib_bytes(model),
+    "joblib_compress3": lambda model: _joblib_bytes(model, compress=3),
+    "ewfm_zlib": _ewfm_zlib,
+    "ewfm_zstd": lambda model: model_format.encode_flat(from_sklearn(model))
+}
+
+
+def _measure(models, serialize, X, repeats: int):
+    blobs = [serialize(model) for model in models]
+    load_ms = []
+    for _ in range(repeats):
+        for blob in blobs:
+            start = time.perf_counter()
+            model_format.deserialize_model(blob)
+            load_ms.append((time.perf_counter() - start) * 1000)
+    max_diff = max(
+        float(np.max(np.abs(model_format.deserialize_model(blob).predict(X) - model.predict(X))))
+        for model, blob in zip(models, blobs)
+    )
+    sizes = [len(blob) for blob in blobs]
+    return {
+        "bytes_mean": round(statistics.mean(sizes)),
+        "load_ms_median": round(statistics.median(load_ms), 3),
+        "max_abs_diff": max_diff
+    }
+
+
+def main(args):
+    if model_format.zstandard is None:
+        FORMATS.pop("ewfm_zstd")
+    models = _train_models(args.models, args.n_estimators, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    X = np.column_stack([
+        rng.uniform(16, 19.5, 2000), rng.uniform(-99.5, -96, 2000),
+        rng.integers(1, 367, 2000), rng.integers(1, 13, 2000), rng.integers(1, 29, 2000)
+    ]).astype(np.float64)
+
+    results = {name: _measure(models, serialize, X, args.repeats) for name, serialize in FORMATS.items()}
+    baseline = results["joblib"]
+    print(f"{'formato':<18}{'bytes':>10}{'relativo':>10}{'carga ms':>10}{'máx dif':>12}")
+    for name, result in results.items():
+        print(f"{name:<18}{result['bytes_mean']:>10}{result['bytes_mean'] / baseline['bytes_mean']:>10.1%}"
+              f"{result['load_ms_median']:>10.3f}{result['max_abs_diff']:>12.2e}")
+
+    report = {
+        "benchmark": "model_format",
+        "generated_at": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "zlib": zlib.ZLIB_VERSION,
+        "models": args.models,
+        "n_estimators": args.n_estimators,
+        "formats": results
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"model_format_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultados guardados en {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tamaño y tiempo de carga de los formatos de modelo")
+    parser.add_argument("--models", type=int, default=10)
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None)
+    main(parser.parse_args())
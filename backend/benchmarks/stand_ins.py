@@ -0,0 +1,382 @@
+# backend/benchmarks/stand_ins.py
+"""
+Dobles locales para benchmarks: repositorio de modelos en memoria, servidor
+NASA POWER simulado y cliente Gemini falso.
+
+El servidor POWER simulado se puede lanzar por separado:
+    python -m benchmarks.stand_ins --port 8766 --latency-ms 80
+
+Con --fixtures responde las respuestas reales grabadas con
+NASA_POWER_MODE=record (datos sintéticos para lo que no esté grabado, o 404
+con --strict). Con --seed la latencia y los errores inyectados son
+reproducibles:
+    NASA_POWER_MODE=record NASA_POWER_FIXTURE_DIR=fixtures/power uvicorn app.main:app
+    python -m benchmarks.stand_ins --fixtures fixtures/power --strict \
+        --latency-ms 120 --jitter-ms 80 --error-rate 0.05 --seed 7
+    NASA_POWER_BASE_URL=http://127.0.0.1:8766/ uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.database import geocell
+from app.database.model_repository import (
+    ASSIGNMENT_MAX_DISTANCE_KM,
+    ASSIGNMENT_MAX_MODELS,
+    PREDICTION_CACHE_TTL_S,
+    ModelRepository
+)
+from app.ml.model_format import serialize_model
+from app.services.gemini_service import GeminiClimateService
+from app.services.power_fixtures import load_fixture
+
+# Región por defecto: centrada en el punto de ejemplo de la API (Oaxaca)
+DEFAULT_REGION = (16.0, 19.5, -99.5, -96.0)
+
+
+class InMemoryModelRepository(ModelRepository):
+    """ModelRepository sin base de datos: mismas operaciones sobre dicts en memoria"""
+
+    def __init__(self):
+        super().__init__(database_url="memory://")
+        self.models: Dict[int, Dict[str, Any]] = {}
+        self.blobs: Dict[int, bytes] = {}
+        self.cache: Dict[tuple, Dict[str, Any]] = {}
+        self.usage: Dict[int, Dict[str, Any]] = {}
+        self.assignments: Dict[tuple, list] = {}
+        self._next_id = 1
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    async def check_pool(self, timeout: float = 1.0) -> bool:
+        return True
+
+    async def get_most_used_model_ids(self, limit: int) -> List[int]:
+        active = [model_id for model_id, row in self.models.items() if row['is_active']]
+        active.sort(key=lambda model_id: self.usage.get(model_id, {}).get('usage_count', 0), reverse=True)
+        return active[:limit]
+
+    async def save_model(self, latitude, longitude, variable_name, model, metadata) -> int:
+        model_id = self._next_id
+        self._next_id += 1
+        self.models[model_id] = {
+            'id': model_id,
+            'latitude': latitude,
+            'longitude': longitude,
+            'variable_name': variable_name,
+            'model_metadata': metadata,
+            'training_date': datetime.now(),
+            'accuracy_score': metadata.get('accuracy_score', 0),
+            'mean_absolute_error': metadata.get('mean_absolute_error', 0),
+            'r2_score': metadata.get('r2_score', 0),
+            'data_points_count': metadata.get('data_points_count', 0),
+            'geographic_hash': self.calculate_geo_hash(latitude, longitude),
+            'geo_cell': self.calculate_geo_cell(latitude, longitude),
+            'is_active': True
+        }
+        self.blobs[model_id] = serialize_model(model)
+        self._invalidate_assignments_near(latitude, longitude, variable_name)
+        return model_id
+
+    async def deactivate_model(self, model_id: int) -> bool:
+        row = self.models.get(model_id)
+        if row is None or not row['is_active']:
+            return False
+        row['is_active'] = False
+        self._invalidate_assignments_near(row['latitude'], row['longitude'], row['variable_name'])
+        return True
+
+    def _invalidate_assignments_near(self, latitude, longitude, variable_name):
+        ranges = list(zip(*geocell.search_ranges(latitude, longitude, ASSIGNMENT_MAX_DISTANCE_KM)))
+        for key in [key for key in self.assignments
+                    if key[1] == variable_name and any(lo <= key[0] <= hi for lo, hi in ranges)]:
+            del self.assignments[key]
+        for key in [key for key in self.cache if any(lo <= key[0] <= hi for lo, hi in ranges)]:
+            del self.cache[key]
+
+    async def get_model_assignments(self, latitude, longitude, variable_names):
+        cell = self.assignment_cell(latitude, longitude)
+        missing = [variable for variable in variable_names if (cell, variable) not in self.assignments]
+        if missing:
+            center_lat, center_lon = self.assignment_center(cell)
+            best_models = await self.find_best_models(
+                center_lat, center_lon, missing, ASSIGNMENT_MAX_DISTANCE_KM, ASSIGNMENT_MAX_MODELS
+            )
+            for variable, items in self.build_assignments(cell, best_models).items():
+                self.assignments[(cell, variable)] = items
+        return {variable: self.assignments[(cell, variable)] for variable in variable_names}
+
+    async def find_best_models(self, latitude, longitude, variable_names,
+                               max_distance_km=100, max_models=3):
+        ranges = list(zip(*geocell.search_ranges(latitude, longitude, max_distance_km)))
+        results = {}
+        for variable in variable_names:
+            rows = [
+                row for row in self.models.values()
+                if row['variable_name'] == variable
+                and row['is_active'] and row['accuracy_score'] > 0.7
+                and any(lo <= row['geo_cell'] <= hi for lo, hi in ranges)
+            ]
+            results[variable] = self.rank_candidates(
+                latitude, longitude, rows, max_distance_km, max_models
+            )
+        return results
+
+    async def load_model(self, model_id: int):
+        model_data = self.blobs.get(model_id)
+        if model_data is not None:
+            return self.deserialize_model(model_data)
+        return None
+
+    async def get_active_models_fingerprint(self) -> str:
+        active = [model_id for model_id, row in self.models.items() if row['is_active']]
+        return f"{len(active)}:{sum(active)}"
+
+    async def iter_active_model_blobs(self, batch_size: int = 20):
+        for model_id, row in list(self.models.items()):
+            if row['is_active']:
+                yield model_id, self.blobs[model_id]
+
+    async def cache_prediction(self, latitude, longitude, prediction_date, predictions, model_versions):
+        self.cache[(self.cache_cell(latitude, longitude), prediction_date)] = {
+            'predictions': json.dumps(predictions),
+            'model_versions': json.dumps(model_versions),
+            'expires_at': datetime.now() + timedelta(seconds=PREDICTION_CACHE_TTL_S)
+        }
+
+    async def get_cached_prediction(self, latitude, longitude, prediction_date) -> Optional[dict]:
+        entry = self.cache.get((self.cache_cell(latitude, longitude), prediction_date))
+        if entry and entry['expires_at'] > datetime.now():
+            return {
+                'predictions': json.loads(entry['predictions']),
+                'model_versions': json.loads(entry['model_versions'])
+            }
+        return None
+
+    async def update_model_usage(self, model_id, response_time_ms, success):
+        stats = self.usage.setdefault(model_id, {
+            'usage_count': 0, 'average_response_time': response_time_ms,
+            'success_rate': 1.0 if success else 0.0
+        })
+        stats['usage_count'] += 1
+        stats['average_response_time'] = (stats['average_response_time'] + response_time_ms) / 2
+        stats['success_rate'] = (stats['success_rate'] + (1.0 if success else 0.0)) / 2
+
+    async def get_model_stats(self, days: int = 30) -> Dict[str, Any]:
+        models = list(self.models.values())
+        usage = list(self.usage.values())
+        return {
+            'total_models': len(models),
+            'active_models': sum(1 for m in models if m['is_active']),
+            'average_accuracy': float(np.mean([m['accuracy_score'] for m in models])) if models else 0.0,
+            'regions_covered': len({m['geographic_hash'] for m in models}),
+            'total_predictions': sum(u['usage_count'] for u in usage),
+            'average_response_time_ms': float(np.mean([u['average_response_time'] for u in usage])) if usage else 0.0,
+            'average_success_rate': float(np.mean([u['success_rate'] for u in usage])) if usage else 0.0
+        }
+
+
+def _synthetic_target(variable: str, X: np.ndarray) -> np.ndarray:
+    """Señal estacional plausible por variable para entrenar modelos sintéticos"""
+    lat, doy = X[:, 0], X[:, 2]
+    season = np.sin(2 * np.pi * (doy - 100) / 365)
+    return {
+        'Temperature_C': 28 - 0.4 * np.abs(lat) + 6 * season,
+        'Humidity_Percent': 65 + 15 * season,
+        'Pressure_kPa': 81 + 0.5 * season,
+        'Precipitation_mm_per_day': np.clip(3 + 3 * season, 0, None),
+        'Cloud_Cover_Percent': 40 + 20 * season
+    }.get(variable, season)
+
+
+async def seed_synthetic_models(model_repo: ModelRepository,
+                                variable_names: List[str],
+                                region=DEFAULT_REGION,
+                                points_per_side: int = 3,
+                                n_estimators: int = 100,
+                                seed: int = 42) -> int:
+    """Entrenar y guardar GradientBoostingRegressor sintéticos sobre una malla regular"""
+    from sklearn.ensemble import GradientBoostingRegressor
+
+    rng = np.random.default_rng(seed)
+    lat_min, lat_max, lon_min, lon_max = region
+    saved = 0
+
+    for lat in np.linspace(lat_min, lat_max, points_per_side):
+        for lon in np.linspace(lon_min, lon_max, points_per_side):
+            doy = rng.integers(1, 367, 400)
+            dates = [datetime(2024, 1, 1) + timedelta(days=int(d) - 1) for d in doy]
+            X = np.column_stack([
+                np.full(len(doy), lat), np.full(len(doy), lon), doy,
+                [d.month for d in dates], [d.day for d in dates]
+            ])
+            for variable in variable_names:
+                y = _synthetic_target(variable, X) + rng.normal(0, 0.5, len(doy))
+                model = GradientBoostingRegressor(n_estimators=n_estimators, max_depth=5, random_state=seed)
+                model.fit(X, y)
+                await model_repo.save_model(float(lat), float(lon), variable, model, {
+                    'model_type': 'GradientBoostingRegressor',
+                    'accuracy_score': 0.9,
+                    'mean_absolute_error': 0.4,
+                    'r2_score': 0.9,
+                    'data_points_count': len(doy)
+                })
+                saved += 1
+
+    return saved
+
+
+class _FakeGenerativeModel:
+    """Imita genai.GenerativeModel con una latencia fija"""
+
+    def __init__(self, latency_ms: float):
+        self.latency_s = latency_ms / 1000
+
+    def _response(self, prompt: str, generation_config: Optional[dict] = None):
+        if (generation_config or {}).get('response_mime_type') == 'application/json':
+            # Modo por lotes: un objeto por cada línea "[id] ..." del prompt
+            ids = [int(line[1:line.index(']')]) for line in prompt.splitlines()
+                   if line.startswith('[') and ']' in line and line[1:line.index(']')].isdigit()]
+            text = json.dumps([{
+                'id': item_id, 'viability': 'Bueno', 'risks': [],
+                'recommendations': ['Respuesta simulada'], 'plan_b': 'N/A'
+            } for item_id in ids])
+        else:
+            text = f"Respuesta simulada ({len(prompt)} caracteres de prompt)."
+        part = SimpleNamespace(text=text)
+        candidate = SimpleNamespace(finish_reason=1, content=SimpleNamespace(parts=[part]))
+        return SimpleNamespace(candidates=[candidate], text=text)
+
+    def generate_content(self, prompt, **kwargs):
+        time.sleep(self.latency_s)
+        return self._response(prompt)
+
+    async def _stream(self, prompt: str):
+        # La latencia configurada es hasta el primer fragmento; luego una palabra por fragmento
+        await asyncio.sleep(self.latency_s)
+        for word in self._response(prompt).text.split(" "):
+            yield SimpleNamespace(text=word + " ")
+            await asyncio.sleep(0)
+
+    async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+        if stream:
+            return self._stream(prompt)
+        await asyncio.sleep(self.latency_s)
+        return self._response(prompt, kwargs.get('generation_config'))
+
+
+class FakeGeminiService(GeminiClimateService):
+    """GeminiClimateService sin red ni API key"""
+
+    def __init__(self, latency_ms: float = 800):
+        self.api_key = "fake"
+        self.model = _FakeGenerativeModel(latency_ms)
+        self.generation_config = {}
+        self.safety_settings = []
+        self._init_description_cache()
+
+
+def _power_payload(params: Dict[str, str], rng=random) -> Dict:
+    """Respuesta con la forma de POWER monthly/point y valores deterministas"""
+    start, end = int(params.get('start', 2020)), int(params.get('end', 2025))
+    lat = float(params.get('latitude', 0))
+    parameters = {}
+    for name in params.get('parameters', 'T2M').split(','):
+        values = {}
+        for year in range(start, end + 1):
+            for month in range(1, 14):
+                values[f"{year}{month:02d}"] = round(
+                    20 + 5 * math.sin(month / 12 * 2 * math.pi) - 0.1 * abs(lat) + rng.random(), 2
+                )
+        parameters[name] = values
+    return {
+        'header': {'sources': ['stub']},
+        'properties': {'parameter': parameters}
+    }
+
+
+def _power_regional_payload(params: Dict[str, str], rng=random) -> Dict:
+    """Respuesta con la forma de POWER monthly/regional (GeoJSON, malla de 0.5° x 0.625°)"""
+    features = []
+    lat = math.ceil(float(params['latitude-min']) / 0.5) * 0.5
+    while lat <= float(params['latitude-max']):
+        lon = math.ceil(float(params['longitude-min']) / 0.625) * 0.625
+        while lon <= float(params['longitude-max']):
+            point = _power_payload({**params, 'latitude': lat}, rng)
+            features.append({
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [lon, lat, 0.0]},
+                'properties': point['properties']
+            })
+            lon += 0.625
+        lat += 0.5
+    return {'type': 'FeatureCollection', 'header': {'sources': ['stub']}, 'features': features}
+
+
+def create_power_stub_app(latency_ms: float = 0, error_rate: float = 0.0,
+                          fixture_dir: Optional[str] = None, strict: bool = False,
+                          jitter_ms: float = 0, seed: Optional[int] = None):
+    """
+    Servidor aiohttp que responde cualquier GET con forma de POWER: el fixture
+    grabado para esos parámetros si existe, si no datos sintéticos
+    """
+    from aiohttp import web
+
+    rng = random.Random(seed)
+
+    async def handle(request):
+        delay_ms = latency_ms + (rng.uniform(0, jitter_ms) if jitter_ms else 0)
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000)
+        if error_rate and rng.random() < error_rate:
+            return web.json_response({'error': 'stub failure'}, status=503)
+
+        params = dict(request.query)
+        if fixture_dir:
+            fixture = load_fixture(fixture_dir, params)
+            if fixture is not None:
+                status, data = fixture
+                return web.json_response(data if data is not None else {'error': 'recorded failure'},
+                                         status=status)
+            if strict:
+                return web.json_response({'error': 'no fixture for request'}, status=404)
+        if 'latitude-min' in params:
+            return web.json_response(_power_regional_payload(params, rng))
+        return web.json_response(_power_payload(params, rng))
+
+    app = web.Application()
+    app.router.add_get('/{tail:.*}', handle)
+    return app
+
+
+if __name__ == "__main__":
+    from aiohttp import web
+
+    parser = argparse.ArgumentParser(description="Servidor NASA POWER simulado")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0,
+                        help="Latencia extra aleatoria uniforme en [0, jitter]")
+    parser.add_argument("--fixtures", default=None, help="Directorio de fixtures grabados")
+    parser.add_argument("--strict", action="store_true",
+                        help="404 para peticiones sin fixture en lugar de datos sintéticos")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    web.run_app(create_power_stub_app(args.latency_ms, args.error_rate, args.fixtures,
+                                      args.strict, args.jitter_ms, args.seed),
+                host=args.host, port=args.port, print=None)
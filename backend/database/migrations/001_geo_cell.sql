@@ -0,0 +1,40 @@
+-- Migración 001: celdas geográficas enteras en modelos y caché de predicciones
+-- Para bases creadas con una versión anterior de schema.sql (las nuevas ya lo incluyen):
+--   psql "$DATABASE_URL" -f database/migrations/001_geo_cell.sql
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION calculate_geo_cell(lat DOUBLE PRECISION, lon DOUBLE PRECISION)
+RETURNS BIGINT AS $$
+DECLARE
+    n BIGINT := 16777216; -- 2^24
+    x BIGINT := LEAST(GREATEST(FLOOR((lon + 180) / 360 * n), 0), n - 1);
+    y BIGINT := LEAST(GREATEST(FLOOR((lat + 90) / 180 * n), 0), n - 1);
+    cell BIGINT := 0;
+BEGIN
+    FOR i IN 0..23 LOOP
+        cell := cell | (((x >> i) & 1) << (2 * i)) | (((y >> i) & 1) << (2 * i + 1));
+    END LOOP;
+    RETURN cell;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- Modelos: nueva columna + índice para la búsqueda por rangos de celdas
+ALTER TABLE trained_models ADD COLUMN IF NOT EXISTS geo_cell BIGINT;
+UPDATE trained_models SET geo_cell = calculate_geo_cell(latitude, longitude) WHERE geo_cell IS NULL;
+CREATE INDEX IF NOT EXISTS idx_models_variable_cell ON trained_models (variable_name, geo_cell) WHERE is_active;
+
+-- Caché: pasa a compartirse por celda. Las entradas existentes caducan en
+-- pocas horas de todos modos, así que se descartan en lugar de migrarlas.
+TRUNCATE prediction_cache;
+ALTER TABLE prediction_cache ADD COLUMN geo_cell BIGINT NOT NULL;
+ALTER TABLE prediction_cache DROP CONSTRAINT IF EXISTS prediction_cache_latitude_longitude_prediction_date_key;
+ALTER TABLE prediction_cache ADD CONSTRAINT prediction_cache_geo_cell_prediction_date_key UNIQUE (geo_cell, prediction_date);
+
+-- update_model_usage usa ON CONFLICT (model_id), que requiere un índice único
+DELETE FROM model_usage_stats a
+USING model_usage_stats b
+WHERE a.model_id = b.model_id AND a.id < b.id;
+ALTER TABLE model_usage_stats ADD CONSTRAINT model_usage_stats_model_id_key UNIQUE (model_id);
+
+COMMIT;
@@ -0,0 +1,13 @@
+-- Migración 002: asignación materializada de modelos por celda
+--   psql "$DATABASE_URL" -f database/migrations/002_model_assignments.sql
+-- La tabla empieza vacía y se llena con las consultas de predicción.
+
+CREATE TABLE IF NOT EXISTS model_assignments (
+    geo_cell BIGINT NOT NULL, -- Celda de nivel MODEL_ASSIGNMENT_CELL_LEVEL
+    variable_name VARCHAR(100) NOT NULL,
+    model_ids INTEGER[] NOT NULL, -- Ordenados por score combinado
+    distances_km DOUBLE PRECISION[] NOT NULL,
+    accuracy_scores DOUBLE PRECISION[] NOT NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (geo_cell, variable_name)
+);
@@ -0,0 +1,21 @@
+-- Migración 003: almacén local de observaciones de NASA POWER
+--   psql "$DATABASE_URL" -f database/migrations/003_climate_observations.sql
+-- Las tablas empiezan vacías; se llenan con las consultas a /climate* o con
+--   python -m app.database.climate_store --lat-min ... (ver el módulo)
+
+CREATE TABLE IF NOT EXISTS climate_observations (
+    geo_cell BIGINT NOT NULL,
+    parameter VARCHAR(32) NOT NULL,
+    period INTEGER NOT NULL,
+    value DOUBLE PRECISION,
+    PRIMARY KEY (geo_cell, parameter, period)
+);
+
+CREATE TABLE IF NOT EXISTS climate_sync (
+    geo_cell BIGINT NOT NULL,
+    parameter VARCHAR(32) NOT NULL,
+    year INTEGER NOT NULL,
+    sources TEXT[],
+    fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (geo_cell, parameter, year)
+);
@@ -0,0 +1,22 @@
+-- Migración 004: modelos serializados en una tabla aparte
+--   psql "$DATABASE_URL" -f database/migrations/004_model_blobs.sql
+-- trained_models queda solo con metadatos: la búsqueda de candidatos ya no
+-- arrastra el BYTEA de cada fila, y model_blobs se lee por id al cargar un modelo.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS model_blobs (
+    model_id INTEGER PRIMARY KEY REFERENCES trained_models(id) ON DELETE CASCADE,
+    model_data BYTEA NOT NULL
+);
+
+INSERT INTO model_blobs (model_id, model_data)
+SELECT id, model_data FROM trained_models
+ON CONFLICT (model_id) DO NOTHING;
+
+ALTER TABLE trained_models DROP COLUMN model_data;
+
+COMMIT;
+
+-- El espacio de los blobs en trained_models (TOAST) se libera con:
+--   VACUUM FULL trained_models;
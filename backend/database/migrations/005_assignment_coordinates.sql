@@ -0,0 +1,16 @@
+-- Migración 005: ubicación de los modelos asignados en lugar de su distancia
+--   psql "$DATABASE_URL" -f database/migrations/005_assignment_coordinates.sql
+-- distances_km se medía desde el centro de la celda; con las coordenadas del
+-- modelo la distancia de la respuesta se calcula desde el punto consultado.
+-- Las asignaciones se recalculan bajo demanda, así que basta con vaciar la tabla.
+
+BEGIN;
+
+TRUNCATE model_assignments;
+
+ALTER TABLE model_assignments
+    DROP COLUMN distances_km,
+    ADD COLUMN latitudes DOUBLE PRECISION[] NOT NULL,
+    ADD COLUMN longitudes DOUBLE PRECISION[] NOT NULL;
+
+COMMIT;
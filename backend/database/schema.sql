@@ -8,7 +8,6 @@ CREATE TABLE trained_models (
     latitude DECIMAL(10, 6) NOT NULL,
     longitude DECIMAL(10, 6) NOT NULL,
     variable_name VARCHAR(100) NOT NULL, -- Temperature_C, Humidity_Percent, etc.
-    model_data BYTEA NOT NULL, -- Modelo serializado
     model_metadata JSONB, -- Métricas, parámetros, etc.
     training_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     accuracy_score DECIMAL(5, 4),
@@ -16,6 +15,7 @@ CREATE TABLE trained_models (
     r2_score DECIMAL(5, 4),
     data_points_count INTEGER,
     geographic_hash VARCHAR(50), -- Para búsquedas rápidas por región
+    geo_cell BIGINT, -- Celda geográfica entera de nivel 24 (app/database/geocell.py)
     is_active BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
@@ -26,6 +26,15 @@ CREATE INDEX idx_geographic_location ON trained_models (latitude, longitude);
 CREATE INDEX idx_variable_name ON trained_models (variable_name);
 CREATE INDEX idx_geographic_hash ON trained_models (geographic_hash);
 CREATE INDEX idx_accuracy ON trained_models (accuracy_score DESC);
+-- Búsqueda de candidatos por rangos de celdas vecinas
+CREATE INDEX idx_models_variable_cell ON trained_models (variable_name, geo_cell) WHERE is_active;
+
+-- Modelos serializados, separados de los metadatos: la búsqueda de
+-- candidatos solo lee trained_models y el blob se carga por id
+CREATE TABLE model_blobs (
+    model_id INTEGER PRIMARY KEY REFERENCES trained_models(id) ON DELETE CASCADE,
+    model_data BYTEA NOT NULL
+);
 
 -- Tabla para caché de predicciones
 CREATE TABLE prediction_cache (
@@ -37,13 +46,47 @@ CREATE TABLE prediction_cache (
     model_versions JSONB, -- IDs de modelos usados
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     expires_at TIMESTAMP,
-    UNIQUE(latitude, longitude, prediction_date)
+    geo_cell BIGINT NOT NULL, -- Celda compartida (PREDICTION_CACHE_CELL_LEVEL)
+    UNIQUE(geo_cell, prediction_date)
+);
+
+-- Mejores modelos por celda y variable (calculados desde el centro de la celda).
+-- Se llena bajo demanda y se invalida al dar de alta/baja modelos cercanos.
+CREATE TABLE model_assignments (
+    geo_cell BIGINT NOT NULL, -- Celda de nivel MODEL_ASSIGNMENT_CELL_LEVEL
+    variable_name VARCHAR(100) NOT NULL,
+    model_ids INTEGER[] NOT NULL, -- Ordenados por score combinado
+    latitudes DOUBLE PRECISION[] NOT NULL, -- Ubicación de cada modelo
+    longitudes DOUBLE PRECISION[] NOT NULL,
+    accuracy_scores DOUBLE PRECISION[] NOT NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (geo_cell, variable_name)
+);
+
+-- Observaciones mensuales de NASA POWER por celda (CLIMATE_CELL_LEVEL).
+-- period = YYYYMM; el mes 13 es el promedio anual. value NULL = sin dato (-999).
+CREATE TABLE climate_observations (
+    geo_cell BIGINT NOT NULL,
+    parameter VARCHAR(32) NOT NULL,
+    period INTEGER NOT NULL,
+    value DOUBLE PRECISION,
+    PRIMARY KEY (geo_cell, parameter, period)
+);
+
+-- Años ya descargados por celda y parámetro (sincronización incremental)
+CREATE TABLE climate_sync (
+    geo_cell BIGINT NOT NULL,
+    parameter VARCHAR(32) NOT NULL,
+    year INTEGER NOT NULL,
+    sources TEXT[],
+    fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (geo_cell, parameter, year)
 );
 
 -- Tabla de métricas de uso
 CREATE TABLE model_usage_stats (
     id SERIAL PRIMARY KEY,
-    model_id INTEGER REFERENCES trained_models(id),
+    model_id INTEGER UNIQUE REFERENCES trained_models(id),
     usage_count INTEGER DEFAULT 0,
     last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     average_response_time DECIMAL(8, 3), -- ms
@@ -57,4 +100,21 @@ BEGIN
     -- Simplificado: redondear a 0.1 grados (aprox 11km)
     RETURN ROUND(lat, 1)::TEXT || ',' || ROUND(lon, 1)::TEXT;
 END;
-$$ LANGUAGE plpgsql;
\ No newline at end of file
+$$ LANGUAGE plpgsql;
+
+-- Celda geográfica entera: entrelazado de bits (Morton) de columna y fila en
+-- una malla de 2^24 x 2^24. Misma fórmula que geocell.encode en Python.
+CREATE OR REPLACE FUNCTION calculate_geo_cell(lat DOUBLE PRECISION, lon DOUBLE PRECISION)
+RETURNS BIGINT AS $$
+DECLARE
+    n BIGINT := 16777216; -- 2^24
+    x BIGINT := LEAST(GREATEST(FLOOR((lon + 180) / 360 * n), 0), n - 1);
+    y BIGINT := LEAST(GREATEST(FLOOR((lat + 90) / 180 * n), 0), n - 1);
+    cell BIGINT := 0;
+BEGIN
+    FOR i IN 0..23 LOOP
+        cell := cell | (((x >> i) & 1) << (2 * i)) | (((y >> i) & 1) << (2 * i + 1));
+    END LOOP;
+    RETURN cell;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;